@@ -0,0 +1,470 @@
+#!/usr/bin/env python3
+# benchmarks/e2e_benchmark.py
+# วัดประสิทธิภาพ lambda_handler ทั้งระบบโดยใช้ HTTP stand-in ในเครื่องแทน Google Sheets API (values),
+# SABAI notification API และ Discord webhook
+#
+# ตัวอย่างการใช้งาน:
+#   python benchmarks/e2e_benchmark.py
+#   python benchmarks/e2e_benchmark.py --rows 100 1000 10000 50000 --json e2e.json
+#   python benchmarks/e2e_benchmark.py --sabai-latency-ms 80 --sabai-error-rate 0.05 --sabai-429-rate 0.1
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import tempfile
+import subprocess
+import contextlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SPREADSHEET_ID = "benchmark-spreadsheet"
+API_KEY = "benchmark"
+
+A1_RANGE = re.compile(r"^([A-Z]*)(\d*)(?::([A-Z]*)(\d*))?$")
+
+def column_number(letters):
+    """แปลงตัวอักษรคอลัมน์ (A, Z, AA) เป็น index เริ่มจาก 0"""
+    number = 0
+    for char in letters:
+        number = number * 26 + ord(char) - 64
+    return number - 1
+
+def parse_a1(a1_range):
+    """
+    แปลง range แบบ A1 (เช่น 'ชีต1!A2:H', 'ชีต1!1:1', 'ชีต1') เป็นขอบเขตของ grid
+
+    Returns:
+        tuple: (first_row, last_row, first_col, last_col) เริ่มจาก 0 โดย None หมายถึงไม่จำกัด
+    """
+    cells = a1_range.split("!", 1)[1] if "!" in a1_range else ""
+    if not cells:
+        return 0, None, 0, None
+    match = A1_RANGE.match(cells)
+    if not match:
+        raise ValueError(f"range ไม่ถูกต้อง: {a1_range}")
+    col1, row1, col2, row2 = match.groups()
+    if col2 is None and row2 is None:
+        # cell เดียว เช่น A2
+        col2, row2 = col1, row1
+    first_row = int(row1) - 1 if row1 else 0
+    last_row = int(row2) - 1 if row2 else None
+    first_col = column_number(col1) if col1 else 0
+    last_col = column_number(col2) if col2 else None
+    return first_row, last_row, first_col, last_col
+
+class StandIn:
+    """พฤติกรรมของ stand-in หนึ่งตัว: latency, อัตรา error และอัตรา 429 พร้อมตัวนับ request"""
+
+    def __init__(self, name, latency_ms=0.0, error_rate=0.0, rate_limit_rate=0.0, retry_after=0.1, seed=0):
+        self.name = name
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.counts = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self.counts.clear()
+
+    def begin(self, operation):
+        """
+        นับ request, หน่วงเวลาตาม latency แล้วสุ่มผลลัพธ์
+
+        Returns:
+            str: 'ok', 'error' หรือ 'rate_limited'
+        """
+        with self._lock:
+            self.counts[operation] += 1
+            roll = self._random.random()
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        if roll < self.rate_limit_rate:
+            outcome = 'rate_limited'
+        elif roll < self.rate_limit_rate + self.error_rate:
+            outcome = 'error'
+        else:
+            outcome = 'ok'
+        with self._lock:
+            self.counts[f"{operation}:{outcome}"] += 1
+        return outcome
+
+    def describe(self):
+        return {
+            "latency_ms": self.latency_ms,
+            "error_rate": self.error_rate,
+            "rate_limit_rate": self.rate_limit_rate,
+            "retry_after": self.retry_after,
+        }
+
+class SheetGrid:
+    """ข้อมูลของชีตใน memory ที่ stand-in ของ Sheets API อ่านและเขียน"""
+
+    def __init__(self, rows=None):
+        self.rows = [list(row) for row in rows or []]
+        self._lock = threading.Lock()
+
+    def read(self, a1_range, major_dimension="ROWS"):
+        first_row, last_row, first_col, last_col = parse_a1(a1_range)
+        with self._lock:
+            selected = self.rows[first_row:None if last_row is None else last_row + 1]
+            values = [row[first_col:None if last_col is None else last_col + 1] for row in selected]
+        # Sheets API ตัดแถวว่างท้าย range ออก
+        while values and not any(values[-1]):
+            values.pop()
+        if major_dimension == "COLUMNS":
+            width = max((len(row) for row in values), default=0)
+            values = [[row[col] if col < len(row) else "" for row in values] for col in range(width)]
+            for column in values:
+                while column and column[-1] == "":
+                    column.pop()
+        return values
+
+    def row_count(self):
+        """จำนวนแถวของ grid (ชีตใหม่ของ Google Sheets มีอย่างน้อย 1000 แถว)"""
+        with self._lock:
+            return max(len(self.rows), 1000)
+
+    def write(self, a1_range, values):
+        first_row, _, first_col, _ = parse_a1(a1_range)
+        cells = 0
+        with self._lock:
+            for offset, new_values in enumerate(values):
+                row_index = first_row + offset
+                while len(self.rows) <= row_index:
+                    self.rows.append([])
+                row = self.rows[row_index]
+                if len(row) < first_col + len(new_values):
+                    row.extend([""] * (first_col + len(new_values) - len(row)))
+                row[first_col:first_col + len(new_values)] = new_values
+                cells += len(new_values)
+        return cells
+
+class StandInServer:
+    """HTTP server เดียวที่จำลอง Sheets v4 values API (/v4/...), SABAI (/sabai) และ Discord (/discord)"""
+
+    def __init__(self, sheets, sabai, discord):
+        self.sheets = sheets
+        self.sabai = sabai
+        self.discord = discord
+        self.grids = {}
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.httpd.server_port}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def reset(self, sheets):
+        """เริ่ม scenario ใหม่ด้วยข้อมูล {spreadsheet_id: rows} และล้างตัวนับ request"""
+        self.grids = {spreadsheet_id: SheetGrid(rows) for spreadsheet_id, rows in sheets.items()}
+        for stand_in in (self.sheets, self.sabai, self.discord):
+            stand_in.reset()
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _body(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                data = self.rfile.read(length) if length else b""
+                content_type = self.headers.get("Content-Type", "")
+                # googleapiclient ส่ง GET ที่ URL ยาวเกินเป็น POST แบบ form พร้อม X-HTTP-Method-Override: GET
+                if data and content_type.startswith("application/x-www-form-urlencoded"):
+                    return parse_qs(data.decode("utf-8"))
+                # multipart (เช่น Discord ที่มีไฟล์แนบ) ไม่ต้องแปลง body
+                if not data or not content_type.startswith("application/json"):
+                    return None
+                return json.loads(data)
+
+            def _reply(self, status, payload=None, headers=None):
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8") if payload is not None else b""
+                self.send_response(status)
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                if payload is not None:
+                    self.send_header("Content-Type", "application/json; charset=UTF-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _failure(self, stand_in, outcome):
+                """ตอบ error ตาม outcome ที่สุ่มได้ คืน True ถ้าตอบไปแล้ว"""
+                if outcome == "rate_limited":
+                    retry_after = stand_in.retry_after
+                    self._reply(429, {
+                        "error": {"code": 429, "message": "rate limited"},
+                        "message": "You are being rate limited.",
+                        "retry_after": retry_after,
+                    }, {"Retry-After": f"{retry_after:g}"})
+                    return True
+                if outcome == "error":
+                    self._reply(500, {"error": {"code": 500, "message": "stand-in error"}, "message": "stand-in error"})
+                    return True
+                return False
+
+            def do_GET(self):
+                self._dispatch("GET")
+
+            def do_PUT(self):
+                self._dispatch("PUT")
+
+            def do_POST(self):
+                self._dispatch("POST")
+
+            def _dispatch(self, method):
+                url = urlparse(self.path)
+                body = self._body() if method in ("PUT", "POST") else None
+                if url.path.startswith("/v4/spreadsheets/"):
+                    self._sheets(method, url, body)
+                elif url.path == "/sabai":
+                    outcome = server.sabai.begin("notify")
+                    if not self._failure(server.sabai, outcome):
+                        self._reply(200, {"success": True, "unit_id": (body or {}).get("unit_id")})
+                elif url.path == "/discord":
+                    outcome = server.discord.begin("webhook")
+                    if not self._failure(server.discord, outcome):
+                        self._reply(204)
+                else:
+                    self._reply(404, {"error": {"code": 404, "message": "not found"}})
+
+            def _sheets(self, method, url, body):
+                path = unquote(url.path.split("/values", 1)[1]) if "/values" in url.path else None
+                query = parse_qs(url.query)
+                if method == "POST" and self.headers.get("X-HTTP-Method-Override", "").upper() == "GET":
+                    method = "GET"
+                    query.update(body or {})
+                if method == "GET" and path is None:
+                    operation = "metadata"
+                elif path is None:
+                    self._reply(404, {"error": {"code": 404, "message": "not found"}})
+                    return
+                elif method == "GET" and path == ":batchGet":
+                    operation = "batchGet"
+                elif method == "GET":
+                    operation = "get"
+                elif method == "PUT":
+                    operation = "update"
+                elif path == ":batchUpdate":
+                    operation = "batchUpdate"
+                else:
+                    self._reply(404, {"error": {"code": 404, "message": "not found"}})
+                    return
+
+                outcome = server.sheets.begin(operation)
+                if self._failure(server.sheets, outcome):
+                    return
+
+                grid = server.grids.get(unquote(url.path.split("/")[3]))
+                if grid is None:
+                    self._reply(404, {"error": {"code": 404, "message": "Requested entity was not found."}})
+                    return
+                if operation == "metadata":
+                    self._reply(200, {"sheets": [{"properties": {"gridProperties": {"rowCount": grid.row_count()}}}]})
+                elif operation == "get":
+                    a1_range = path.lstrip("/")
+                    self._reply(200, {"range": a1_range, "majorDimension": "ROWS", "values": grid.read(a1_range)})
+                elif operation == "batchGet":
+                    major_dimension = query.get("majorDimension", ["ROWS"])[0]
+                    self._reply(200, {
+                        "spreadsheetId": SPREADSHEET_ID,
+                        "valueRanges": [
+                            {"range": a1_range, "majorDimension": major_dimension, "values": grid.read(a1_range, major_dimension)}
+                            for a1_range in query.get("ranges", [])
+                        ]
+                    })
+                elif operation == "update":
+                    a1_range = path.lstrip("/")
+                    cells = grid.write(a1_range, body["values"])
+                    self._reply(200, {"updatedRange": a1_range, "updatedCells": cells})
+                else:
+                    responses = []
+                    total = 0
+                    for entry in body["data"]:
+                        cells = grid.write(entry["range"], entry["values"])
+                        total += cells
+                        responses.append({"updatedRange": entry["range"], "updatedCells": cells})
+                    self._reply(200, {"totalUpdatedCells": total, "responses": responses})
+
+        return Handler
+
+def count_outcomes(rows):
+    """นับแถวที่ส่งโนติฯ แล้ว และแถวที่ยังมี Error ค้างอยู่ จากข้อมูลในชีต"""
+    from config import IS_SEND_NOTI, ERROR_RES
+    headers = rows[0]
+    send_index = headers.index(IS_SEND_NOTI)
+    error_index = headers.index(ERROR_RES)
+    sent = failed = 0
+    for row in rows[1:]:
+        if len(row) > send_index and row[send_index] == "Done":
+            sent += 1
+        elif len(row) > error_index and row[error_index]:
+            failed += 1
+    return sent, failed
+
+def configure_environment(base_url):
+    """ตั้งค่า environment ให้ชี้ไปที่ stand-in (ต้องเรียกก่อน import module ของโปรเจกต์)"""
+    overrides = {
+        "SHEETS_API_ENDPOINT": f"{base_url}/",
+        "SHEETS_ANONYMOUS_CREDENTIALS": "true",
+        "SPREADSHEET_ID": SPREADSHEET_ID,
+        "SABAI_API_URL": f"{base_url}/sabai",
+        "SABAI_API_TOKEN": "benchmark-token",
+        "DISCORD_WEBHOOK_URL": f"{base_url}/discord",
+        "X_API_KEY": API_KEY,
+        "INCREMENTAL_SCAN": "false",
+        "IDEMPOTENCY_LEDGER": "false",
+    }
+    os.environ.update(overrides)
+    # ค่าที่ปรับได้จาก environment ของผู้ใช้ (ค่าเริ่มต้นไม่จำกัด rate เพื่อวัด throughput ของระบบเอง)
+    os.environ.setdefault("NOTIFY_RATE_PER_SECOND", "1000")
+    os.environ.setdefault("NOTIFY_BURST", "50")
+    os.environ.setdefault("SABAI_RETRY_BASE_DELAY", "0.05")
+    # outbox แยกต่อการรัน benchmark (ไม่ปนกับคิวของการรันจริงในเครื่อง)
+    os.environ.setdefault("OUTBOX_PATH", os.path.join(tempfile.gettempdir(), f"sabai_e2e_outbox_{os.getpid()}.sqlite3"))
+    sys.path.insert(0, PROJECT_DIR)
+
+def git_commit():
+    proc = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_DIR, capture_output=True, text=True)
+    return proc.stdout.strip() if proc.returncode == 0 else None
+
+def run_scenario(server, row_count, pending_ratio, seed, show_logs=False, target_count=1):
+    """
+    รัน lambda_handler 1 ครั้งกับชีตรวม row_count แถวแล้วคืนผลการวัด
+    ถ้า target_count > 1 จะแบ่งแถวเท่าๆ กันเป็นหลาย spreadsheet และส่งเป็น event["targets"]
+    """
+    import notification
+    from lambda_function import lambda_handler
+    from resilience import CircuitBreaker
+    from config import SABAI_BREAKER_THRESHOLD, SABAI_BREAKER_RESET_SECONDS
+    from synthetic_sheet import generate_values
+
+    sheets = {}
+    pending = sent_before = 0
+    for i in range(target_count):
+        spreadsheet_id = SPREADSHEET_ID if target_count == 1 else f"{SPREADSHEET_ID}-{i + 1}"
+        rows, statuses = generate_values(row_count // target_count, pending_ratio, seed=seed + i)
+        pending += statuses["pending"] + statuses["error"]
+        sent_before += count_outcomes(rows)[0]
+        sheets[spreadsheet_id] = rows
+    server.reset(sheets)
+    # เริ่มแต่ละ scenario ด้วย circuit breaker ใหม่ เพื่อไม่ให้ผลของ scenario ก่อนหน้าติดมา
+    notification.sabai_breaker = CircuitBreaker(SABAI_BREAKER_THRESHOLD, SABAI_BREAKER_RESET_SECONDS)
+
+    event = {"headers": {"x-api-key": API_KEY, "metrics": "true"}}
+    if target_count > 1:
+        event["targets"] = [{"spreadsheet_id": spreadsheet_id} for spreadsheet_id in sheets]
+    output = contextlib.nullcontext() if show_logs else contextlib.redirect_stdout(open(os.devnull, "w"))
+    started_at = time.perf_counter()
+    with output:
+        response = lambda_handler(event, None)
+    wall_seconds = time.perf_counter() - started_at
+
+    body = json.loads(response["body"])
+    sent = failed = 0
+    for grid in server.grids.values():
+        grid_sent, grid_failed = count_outcomes(grid.rows)
+        sent += grid_sent
+        failed += grid_failed
+    return {
+        "rows": row_count,
+        "targets": target_count,
+        "pending": pending,
+        "status_code": response["statusCode"],
+        "wall_seconds": round(wall_seconds, 4),
+        "rows_per_second": round(row_count / wall_seconds, 1) if wall_seconds else None,
+        "sent": sent - sent_before,
+        "failed": failed,
+        "requests": {
+            "sheets": dict(server.sheets.counts),
+            "sabai": dict(server.sabai.counts),
+            "discord": dict(server.discord.counts),
+        },
+        "stages": body.get("metrics", {}),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="วัดประสิทธิภาพ lambda_handler กับ stand-in ของ Sheets, SABAI และ Discord")
+    parser.add_argument("--rows", type=int, nargs="+", default=[100, 1000, 10000], help="จำนวนแถวของแต่ละ scenario")
+    parser.add_argument("--pending-ratio", type=float, default=0.1, help="สัดส่วนแถวที่รอส่งโนติฯ")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--targets", type=int, default=1, help="แบ่งแถวเป็นหลาย spreadsheet แล้วประมวลผลแบบ fan-out")
+    parser.add_argument("--json", help="บันทึกผลเป็นไฟล์ JSON")
+    parser.add_argument("--show-logs", action="store_true", help="แสดง log ของ lambda_handler")
+    for name, latency in (("sheets", 20.0), ("sabai", 30.0), ("discord", 10.0)):
+        parser.add_argument(f"--{name}-latency-ms", type=float, default=latency)
+        parser.add_argument(f"--{name}-error-rate", type=float, default=0.0, help="สัดส่วน request ที่ตอบ 500")
+        parser.add_argument(f"--{name}-429-rate", type=float, default=0.0, help="สัดส่วน request ที่ตอบ 429")
+    parser.add_argument("--retry-after", type=float, default=0.1, help="ค่า Retry-After (วินาที) ของ response 429")
+    args = parser.parse_args()
+
+    stand_ins = {
+        name: StandIn(
+            name,
+            latency_ms=getattr(args, f"{name}_latency_ms"),
+            error_rate=getattr(args, f"{name}_error_rate"),
+            rate_limit_rate=getattr(args, f"{name}_429_rate"),
+            retry_after=args.retry_after,
+            seed=args.seed,
+        )
+        for name in ("sheets", "sabai", "discord")
+    }
+    server = StandInServer(stand_ins["sheets"], stand_ins["sabai"], stand_ins["discord"]).start()
+    configure_environment(server.base_url)
+
+    results = []
+    try:
+        print(f"{'rows':>8} {'pending':>8} {'status':>6} {'wall (s)':>10} {'rows/s':>10} {'sheets':>7} {'sabai':>7} {'discord':>7}")
+        print("-" * 72)
+        for row_count in args.rows:
+            result = run_scenario(server, row_count, args.pending_ratio, args.seed, args.show_logs, args.targets)
+            results.append(result)
+            requests_total = {
+                name: sum(count for key, count in counts.items() if ":" not in key)
+                for name, counts in result["requests"].items()
+            }
+            print(
+                f"{result['rows']:>8} {result['pending']:>8} {result['status_code']:>6} "
+                f"{result['wall_seconds']:>10.3f} {result['rows_per_second']:>10.1f} "
+                f"{requests_total['sheets']:>7} {requests_total['sabai']:>7} {requests_total['discord']:>7}"
+            )
+    finally:
+        server.stop()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump({
+                "python": sys.version.split()[0],
+                "commit": git_commit(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "pending_ratio": args.pending_ratio,
+                "stand_ins": {name: stand_in.describe() for name, stand_in in stand_ins.items()},
+                "scenarios": results,
+            }, file, ensure_ascii=False, indent=2)
+    return 0 if all(result["status_code"] == 200 for result in results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
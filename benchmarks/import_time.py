@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# benchmarks/import_time.py
+# วัดเวลา import ของแต่ละ module ในโปรเจกต์ (ใช้ติดตาม cold start ของ Lambda)
+#
+# ตัวอย่างการใช้งาน:
+#   python benchmarks/import_time.py
+#   python benchmarks/import_time.py --runs 5 --json import_time.json --budget-ms 300
+
+import os
+import re
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = [
+    "config",
+    "logger",
+    "http_client",
+    "notification",
+    "sheets_service",
+    "data_processor",
+    "lambda_function",
+]
+
+# module ภายนอกที่ไม่ควรถูกโหลดตอน import lambda_function
+HEAVY_MODULES = ["boto3", "googleapiclient.discovery", "pytz"]
+
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+def measure_module(module):
+    """
+    import module ใน interpreter ใหม่ด้วย -X importtime
+
+    Returns:
+        dict: เวลา cumulative ของ module (ms) และ module ภายนอกที่หนักที่ถูกโหลดไปด้วย
+    """
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PROJECT_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} ไม่สำเร็จ:\n{proc.stderr[-2000:]}")
+
+    cumulative_us = {}
+    for line in proc.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            cumulative_us[match.group(4)] = int(match.group(2))
+
+    return {
+        "cumulative_ms": cumulative_us.get(module, 0) / 1000,
+        "heavy_imports": [name for name in HEAVY_MODULES if name in cumulative_us],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="วัดเวลา import ของแต่ละ module")
+    parser.add_argument("--runs", type=int, default=3, help="จำนวนรอบที่วัดต่อ module (ใช้ค่า median)")
+    parser.add_argument("--json", help="บันทึกผลเป็นไฟล์ JSON")
+    parser.add_argument("--budget-ms", type=float, help="ถ้า lambda_function ใช้เวลาเกินค่านี้จะจบด้วย exit code 1")
+    args = parser.parse_args()
+
+    results = {}
+    for module in MODULES:
+        runs = [measure_module(module) for _ in range(max(1, args.runs))]
+        results[module] = {
+            "median_ms": round(statistics.median(run["cumulative_ms"] for run in runs), 2),
+            "heavy_imports": runs[-1]["heavy_imports"],
+        }
+
+    print(f"{'module':<20} {'median (ms)':>12}  heavy imports")
+    print("-" * 60)
+    for module, result in results.items():
+        heavy = ", ".join(result["heavy_imports"]) or "-"
+        print(f"{module:<20} {result['median_ms']:>12.2f}  {heavy}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump({"python": sys.version.split()[0], "modules": results}, file, indent=2)
+
+    if args.budget_ms is not None and results["lambda_function"]["median_ms"] > args.budget_ms:
+        print(f"❌ lambda_function import ใช้เวลาเกิน {args.budget_ms} ms")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# benchmarks/microbench.py
+# Microbenchmark ของฟังก์ชันประมวลผลข้อมูลใน data_processor / row_schema โดยไม่เรียกเครือข่าย
+#
+# ตัวอย่างการใช้งาน:
+#   python benchmarks/microbench.py                      # วัดแล้วเทียบกับ baseline (ถ้ามี)
+#   python benchmarks/microbench.py --save-baseline      # บันทึกผลเป็น baseline ใหม่
+#   python benchmarks/microbench.py --rows 200000 --threshold 0.3 --json result.json
+#
+# ผลจะเทียบกับ benchmarks/microbench_baseline.json ถ้า memory สูงสุด (tracemalloc ซึ่งให้ผลเท่าเดิมทุกครั้ง)
+# แย่ลงเกิน threshold จะจบด้วย exit code 1
+# เวลา (ค่าต่ำสุดของแต่ละรอบ) แสดงเป็นคำเตือนเท่านั้น เพราะบนเครื่องที่ใช้ร่วมกันผันผวนเกิน threshold ได้เองระหว่างการรัน
+# ใช้ --gate-timing เพื่อนับเวลาเป็น regression ด้วยเมื่อวัดบนเครื่องที่ไม่มีงานอื่นรบกวน
+# baseline ขึ้นกับเครื่องและเวอร์ชัน Python ที่วัด ควรสร้างใหม่ด้วย --save-baseline เมื่อเปลี่ยนเครื่อง
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import tracemalloc
+import contextlib
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, "microbench_baseline.json")
+
+# ไม่จำกัด rate และไม่ใช้ ledger ระหว่าง benchmark (ต้องตั้งก่อน import config)
+os.environ.setdefault("NOTIFY_RATE_PER_SECOND", "1000000")
+os.environ.setdefault("NOTIFY_BURST", "1000000")
+os.environ["IDEMPOTENCY_LEDGER"] = "false"
+os.environ["METRICS_ENABLED"] = "false"
+
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+import data_processor
+from logger import Logger
+from row_schema import ColumnSchema, find_column_indices
+from synthetic_sheet import SAMPLE_FAILED_RESULTS, generate_values
+
+class OfflineWriter:
+    """SheetBatchWriter ที่เก็บการเปลี่ยนแปลงไว้ใน memory แทนการเรียก Sheets API"""
+
+    max_wait_seconds = 10
+
+    def __init__(self, **kwargs):
+        self.rows = {}
+
+    def add(self, row_num, changes):
+        self.rows[row_num] = changes
+        return []
+
+    def flush(self):
+        return []
+
+    def flush_if_due(self):
+        return []
+
+def offline_send(row, indices, *args):
+    """send_notification ที่สำเร็จเสมอโดยไม่เรียก SABAI API"""
+    return {'success': True, 'status_code': 200}
+
+def bench_find_column_indices(values):
+    headers = values[0]
+    return lambda: find_column_indices(headers)
+
+def bench_compile_schema(values):
+    # สร้าง ColumnSchema ตรงๆ เพื่อวัดโดยไม่ผ่าน lru_cache
+    headers = values[0]
+    return lambda: ColumnSchema(headers)
+
+def bench_filter_rows(values):
+    schema = ColumnSchema(values[0])
+
+    def run():
+        scan_info = {'first_unfinished_row': None, 'last_row': None, 'candidates': 0}
+        rows = enumerate(values[1:], start=2)
+        for _ in data_processor.iter_rows_to_update(rows, schema, Logger(), scan_info):
+            pass
+    return run
+
+def bench_parse_error_message(values):
+    results = SAMPLE_FAILED_RESULTS * 200
+
+    def run():
+        for result in results:
+            data_processor.parse_error_message(result)
+    return run
+
+def bench_process_sheet_data(values):
+    def run():
+        data_processor.process_sheet_data(values, Logger(), run_state={})
+    return run
+
+BENCHMARKS = {
+    "find_column_indices": bench_find_column_indices,
+    "compile_schema": bench_compile_schema,
+    "filter_rows": bench_filter_rows,
+    "parse_error_message": bench_parse_error_message,
+    "process_sheet_data_offline": bench_process_sheet_data,
+}
+
+def measure(run, repeat, min_time=0.05):
+    """
+    วัดเวลาต่อการเรียก 1 ครั้ง (ms) โดยเรียกซ้ำจนใช้เวลาอย่างน้อย min_time ต่อรอบ แล้วใช้ค่า median
+    และวัด memory สูงสุดที่จองระหว่างเรียก 1 ครั้งด้วย tracemalloc
+
+    Returns:
+        dict: {'median_ms', 'min_ms', 'peak_kib'}
+    """
+    loops = 1
+    while True:
+        started_at = time.perf_counter()
+        for _ in range(loops):
+            run()
+        elapsed = time.perf_counter() - started_at
+        if elapsed >= min_time or loops >= 1_000_000:
+            break
+        loops *= 10
+
+    timings = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        for _ in range(loops):
+            run()
+        timings.append((time.perf_counter() - started_at) * 1000 / loops)
+
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "median_ms": round(statistics.median(timings), 4),
+        "min_ms": round(min(timings), 4),
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+# ค่าที่ใช้ตัดสิน regression และค่าที่ผันผวนตามภาระของเครื่อง (แสดงเป็นคำเตือน)
+MEMORY_METRICS = (("peak_kib", "memory"),)
+TIMING_METRICS = (("min_ms", "เวลา"),)
+
+def compare(results, baseline, threshold, metrics=MEMORY_METRICS):
+    """
+    เทียบผลกับ baseline
+
+    Args:
+        metrics (tuple): (key, ชื่อที่แสดง) ของค่าที่นำมาเทียบ
+
+    Returns:
+        list: ข้อความของ benchmark ที่แย่ลงเกิน threshold
+    """
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        for key, label in metrics:
+            if previous.get(key) and result[key] > previous[key] * (1 + threshold):
+                change = result[key] / previous[key] - 1
+                regressions.append(f"{name}: {label} {previous[key]} -> {result[key]} (+{change:.0%})")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmark ของฟังก์ชันประมวลผลข้อมูล")
+    parser.add_argument("--rows", type=int, default=20000, help="จำนวนแถวของชีตสังเคราะห์")
+    parser.add_argument("--pending-ratio", type=float, default=0.05)
+    parser.add_argument("--error-ratio", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5, help="จำนวนรอบที่วัด (ใช้ค่า median)")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="วัดเฉพาะ benchmark ที่เลือก")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="ไฟล์ baseline")
+    parser.add_argument("--save-baseline", action="store_true", help="บันทึกผลครั้งนี้เป็น baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="สัดส่วนที่ยอมให้แย่ลงได้ก่อนนับเป็น regression")
+    parser.add_argument("--gate-timing", action="store_true", help="นับเวลาที่แย่ลงเกิน threshold เป็น regression ด้วย")
+    parser.add_argument("--json", help="บันทึกผลเป็นไฟล์ JSON")
+    args = parser.parse_args()
+
+    values, statuses = generate_values(args.rows, args.pending_ratio, args.error_ratio, seed=args.seed)
+    data_processor.send_notification = offline_send
+    data_processor.SheetBatchWriter = OfflineWriter
+
+    results = {}
+    # ปิด output ของ logger และ data_processor ระหว่างวัด
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for name in args.only or BENCHMARKS:
+            results[name] = measure(BENCHMARKS[name](values), args.repeat)
+
+    print(f"ชีตสังเคราะห์ {args.rows} แถว: " + ", ".join(f"{k}={v}" for k, v in sorted(statuses.items())))
+    print(f"{'benchmark':<28} {'median (ms)':>12} {'min (ms)':>10} {'peak (KiB)':>11}")
+    print("-" * 64)
+    for name, result in results.items():
+        print(f"{name:<28} {result['median_ms']:>12.4f} {result['min_ms']:>10.4f} {result['peak_kib']:>11.1f}")
+
+    report = {
+        "python": sys.version.split()[0],
+        "rows": args.rows,
+        "pending_ratio": args.pending_ratio,
+        "error_ratio": args.error_ratio,
+        "seed": args.seed,
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        print(f"บันทึก baseline ที่ {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("ไม่พบ baseline ข้ามการเปรียบเทียบ")
+        return 0
+    with open(args.baseline, encoding="utf-8") as file:
+        baseline = json.load(file)
+    if baseline.get("rows") != args.rows:
+        print(f"⚠️ baseline วัดกับ {baseline.get('rows')} แถว ผลอาจเทียบกันไม่ได้")
+    gated = MEMORY_METRICS + (TIMING_METRICS if args.gate_timing else ())
+    regressions = compare(results, baseline.get("results", {}), args.threshold, gated)
+    if not args.gate_timing:
+        slower = compare(results, baseline.get("results", {}), args.threshold, TIMING_METRICS)
+        if slower:
+            print(f"⚠️ เวลาช้ากว่า baseline เกิน {args.threshold:.0%} (ไม่นับเป็น regression ใช้ --gate-timing ถ้าต้องการ):")
+            for line in slower:
+                print(f"  {line}")
+    if regressions:
+        print(f"❌ พบ regression เกิน {args.threshold:.0%}:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print(f"✅ ไม่พบ regression เกิน {args.threshold:.0%} เมื่อเทียบกับ baseline")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
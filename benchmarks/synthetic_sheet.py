@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# benchmarks/synthetic_sheet.py
+# สร้างข้อมูลชีตสังเคราะห์ (values matrix แบบเดียวกับที่ Sheets API คืนมา) สำหรับ benchmark
+#
+# ตัวอย่างการใช้งาน:
+#   python benchmarks/synthetic_sheet.py --rows 100000 --pending-ratio 0.05 --json sheet.json
+#
+# แต่ละแถวจะเป็นหนึ่งในสถานะต่อไปนี้
+#   pending  - สร้าง payment link แล้ว รอส่งโนติฯ
+#   error    - เคยส่งไม่สำเร็จ มีข้อความในคอลัมน์ Error (ยังต้องส่งใหม่)
+#   done     - ส่งโนติฯ แล้ว
+#   new      - เพิ่งกรอกฟอร์ม ยังไม่ได้สร้าง payment link (แถวสั้น)
+# และตัดเซลล์ว่างท้ายแถวออกเหมือน Sheets API ทำให้ความยาวแถวไม่เท่ากัน (ragged)
+
+import os
+import sys
+import json
+import random
+import argparse
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import (
+    TIMESTAMP,
+    LAND_NO,
+    PHONE,
+    EMAIL,
+    IS_GEN_PAYMENT_LINK,
+    PAYMENT_LINK,
+    IS_SEND_NOTI,
+    ERROR_RES
+)
+
+# คอลัมน์เพิ่มเติมที่พบในฟอร์มจริง (ไม่ได้ใช้ในการประมวลผล แต่มีผลกับขนาดแถว)
+EXTRA_HEADERS = ["ชื่อ-นามสกุล", "โครงการ", "หมายเหตุ", "ช่องทางที่สะดวกให้ติดต่อกลับ"]
+PROJECTS = ["สบาย วิลล์ บางนา", "สบาย ทาวน์ รังสิต", "สบาย โฮม ราชพฤกษ์"]
+NOTES = ["", "", "ขอใบเสร็จ", "ชำระแทนเจ้าของห้อง", "ติดต่อช่วงเย็น 🙏"]
+
+# ตัวอย่าง error ที่เขียนกลับลงคอลัมน์ Error (ใช้กับแถวสถานะ error)
+SAMPLE_ERRORS = [
+    '{\n    "message": "user not found"\n}',
+    "HTTP Error: 502",
+    "Circuit breaker เปิดอยู่ ข้ามการส่งชั่วคราว",
+]
+
+# ตัวอย่างผลลัพธ์ที่ส่งไม่สำเร็จจาก send_notification (ใช้กับ parse_error_message)
+SAMPLE_FAILED_RESULTS = [
+    {'success': False, 'error': '{"message": "user not found", "code": "USER_NOT_FOUND"}', 'status_code': 404},
+    {'success': False, 'error': '{"error": {"detail": "invalid phone"}}', 'status_code': 400},
+    {'success': False, 'error': '<html>Bad Gateway</html>', 'status_code': 502},
+    {'success': False, 'error': {'message': 'timeout'}, 'status_code': None},
+    {'success': False, 'error': 'Circuit breaker เปิดอยู่', 'circuit_open': True},
+]
+
+HEADERS = [TIMESTAMP, *EXTRA_HEADERS[:2], LAND_NO, PHONE, EMAIL, *EXTRA_HEADERS[2:],
+           IS_GEN_PAYMENT_LINK, PAYMENT_LINK, IS_SEND_NOTI, ERROR_RES]
+
+def iter_rows(row_count, pending_ratio=0.1, error_ratio=0.02, new_ratio=0.05, seed=0):
+    """
+    สร้างแถวข้อมูล (ไม่รวม header) ทีละแถว เพื่อใช้กับชีตขนาดใหญ่โดยไม่ต้องเก็บทั้งหมดไว้ใน memory
+
+    Args:
+        row_count (int): จำนวนแถว
+        pending_ratio (float): สัดส่วนแถวที่รอส่งโนติฯ
+        error_ratio (float): สัดส่วนแถวที่เคยส่งไม่สำเร็จ
+        new_ratio (float): สัดส่วนแถวที่ยังไม่ได้สร้าง payment link (ที่เหลือเป็นแถวที่ส่งแล้ว)
+        seed (int): seed ของการสุ่ม (ผลลัพธ์เหมือนเดิมทุกครั้งสำหรับ seed เดียวกัน)
+
+    Yields:
+        tuple: (สถานะ, ข้อมูลแถว)
+    """
+    rng = random.Random(seed)
+    column = {header: i for i, header in enumerate(HEADERS)}
+    for i in range(row_count):
+        row = [""] * len(HEADERS)
+        row[column[TIMESTAMP]] = f"{rng.randint(1, 28)}/{rng.randint(1, 12)}/2025, {rng.randint(0, 23)}:{rng.randint(0, 59):02d}:00"
+        row[column[EXTRA_HEADERS[0]]] = f"คุณทดสอบ ลำดับที่{i}"
+        row[column[EXTRA_HEADERS[1]]] = rng.choice(PROJECTS)
+        row[column[LAND_NO]] = f"{1000 + i // 1000}-{i % 1000:03d}"
+        row[column[PHONE]] = f"08{rng.randint(0, 99999999):08d}"
+        row[column[EMAIL]] = f"user{i}@example.com" if rng.random() < 0.8 else ""
+        row[column[EXTRA_HEADERS[2]]] = rng.choice(NOTES)
+        row[column[EXTRA_HEADERS[3]]] = rng.choice(["", "โทรศัพท์", "LINE"])
+
+        roll = rng.random()
+        if roll < pending_ratio:
+            status = "pending"
+        elif roll < pending_ratio + error_ratio:
+            status = "error"
+        elif roll < pending_ratio + error_ratio + new_ratio:
+            status = "new"
+        else:
+            status = "done"
+
+        if status != "new":
+            row[column[IS_GEN_PAYMENT_LINK]] = "Done"
+            row[column[PAYMENT_LINK]] = f"https://pay.example.com/l/{i:08x}"
+        if status == "done":
+            row[column[IS_SEND_NOTI]] = "Done"
+        elif status == "error":
+            row[column[ERROR_RES]] = rng.choice(SAMPLE_ERRORS)
+
+        # Sheets API ไม่คืนเซลล์ว่างท้ายแถว
+        while row and row[-1] == "":
+            row.pop()
+        yield status, row
+
+def generate_values(row_count, pending_ratio=0.1, error_ratio=0.02, new_ratio=0.05, seed=0):
+    """
+    สร้าง values matrix (แถวแรกเป็น header) แบบเดียวกับผลลัพธ์ของ values().get()
+
+    Returns:
+        tuple: (values, Counter ของจำนวนแถวแต่ละสถานะ)
+    """
+    values = [list(HEADERS)]
+    statuses = Counter()
+    for status, row in iter_rows(row_count, pending_ratio, error_ratio, new_ratio, seed):
+        statuses[status] += 1
+        values.append(row)
+    return values, statuses
+
+def main():
+    parser = argparse.ArgumentParser(description="สร้างข้อมูลชีตสังเคราะห์สำหรับ benchmark")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--pending-ratio", type=float, default=0.1)
+    parser.add_argument("--error-ratio", type=float, default=0.02)
+    parser.add_argument("--new-ratio", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="บันทึก values เป็นไฟล์ JSON (รูปแบบเดียวกับ response ของ Sheets API)")
+    args = parser.parse_args()
+
+    values, statuses = generate_values(args.rows, args.pending_ratio, args.error_ratio, args.new_ratio, args.seed)
+    cells = sum(len(row) for row in values)
+    print(f"สร้าง {len(values) - 1} แถว ({cells} เซลล์): " + ", ".join(f"{k}={v}" for k, v in sorted(statuses.items())))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump({"majorDimension": "ROWS", "values": values}, file, ensure_ascii=False)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,8 +7,8 @@ mkdir -p build/package
 # ติดตั้ง dependencies ใน build/package
 python -m pip install -r requirements.txt --target build/package
 
-# คัดลอกไฟล์ Python ไปยังโฟลเดอร์ build/package
-cp *.py build/package/
+# คัดลอกไฟล์ Python ไปยังโฟลเดอร์ build/package (ไม่รวมไฟล์ทดสอบ test_*.py)
+find . -maxdepth 1 -name "*.py" ! -name "test_*.py" -exec cp {} build/package/ \;
 
 # สร้างไฟล์ ZIP
 cd build/package
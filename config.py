@@ -8,6 +8,62 @@ SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
 SPREADSHEET_ID = os.environ.get("SPREADSHEET_ID")
 SHEET_NAME = os.environ.get("SHEET_NAME", "ชีต1")
 
+# หลาย spreadsheet/แท็บในการทำงานครั้งเดียว: JSON list ของ target (ดู targets.py) ถ้าไม่กำหนดใช้ SPREADSHEET_ID และ SHEET_NAME
+TARGETS_JSON = os.environ.get("TARGETS_JSON")
+TARGET_CONCURRENCY = int(os.environ.get("TARGET_CONCURRENCY", "4"))  # จำนวน target ที่ประมวลผลพร้อมกัน
+
+# แบ่งแถวที่ต้องส่งเป็น shard ให้ worker หลายตัว (ใช้ตอนมีงานค้างมาก เช่น หลังระบบล่ม)
+SHARD_BACKEND = os.environ.get("SHARD_BACKEND", "none").lower()  # "none", "lambda" (invoke แยก) หรือ "process" (process pool ในเครื่อง)
+SHARD_MIN_ROWS = int(os.environ.get("SHARD_MIN_ROWS", "50"))  # แบ่ง shard เมื่อมีแถวที่ต้องส่งอย่างน้อยเท่านี้
+SHARD_MAX_WORKERS = int(os.environ.get("SHARD_MAX_WORKERS", "4"))  # จำนวน shard/worker สูงสุด
+SHARD_WORKER_FUNCTION = os.environ.get("SHARD_WORKER_FUNCTION", os.environ.get("AWS_LAMBDA_FUNCTION_NAME"))  # Lambda ที่ใช้เป็น worker
+SHARD_WORKER_TIMEOUT_SECONDS = float(os.environ.get("SHARD_WORKER_TIMEOUT_SECONDS", "900"))  # timeout ของ Lambda worker (ใช้ตั้ง read timeout ตอน invoke)
+
+# ชี้ Sheets API ไปที่ endpoint อื่น (เช่น stand-in ของ benchmarks/e2e_benchmark.py) และใช้ credentials แบบไม่ยืนยันตัวตน
+SHEETS_API_ENDPOINT = os.environ.get("SHEETS_API_ENDPOINT")
+SHEETS_ANONYMOUS_CREDENTIALS = os.environ.get("SHEETS_ANONYMOUS_CREDENTIALS", "false").lower() == "true"
+
+# อายุของ credentials ที่แคชไว้ข้าม warm invocation (วินาที)
+CREDENTIALS_CACHE_TTL_SECONDS = int(os.environ.get("CREDENTIALS_CACHE_TTL_SECONDS", "3600"))
+
+# รูปแบบการอ่านข้อมูล: "full" อ่านทุกคอลัมน์, "projected" อ่านเฉพาะคอลัมน์สถานะก่อนแล้วค่อยอ่านแถวที่ต้องส่ง
+# "paged" อ่านทีละหน้า (SHEET_PAGE_SIZE แถว) แล้วส่งต่อให้ประมวลผลทีละแถว ใช้ memory คงที่ไม่ขึ้นกับขนาดชีต
+SHEET_READ_MODE = os.environ.get("SHEET_READ_MODE", "full").lower()
+SHEET_PAGE_SIZE = int(os.environ.get("SHEET_PAGE_SIZE", "5000"))
+SHEET_PAGE_PREFETCH = os.environ.get("SHEET_PAGE_PREFETCH", "true").lower() == "true"  # อ่านหน้าถัดไประหว่างประมวลผลหน้าปัจจุบัน
+HEADER_CACHE_TTL_SECONDS = int(os.environ.get("HEADER_CACHE_TTL_SECONDS", "300"))
+SHEET_BATCH_GET_SIZE = int(os.environ.get("SHEET_BATCH_GET_SIZE", "100"))  # จำนวน range สูงสุดต่อ batchGet
+
+# การเขียนข้อมูลกลับ Google Sheets แบบรวม batch
+SHEET_WRITE_BATCH_SIZE = int(os.environ.get("SHEET_WRITE_BATCH_SIZE", "50"))  # จำนวนแถวสูงสุดต่อการ flush
+SHEET_WRITE_FLUSH_SECONDS = float(os.environ.get("SHEET_WRITE_FLUSH_SECONDS", "10"))  # เวลาสูงสุดที่เก็บข้อมูลไว้ในบัฟเฟอร์
+SHEET_WRITE_MAX_ATTEMPTS = int(os.environ.get("SHEET_WRITE_MAX_ATTEMPTS", "4"))  # จำนวนครั้งที่ลอง batchUpdate เมื่อได้ 429/5xx
+SHEET_WRITE_RETRY_BASE_DELAY = float(os.environ.get("SHEET_WRITE_RETRY_BASE_DELAY", "1"))
+SHEET_WRITE_RETRY_MAX_DELAY = float(os.environ.get("SHEET_WRITE_RETRY_MAX_DELAY", "16"))
+
+# การสแกนแบบ incremental (อ่านเฉพาะแถวตั้งแต่ watermark ลงไป)
+INCREMENTAL_SCAN = os.environ.get("INCREMENTAL_SCAN", "false").lower() == "true"
+SCAN_STATE_PATH = os.environ.get("SCAN_STATE_PATH", "/tmp/sabai_scan_state.json")
+FULL_RESCAN_INTERVAL_SECONDS = int(os.environ.get("FULL_RESCAN_INTERVAL_SECONDS", "21600"))  # สแกนทั้งชีตซ้ำทุก 6 ชั่วโมง
+
+# หยุดรับแถวใหม่เมื่อเวลาที่เหลือของ Lambda น้อยกว่านี้ (เผื่อเวลาเขียนข้อมูลค้าง บันทึก checkpoint และส่ง Discord)
+# การส่ง SABAI ที่เริ่มไปแล้วจะถูกจำกัด timeout และการลองใหม่ไม่ให้เกินเส้นตายนี้
+DEADLINE_SAFETY_MARGIN_SECONDS = float(os.environ.get("DEADLINE_SAFETY_MARGIN_SECONDS", "20"))
+
+# Idempotency ledger สำหรับป้องกันการส่งโนติฯ ซ้ำ
+IDEMPOTENCY_LEDGER = os.environ.get("IDEMPOTENCY_LEDGER", "true").lower() == "true"
+LEDGER_PATH = os.environ.get("LEDGER_PATH", "/tmp/sabai_send_ledger.sqlite3")
+LEDGER_RETENTION_DAYS = int(os.environ.get("LEDGER_RETENTION_DAYS", "30"))
+
+# Outbox: แยกการตรวจหาแถวที่ต้องส่ง (scan) ออกจากการส่งจริง (drain) ผ่านคิว SQLite
+OUTBOX_MODE = os.environ.get("OUTBOX_MODE", "off").lower()  # "off", "inline" (scan แล้ว drain ในรอบเดียวกัน) หรือ "scan" (drain ด้วย event {"outbox": "drain"} ต้องใช้ OUTBOX_PATH บน EFS)
+OUTBOX_PATH = os.environ.get("OUTBOX_PATH", "/tmp/sabai_outbox.sqlite3")  # ชี้ไปที่ EFS ถ้าต้องการให้คิวอยู่ข้าม container (จำเป็นสำหรับ OUTBOX_MODE=scan)
+OUTBOX_BATCH_SIZE = int(os.environ.get("OUTBOX_BATCH_SIZE", "25"))  # จำนวนแถวที่ drain worker claim ต่อครั้ง
+OUTBOX_DRAIN_WORKERS = int(os.environ.get("OUTBOX_DRAIN_WORKERS", "2"))  # จำนวน drain worker ต่อ target
+OUTBOX_LEASE_SECONDS = float(os.environ.get("OUTBOX_LEASE_SECONDS", "120"))  # แถวที่ claim แล้วไม่เสร็จภายในเวลานี้จะถูก claim ใหม่
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", "5"))
+OUTBOX_RETENTION_DAYS = int(os.environ.get("OUTBOX_RETENTION_DAYS", "7"))
+
 # Column Headers
 TIMESTAMP = "ประทับเวลา"
 IS_GEN_PAYMENT_LINK = "is Gen Payment Link"
@@ -22,6 +78,19 @@ ERROR_RES = "Error"
 SABAI_API_URL = os.environ.get("SABAI_API_URL")
 SABAI_API_TOKEN = os.environ.get("SABAI_API_TOKEN")
 
+# Metrics (CloudWatch Embedded Metric Format)
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "true").lower() == "true"
+METRICS_NAMESPACE = os.environ.get("METRICS_NAMESPACE", "SabaiPaymentLink")
+
+# Profiling ตามคำขอ (header/query "profile=cpu|mem")
+PROFILE_TOP_N = int(os.environ.get("PROFILE_TOP_N", "20"))  # จำนวน hotspot ที่คืนใน response
+PROFILE_TRACEBACK_FRAMES = int(os.environ.get("PROFILE_TRACEBACK_FRAMES", "1"))  # ความลึกของ traceback ใน tracemalloc
+PROFILE_DISCORD_ATTACHMENT = os.environ.get("PROFILE_DISCORD_ATTACHMENT", "true").lower() == "true"
+
+# Logger
+LOG_BUFFER_SIZE = int(os.environ.get("LOG_BUFFER_SIZE", "2000"))  # จำนวน log สูงสุดที่เก็บไว้ส่ง Discord
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text").lower()  # "text" หรือ "json" (JSON lines)
+
 # Discord webhook
 DISCORD_WEBHOOK_URL = os.environ.get("DISCORD_WEBHOOK_URL")
 DISCORD_USER_IDS = [
@@ -32,19 +101,56 @@ DEV_DISCORD_USER_IDS = [
     '400624061925031946',  # arm
     '750664449463025685',  # tu
 ]
+DISCORD_CHUNK_SIZE = int(os.environ.get("DISCORD_CHUNK_SIZE", "1900"))  # Discord จำกัด 2000 ตัวอักษรต่อข้อความ
+DISCORD_MAX_RETRIES = int(os.environ.get("DISCORD_MAX_RETRIES", "3"))  # จำนวนครั้งที่ลองใหม่เมื่อได้ 429
+DISCORD_FLUSH_BUDGET_SECONDS = float(os.environ.get("DISCORD_FLUSH_BUDGET_SECONDS", "5"))  # เวลาสูงสุดที่ handler รอส่ง log
 
 # Notification Content
 NOTIFICATION_TITLE = "เรียน ท่านเจ้าของบ้าน"
 NOTIFICATION_BUTTON = "ดำเนินการชำระเงิน"
 NOTIFICATION_DESCRIPTION = f'ตามที่ท่านได้แจ้งความประสงค์ในการชำระค่าบริการสาธารณะ กรุณาดำเนินการชำระเงินโดยการกดปุ่ม "{NOTIFICATION_BUTTON}" ด้านล่างภายใน 24 ชั่วโมง นับจากได้รับข้อความนี้ เงื่อนไขการชำระเงินเป็นไปตามที่ธนาคารกำหนด ขอขอบพระคุณมา ณ โอกาสนี้'
 
+# การส่งโนติฯ แบบขนาน
+NOTIFY_CONCURRENCY = int(os.environ.get("NOTIFY_CONCURRENCY", "4"))  # จำนวน worker ที่ส่งพร้อมกัน
+NOTIFY_RATE_PER_SECOND = float(os.environ.get("NOTIFY_RATE_PER_SECOND", "2"))  # จำนวนคำขอต่อวินาที
+NOTIFY_BURST = int(os.environ.get("NOTIFY_BURST", "2"))  # จำนวนคำขอที่ยิงติดกันได้ก่อนถูกหน่วง
+PIPELINE_QUEUE_SIZE = int(os.environ.get("PIPELINE_QUEUE_SIZE", "50"))  # ขนาด queue ระหว่าง stage ของ pipeline
+
+# จัดลำดับการส่งตามอายุของคำขอ (คอลัมน์ประทับเวลา) ให้คำขอที่ใกล้หลุดกรอบชำระเงิน 24 ชั่วโมงได้ส่งก่อน
+PRIORITY_SCHEDULING = os.environ.get("PRIORITY_SCHEDULING", "false").lower() == "true"
+# ขอบเขตอายุ (ชั่วโมง) ของแต่ละระดับ เช่น "12,6,2" = อายุ >= 12 ชม. ส่งก่อน ตามด้วย >= 6, >= 2 และที่เหลือ (ในระดับเดียวกันเรียงตามแถว)
+PRIORITY_AGE_TIERS_HOURS = sorted(
+    (float(hours) for hours in os.environ.get("PRIORITY_AGE_TIERS_HOURS", "12,6,2").split(",") if hours.strip()),
+    reverse=True
+)
+# จำนวนแถวที่อ่านล่วงหน้าจาก filter stage เพื่อเรียงตามอายุ (เรียงภายในช่วงนี้ ไม่ต้องรอคัดแถวครบทั้งชีต)
+PRIORITY_WINDOW_SIZE = int(os.environ.get("PRIORITY_WINDOW_SIZE", "500"))
+# รูปแบบของค่าประทับเวลา (คั่นด้วย |) ลองตามลำดับ
+PRIORITY_TIMESTAMP_FORMATS = os.environ.get(
+    "PRIORITY_TIMESTAMP_FORMATS", "%d/%m/%Y, %H:%M:%S|%d/%m/%Y %H:%M:%S|%Y-%m-%d %H:%M:%S"
+).split("|")
+
+# HTTP connection pool และ timeout (วินาที) สำหรับ SABAI API และ Discord webhook
+HTTP_POOL_CONNECTIONS = int(os.environ.get("HTTP_POOL_CONNECTIONS", "2"))  # จำนวน host ที่เก็บ pool ไว้
+HTTP_POOL_MAXSIZE = int(os.environ.get("HTTP_POOL_MAXSIZE", str(NOTIFY_CONCURRENCY * TARGET_CONCURRENCY)))  # connection ต่อ host
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "5"))
+SABAI_READ_TIMEOUT = float(os.environ.get("SABAI_READ_TIMEOUT", "30"))
+DISCORD_READ_TIMEOUT = float(os.environ.get("DISCORD_READ_TIMEOUT", "10"))
+
+# Retry และ circuit breaker สำหรับ SABAI API
+SABAI_MAX_ATTEMPTS = int(os.environ.get("SABAI_MAX_ATTEMPTS", "3"))  # จำนวนครั้งสูงสุดที่ยิงต่อ 1 แถว
+SABAI_RETRY_BASE_DELAY = float(os.environ.get("SABAI_RETRY_BASE_DELAY", "0.5"))
+SABAI_RETRY_MAX_DELAY = float(os.environ.get("SABAI_RETRY_MAX_DELAY", "8"))  # Retry-After ที่นานกว่านี้จะไม่รอ
+SABAI_BREAKER_THRESHOLD = int(os.environ.get("SABAI_BREAKER_THRESHOLD", "5"))  # ล้มเหลวติดกันกี่แถวจึงตัดวงจร
+SABAI_BREAKER_RESET_SECONDS = float(os.environ.get("SABAI_BREAKER_RESET_SECONDS", "60"))
+
 X_API_KEY = os.environ.get("X_API_KEY")
 
 # ตรวจสอบว่ามีการกำหนดค่าที่จำเป็นหรือไม่
 def validate_config():
     """ตรวจสอบว่ามีการกำหนดค่า configuration ที่จำเป็นหรือไม่"""
     required_configs = {
-        "SPREADSHEET_ID": SPREADSHEET_ID,
+        "SPREADSHEET_ID": SPREADSHEET_ID or TARGETS_JSON,
         "SABAI_API_URL": SABAI_API_URL,
         "SABAI_API_TOKEN": SABAI_API_TOKEN,
         "DISCORD_WEBHOOK_URL": DISCORD_WEBHOOK_URL,
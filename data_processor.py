@@ -1,251 +1,359 @@
 from config import (
-    ERROR_RES,
-    IS_GEN_PAYMENT_LINK, 
-    IS_SEND_NOTI, 
-    PAYMENT_LINK,
-    LAND_NO,
-    PHONE,
-    EMAIL,
-    TIMESTAMP
+    NOTIFY_CONCURRENCY,
+    NOTIFY_RATE_PER_SECOND,
+    NOTIFY_BURST,
+    PIPELINE_QUEUE_SIZE,
+    PRIORITY_SCHEDULING
 )
 from datetime import datetime
+from deadline import get_deadline
+from ledger import get_ledger
+from metrics import get_metrics
 from notification import send_notification
-from sheets_service import update_sheet_row
-import time
-import pytz
+from pipeline import run_pipeline
+from priority import prioritize
+from rate_limiter import TokenBucket
+from row_schema import RowView, compile_schema, find_column_indices
+from sheets_service import SheetBatchWriter
+from targets import default_target
 import json
 
-def find_column_indices(headers):
+def parse_error_message(result):
     """
-    หาตำแหน่งคอลัมน์ที่ต้องการ
-    
+    แปลงผลลัพธ์ที่ส่งไม่สำเร็จจาก send_notification เป็นข้อความสำหรับคอลัมน์ Error
+
     Args:
-        headers (list): รายการหัวข้อคอลัมน์
-    
+        result (dict): ผลลัพธ์จาก send_notification
+
     Returns:
-        dict: ดัชนีของคอลัมน์ต่างๆ
+        str: ข้อความ error
     """
-    indices = {
-        'payment_link': -1,
-        'is_gen_payment_link': -1,
-        'is_send_noti': -1,
-        'land_no': -1,
-        'phone': -1,
-        'email': -1
-    }
+    # circuit breaker เปิดอยู่ ใช้ข้อความที่อธิบายไว้แล้วโดยตรง
+    if result.get('circuit_open'):
+        return result['error']
+
+    prettyErr = False
+    # ดึงข้อความ error จาก response
+    error_message = "Unknown error"
+    error_detail = result.get('error', '')
     
-    for i, header in enumerate(headers):
-        if header == TIMESTAMP:
-            indices['timestamp'] = i
-        elif header == PAYMENT_LINK:
-            indices['payment_link'] = i
-        elif header == IS_GEN_PAYMENT_LINK:
-            indices['is_gen_payment_link'] = i
-        elif header == IS_SEND_NOTI:
-            indices['is_send_noti'] = i
-        elif header == LAND_NO:
-            indices['land_no'] = i
-        elif header == PHONE:
-            indices['phone'] = i
-        elif header == EMAIL:
-            indices['email'] = i
-        elif header == ERROR_RES:
-            indices['error'] = i
+    # ตรวจสอบว่า error เป็น JSON หรือไม่
+    try:
+        if not prettyErr and isinstance(error_detail, str) and error_detail.startswith('{'):
+            err = json.loads(error_detail)
+            errStr = json.dumps(err, indent=4, ensure_ascii=False)
+            error_message = errStr
+        else:
+            if isinstance(error_detail, str):
+                error_json = json.loads(error_detail)
+                if 'message' in error_json:
+                    error_message = error_json['message']
+                elif 'error' in error_json and 'detail' in error_json['error']:
+                    error_message = error_json['error']['detail']
+            elif isinstance(error_detail, dict) and 'message' in error_detail:
+                error_message = error_detail['message']
+    except json.JSONDecodeError:
+        # ถ้าไม่ใช่ JSON ให้ใช้ HTTP status code
+        error_message = f"HTTP Error: {result.get('status_code', 'Unknown')}"
+
+    return error_message
+
+def get_ledger_key(row, schema):
+    """คืน key (land_no, payment_link) ของแถวสำหรับ idempotency ledger"""
+    return schema.get(row, schema.land_no), schema.get(row, schema.payment_link)
+
+def iter_rows_to_update(rows, schema, logger, scan_info):
+    """
+    Filter stage: วนตรวจสอบแถวแล้ว yield เฉพาะแถวที่ต้องส่งโนติฯ
+
+    Args:
+        rows (iterable): (แถวใน spreadsheet, ข้อมูลแถว)
+        schema (ColumnSchema): schema ของคอลัมน์
+        logger (Logger): Logger สำหรับบันทึก log
+        scan_info (dict): จะถูกอัพเดต 'first_unfinished_row', 'last_row' และ 'candidates'
+            และ 'deadline_row' (แถวที่หยุดรับเพราะใกล้หมดเวลาของ invocation)
+
+    Yields:
+        RowView: แถวที่ต้องส่งโนติฯ (อ้างอิงข้อมูลแถวเดิมโดยไม่ copy)
+    """
+    import traceback
+
+    # จำนวนคอลัมน์ขั้นต่ำที่ต้องมีจึงจะตรวจสอบเงื่อนไขได้
+    min_length = schema.min_length
+    deadline = get_deadline()
+
+    def mark_unfinished(row_num):
+        if scan_info['first_unfinished_row'] is None or row_num < scan_info['first_unfinished_row']:
+            scan_info['first_unfinished_row'] = row_num
+
+    for row_num, row in rows:
+        scan_info['last_row'] = max(row_num, scan_info['last_row'] or 0)
+        try:
+            logger.debug("กำลังตรวจสอบแถวที่ %s, จำนวนคอลัมน์: %s", row_num, len(row))
+            
+            if len(row) < min_length:
+                if any(row):
+                    mark_unfinished(row_num)
+                logger.debug("ข้ามแถวที่ %s เนื่องจากข้อมูลไม่ครบ (ต้องการ index %s, มี %s)", row_num, min_length - 1, len(row))
+                continue
+            
+            # ตรวจสอบเงื่อนไข: is Gen Payment Link = Done และ Payment Link เริ่มต้นด้วย https:// และ is Send Noti ไม่เท่ากับ Done
+            if schema.is_due(row):
+                if deadline.expired():
+                    # ใกล้หมดเวลา: หยุดรับแถวใหม่ แถวนี้และแถวถัดไปจะทำต่อในรอบถัดไป
+                    mark_unfinished(row_num)
+                    scan_info['deadline_row'] = row_num
+                    logger.info(f"⏱️ ใกล้หมดเวลาของ invocation หยุดรับแถวใหม่ที่แถวที่ {row_num}")
+                    break
+                logger.info(f"พบแถวที่ {row_num} ต้องส่งโนติฯ")
+                
+                # แสดงข้อมูลของแถวที่เข้าเงื่อนไข
+                for j, header in schema.display_columns:
+                    if j >= len(row):
+                        break
+                    logger.info(f"{header}: {row[j]}")
+                
+                logger.info("-" * 30)
+                
+                scan_info['candidates'] += 1
+                yield RowView(row_num, row)
+            elif not schema.is_send_noti_done(row):
+                mark_unfinished(row_num)
+                
+        except Exception as row_error:
+            mark_unfinished(row_num)
+            logger.error(f"Error ในแถวที่ {row_num}: {str(row_error)}")
+            logger.debug(lambda: f"Stack trace: {traceback.format_exc()}")
+            continue
     
-    return indices
+    logger.info(f"พบแถวที่ต้องอัพเดต: {scan_info['candidates']} แถว")
 
-def process_sheet_data(values, logger):
+def process_sheet_data(values, logger, first_row=2, run_state=None, target=None, rate_limiter=None):
     """
     ประมวลผลข้อมูลจาก Google Sheets
     
     Args:
-        values (list): ข้อมูลจาก Google Sheets
+        values (iterable): ข้อมูลจาก Google Sheets (แถวแรกเป็นหัวข้อ) เป็น list หรือ iterator ที่อ่านทีละแถวก็ได้
         logger (Logger): Logger สำหรับบันทึก log
+        first_row (int): แถวใน spreadsheet ของข้อมูลแถวแรกถัดจากหัวข้อ
+        run_state (dict, optional): ถ้ากำหนด จะบันทึก 'watermark' (แถวต่ำสุดที่ยังไม่เสร็จ) ลงไป
+        target (Target, optional): ชีตที่ประมวลผล (ค่าเริ่มต้นจาก SPREADSHEET_ID / SHEET_NAME)
+        rate_limiter (TokenBucket, optional): rate limiter ที่ใช้ร่วมกันหลาย target
     
     Returns:
-        tuple: (จำนวนการแจ้งเตือนที่ส่งสำเร็จ, มีการอัพเดตข้อมูลหรือไม่)
+        tuple: (จำนวนการแจ้งเตือนที่ส่งสำเร็จ, จำนวนที่ล้มเหลว, มีการอัพเดตข้อมูลหรือไม่)
+    """
+    if hasattr(values, '__len__'):
+        logger.info(f"เริ่มประมวลผลข้อมูล จำนวนแถว: {len(values)}")
+    else:
+        logger.info("เริ่มประมวลผลข้อมูลแบบ stream")
+
+    rows = iter(values)
+    # ดึงข้อมูลส่วนหัวจากแถวแรก
+    headers = next(rows)
+    result = process_rows(
+        headers, enumerate(rows, start=first_row), logger,
+        run_state=run_state, target=target, rate_limiter=rate_limiter
+    )
+
+    if run_state is not None and run_state.get('watermark') is None:
+        # ไม่มีข้อมูลตั้งแต่ first_row ลงไป
+        run_state['watermark'] = first_row
+    return result
+
+def stopped_rows(run_state, row_nums):
+    """
+    คืนแถวใน row_nums ที่ process_rows ยังไม่ได้ทำเพราะใกล้หมดเวลา:
+    แถวที่ถูกเลื่อนการส่ง และแถวตั้งแต่ 'deadline_row' ที่ filter ยังไม่ได้ปล่อยออกมา
+
+    Args:
+        run_state (dict): run_state ที่ process_rows บันทึกไว้
+        row_nums (iterable): แถวที่ส่งเข้า process_rows
+
+    Returns:
+        list: แถวที่ต้องทำต่อในรอบถัดไป เรียงตามลำดับแถว
+    """
+    deferred_rows = set(run_state.get('deferred_rows', []))
+    deadline_row = run_state.get('deadline_row')
+    return sorted(
+        row_num for row_num in row_nums
+        if row_num in deferred_rows or (deadline_row is not None and row_num >= deadline_row)
+    )
+
+def process_rows(headers, rows, logger, run_state=None, scan_hint=None, target=None, rate_limiter=None):
+    """
+    ประมวลผลแถวข้อมูลเป็น pipeline: filter → ส่งโนติฯ → เขียนกลับ spreadsheet
+    ทั้งสาม stage ทำงานพร้อมกัน เชื่อมกันด้วย queue ขนาด PIPELINE_QUEUE_SIZE
+
+    Args:
+        headers (list): หัวข้อคอลัมน์
+        rows (iterable): (แถวใน spreadsheet, ข้อมูลแถว) เรียงตามลำดับแถว
+        logger (Logger): Logger สำหรับบันทึก log
+        run_state (dict, optional): ถ้ากำหนด จะบันทึก 'watermark' (แถวต่ำสุดที่ยังไม่เสร็จ),
+            'failed_rows' (แถวที่ส่งหรือเขียนกลับไม่สำเร็จ), 'deferred_rows' (แถวที่เลื่อนไปรอบถัดไปเพราะใกล้หมดเวลา),
+            'deadline_row' (แถวที่ filter หยุดรับ แถวนี้และแถวถัดไปยังไม่ได้ตรวจสอบ)
+            และ 'resume_row' (แถวแรกที่ต้องทำต่อในรอบถัดไป) ลงไป
+        scan_hint (dict, optional): 'first_unfinished_row', 'last_row' และ 'deadline_row' ของแถวที่ไม่ได้ส่งมาใน rows
+            (เช่น จากการอ่านแบบ projected) ใช้ประกอบการคำนวณ watermark และ checkpoint
+        target (Target, optional): ชีตที่ประมวลผล ใช้ mapping คอลัมน์ ข้อความแจ้งเตือน และแท็บที่เขียนกลับ
+        rate_limiter (TokenBucket, optional): rate limiter ที่ใช้ร่วมกันหลาย target
+            (ค่าเริ่มต้นสร้างใหม่จาก NOTIFY_RATE_PER_SECOND / NOTIFY_BURST)
+
+    Returns:
+        tuple: (จำนวนการแจ้งเตือนที่ส่งสำเร็จ, จำนวนที่ล้มเหลว, มีการอัพเดตข้อมูลหรือไม่)
     """
     import traceback
+    import pytz
     
+    target = target or default_target()
     try:
-        logger.info(f"เริ่มประมวลผลข้อมูล จำนวนแถว: {len(values)}")
-        
-        thai_tz = pytz.timezone('Asia/Bangkok')
-        # ดึงข้อมูลส่วนหัวจากแถวแรก
-        headers = values[0]
-        logger.debug(f"[process_sheet_data] Headers: {headers}")
-        
-        # หาตำแหน่งคอลัมน์ที่ต้องการ
-        indices = find_column_indices(headers)
-        logger.debug(f"[process_sheet_data] Column indices: {indices}")
-        
-        # ตรวจสอบว่าพบคอลัมน์ที่จำเป็นหรือไม่
-        required_columns = ['payment_link', 'is_gen_payment_link', 'is_send_noti']
-        for col in required_columns:
-            if indices[col] == -1:
-                raise Exception(f"ไม่พบคอลัมน์ที่จำเป็น ({col})")
-        
-        # ตรวจสอบและอัพเดตข้อมูล
-        rows_to_update = []
-        
-        for i in range(1, len(values)):
-            try:
-                row = values[i]
-                logger.debug(f"กำลังตรวจสอบแถวที่ {i+1}, จำนวนคอลัมน์: {len(row)}")
-                
-                # ตรวจสอบว่า row มีข้อมูลครบทุกคอลัมน์ที่ต้องการหรือไม่
-                required_indices = [indices['payment_link'], indices['is_gen_payment_link']]
-                max_required_index = max(required_indices)
-                
-                if len(row) <= max_required_index:
-                    logger.debug(f"ข้ามแถวที่ {i+1} เนื่องจากข้อมูลไม่ครบ (ต้องการ index {max_required_index}, มี {len(row)})")
-                    continue
-                
-                # ตรวจสอบเงื่อนไข: is Gen Payment Link = Done และ Payment Link เริ่มต้นด้วย https:// และ is Send Noti ไม่เท่ากับ Done
-                is_send_noti_done = (len(row) > indices['is_send_noti'] and indices['is_send_noti'] >= 0 and row[indices['is_send_noti']] == "Done")
-                
-                # ตรวจสอบว่ามี payment_link และ is_gen_payment_link หรือไม่
-                payment_link_value = row[indices['payment_link']] if indices['payment_link'] < len(row) else ""
-                is_gen_payment_link_value = row[indices['is_gen_payment_link']] if indices['is_gen_payment_link'] < len(row) else ""
-                
-                if (is_gen_payment_link_value == "Done" and 
-                    payment_link_value.startswith("https://") and 
-                    not is_send_noti_done):
-                    
-                    logger.info(f"พบแถวที่ {i+1} ต้องส่งโนติฯ")
-                    
-                    # แสดงข้อมูลของแถวที่เข้าเงื่อนไข
-                    for j in range(min(len(headers), len(row))):
-                        # ข้ามคอลัมน์ที่ไม่ต้องการแสดง
-                        if headers[j] in [PAYMENT_LINK, IS_GEN_PAYMENT_LINK, IS_SEND_NOTI, TIMESTAMP]:
-                            continue
-                        logger.info(f"{headers[j]}: {row[j]}")
-                    
-                    logger.info("-" * 30)
-                    
-                    # เตรียมข้อมูลสำหรับอัพเดต is Send Noti เป็น Done
-                    rows_to_update.append({
-                        "row": i + 1,  # แถวใน spreadsheet (เริ่มจาก 1)
-                        "data": row.copy()  # ใช้ copy เพื่อไม่ให้กระทบข้อมูลเดิม
-                    })
-                    
-            except Exception as row_error:
-                logger.error(f"Error ในแถวที่ {i+1}: {str(row_error)}")
-                logger.debug(f"Stack trace: {traceback.format_exc()}")
-                continue
-        
-        logger.info(f"พบแถวที่ต้องอัพเดต: {len(rows_to_update)} แถว")
+        logger.debug("[process_sheet_data] Headers: %s", headers)
         
+        # หาตำแหน่งคอลัมน์ที่ต้องการ (คำนวณครั้งเดียวต่อแถวหัวข้อ)
+        schema = compile_schema(headers, target.columns)
+        indices = schema.indices
+        logger.debug("[process_sheet_data] Column indices: %s", indices)
+        schema.validate()
     except Exception as e:
         logger.error(f"Critical error: {str(e)}")
-        logger.debug(f"Stack trace: {traceback.format_exc()}")
+        logger.debug(lambda: f"Stack trace: {traceback.format_exc()}")
         raise
-    
-    noti_success = 0
-    noti_failed = 0
-    
-    # อัพเดตข้อมูลใน spreadsheet
-    for row_data in rows_to_update:
-        row_num = row_data["row"]
-        data = row_data["data"]
+
+    thai_tz = pytz.timezone('Asia/Bangkok')
+    scan_info = {'first_unfinished_row': None, 'last_row': None, 'candidates': 0}
+    if scan_hint:
+        scan_info['first_unfinished_row'] = scan_hint.get('first_unfinished_row')
+        scan_info['last_row'] = scan_hint.get('last_row')
+        scan_info['deadline_row'] = scan_hint.get('deadline_row')
+    # ผลลัพธ์รายแถว: True = สำเร็จ, False = ล้มเหลว
+    row_outcomes = {}
+    # แถวที่อยู่ในคิวแล้วแต่ยังไม่ได้ส่งเพราะใกล้หมดเวลา (ทำต่อในรอบถัดไป)
+    deferred_rows = []
+    deadline = get_deadline()
+    writer = SheetBatchWriter(spreadsheet_id=target.spreadsheet_id, sheet_name=target.sheet_name)
+    rate_limiter = rate_limiter or TokenBucket(NOTIFY_RATE_PER_SECOND, NOTIFY_BURST)
+    ledger = get_ledger()
+    if ledger is not None:
+        pruned = ledger.prune()
+        if pruned:
+            logger.debug("ลบรายการเก่าออกจาก idempotency ledger %s รายการ", pruned)
+
+    def handle_write_results(results):
+        """บันทึกผลการเขียนกลับ spreadsheet ราย range ลงในผลลัพธ์ของแต่ละแถว"""
+        for write_result in results:
+            if write_result['success']:
+                logger.debug("อัพเดตข้อมูลในแถวที่ %s เรียบร้อยแล้ว", write_result['row'])
+                continue
+            logger.error(f"Critical error ในการอัพเดตแถวที่ {write_result['row']}: {write_result['error']}")
+            logger.debug("Range: %s", write_result['range'])
+            row_outcomes[write_result['row']] = False
+
+    def send_stage(row):
+        """Send stage: รอ token จาก rate limiter แล้วจึงส่งการแจ้งเตือน"""
+        logger.debug("กำลังประมวลผลแถวที่ %s, ข้อมูลปัจจุบัน: %s คอลัมน์", row.row_num, len(row.cells))
+        logger.debug("Indices: %s", indices)
+        if deadline.expired():
+            return {'success': False, 'deferred': True}
+        # เคยส่งสำเร็จแล้วแต่เขียนสถานะกลับไม่สำเร็จ ให้ซ่อมสถานะในชีตโดยไม่เรียก API ซ้ำ
+        if ledger is not None and ledger.has_sent(*get_ledger_key(row.cells, schema)):
+            return {'success': True, 'repaired': True}
+        rate_limiter.acquire()
+        with get_metrics().timer('send_notification') as sample:
+            result = send_notification(
+                row.cells, indices, target.notification_title, target.notification_description
+            )
+            sample['error'] = not result['success']
+        return result
+
+    def write_stage(row, result, send_error):
+        """Write stage: บันทึกผลการส่งลงในแถวแล้วส่งเข้าบัฟเฟอร์สำหรับเขียนกลับ spreadsheet"""
+        row_num = row.row_num
+        if result is not None and result.get('deferred'):
+            deferred_rows.append(row_num)
+            return
         
         try:
-            logger.debug(f"กำลังประมวลผลแถวที่ {row_num}, ข้อมูลปัจจุบัน: {len(data)} คอลัมน์")
-            logger.debug(f"Indices: {indices}")
-            
-            # ส่งการแจ้งเตือนไปยัง API
-            result = send_notification(data, indices)
+            if send_error is not None:
+                raise send_error
             
             if result['success']:
-                logger.info(f"✅ ส่งการแจ้งเตือนสำเร็จสำหรับแถวที่ {row_num}")
+                if result.get('repaired'):
+                    logger.info(f"🔁 แถวที่ {row_num} เคยส่งโนติฯ สำเร็จแล้ว ซ่อมสถานะในชีตโดยไม่ส่งซ้ำ")
+                else:
+                    logger.info(f"✅ ส่งการแจ้งเตือนสำเร็จสำหรับแถวที่ {row_num}")
+                    if ledger is not None:
+                        ledger.record(*get_ledger_key(row.cells, schema), row_num=row_num)
                 
-                # ตรวจสอบว่าต้องเพิ่มคอลัมน์ is Send Noti หรือไม่
-                if indices['is_send_noti'] >= 0:  # ตรวจสอบว่า index ถูกต้อง
-                    if len(data) <= indices['is_send_noti']:
-                        logger.debug(f"เพิ่มคอลัมน์ is_send_noti ที่ index {indices['is_send_noti']}, ข้อมูลปัจจุบัน: {len(data)}")
-                        # เพิ่มคอลัมน์ที่ว่างจนถึง is_send_noti_index
-                        while len(data) < indices['is_send_noti']:
-                            data.append("")
-                        data.append("Done")
-                    else:
-                        logger.debug(f"อัพเดต is_send_noti ที่ index {indices['is_send_noti']}")
-                        data[indices['is_send_noti']] = "Done"
-
-                # update timestamp
-                timestamp = datetime.now(thai_tz).strftime("%Y-%m-%d %H:%M:%S")
-                if 'timestamp' in indices and indices['timestamp'] >= 0:  # ตรวจสอบว่า timestamp index ถูกต้อง
-                    if len(data) <= indices['timestamp']:
-                        logger.debug(f"เพิ่มคอลัมน์ timestamp ที่ index {indices['timestamp']}, ข้อมูลปัจจุบัน: {len(data)}")
-                        # เพิ่มคอลัมน์ที่ว่างจนถึง timestamp
-                        while len(data) < indices['timestamp']:
-                            data.append("")
-                        data.append(timestamp)
-                    else:
-                        logger.debug(f"อัพเดต timestamp ที่ index {indices['timestamp']}")
-                        data[indices['timestamp']] = timestamp
+                # เปลี่ยน is Send Noti เป็น Done และ update timestamp
+                row.set(schema.is_send_noti, "Done")
+                row.set(schema.timestamp, datetime.now(thai_tz).strftime("%Y-%m-%d %H:%M:%S"))
 
                 # อัพเดตข้อมูลใน spreadsheet
-                logger.debug(f"กำลังอัพเดตข้อมูลในแถวที่ {row_num} - เปลี่ยน is Send Noti เป็น Done, ข้อมูลสุดท้าย: {len(data)} คอลัมน์")
-                update_sheet_row(row_num, data)
-                logger.debug(f"อัพเดตข้อมูลในแถวที่ {row_num} เรียบร้อยแล้ว")
-                noti_success += 1
+                logger.debug(lambda: f"กำลังอัพเดตข้อมูลในแถวที่ {row_num} - เปลี่ยน is Send Noti เป็น Done, เซลล์ที่เปลี่ยน: {sorted(row.changes)}")
+                row_outcomes[row_num] = True
+                handle_write_results(writer.add(row_num, row.changes))
             else:
-                land_no_value = "ไม่ระบุ"
-                if indices['land_no'] != -1 and indices['land_no'] < len(data):
-                    land_no_value = data[indices['land_no']]
+                land_no_value = schema.get(row.cells, schema.land_no) if schema.land_no != -1 else "ไม่ระบุ"
                 
-                logger.error(f"❌ ส่งการแจ้งเตือนไม่สำเร็จสำหรับแปลง {land_no_value} (แถว {row_num})")
+                logger.error(f"❌ ส่งการแจ้งเตือนไม่สำเร็จสำหรับแปลง {land_no_value or 'ไม่ระบุ'} (แถว {row_num})")
                 logger.error(f"Error: {result.get('error', 'Unknown error')}")
-                noti_failed += 1
-                
-                prettyErr = False
-                # ดึงข้อความ error จาก response
-                error_message = "Unknown error"
-                error_detail = result.get('error', '')
+                row_outcomes[row_num] = False
                 
-                # ตรวจสอบว่า error เป็น JSON หรือไม่
-                try:
-                    if not prettyErr and isinstance(error_detail, str) and error_detail.startswith('{'):
-                        err = json.loads(error_detail)
-                        errStr = json.dumps(err, indent=4, ensure_ascii=False)
-                        error_message = errStr
-                    else:
-                        if isinstance(error_detail, str):
-                            error_json = json.loads(error_detail)
-                            if 'message' in error_json:
-                                error_message = error_json['message']
-                            elif 'error' in error_json and 'detail' in error_json['error']:
-                                error_message = error_json['error']['detail']
-                        elif isinstance(error_detail, dict) and 'message' in error_detail:
-                            error_message = error_detail['message']
-                except json.JSONDecodeError:
-                    # ถ้าไม่ใช่ JSON ให้ใช้ HTTP status code
-                    error_message = f"HTTP Error: {result.get('status_code', 'Unknown')}"
-
-                # เพิ่ม error message เป็นคอลัมน์สุดท้าย
-                if 'error' in indices and indices['error'] >= 0:  # ตรวจสอบว่า error index ถูกต้อง
-                    if len(data) <= indices['error']:
-                        logger.debug(f"เพิ่มคอลัมน์ error ที่ index {indices['error']}, ข้อมูลปัจจุบัน: {len(data)}")
-                        # เพิ่มคอลัมน์ที่ว่างจนถึง error
-                        while len(data) < indices['error']:
-                            data.append("")
-                        data.append(error_message)
-                    else:
-                        logger.debug(f"อัพเดต error ที่ index {indices['error']}")
-                        data[indices['error']] = error_message
+                # บันทึก error message ในคอลัมน์ Error
+                row.set(schema.error, parse_error_message(result))
 
                 # อัพเดตข้อมูลใน spreadsheet พร้อม error message
-                logger.debug(f"กำลังอัพเดตข้อมูลในแถวที่ {row_num} - เพิ่ม error message, ข้อมูลสุดท้าย: {len(data)} คอลัมน์")
-                update_sheet_row(row_num, data)
-                logger.debug(f"อัพเดตข้อมูลในแถวที่ {row_num} เรียบร้อยแล้ว")
+                logger.debug(lambda: f"กำลังอัพเดตข้อมูลในแถวที่ {row_num} - เพิ่ม error message, เซลล์ที่เปลี่ยน: {sorted(row.changes)}")
+                handle_write_results(writer.add(row_num, row.changes))
 
         except Exception as update_error:
             logger.error(f"Critical error ในการอัพเดตแถวที่ {row_num}: {str(update_error)}")
-            logger.debug(f"Stack trace: {traceback.format_exc()}")
-            logger.debug(f"Data length: {len(data)}, Indices: {indices}")
-            noti_failed += 1
+            logger.debug(lambda: f"Stack trace: {traceback.format_exc()}")
+            logger.debug("Data length: %s, Indices: %s", len(row.cells), indices)
+            row_outcomes[row_num] = False
+
+    try:
+        candidates = iter_rows_to_update(rows, schema, logger, scan_info)
+        if PRIORITY_SCHEDULING:
+            # ส่งคำขอที่เก่าที่สุด (ใกล้หลุดกรอบ 24 ชั่วโมง) ก่อน ภายในช่วงละ PRIORITY_WINDOW_SIZE แถว เวลาในชีตเป็นเวลาไทย
+            candidates = prioritize(candidates, schema, logger, datetime.now(thai_tz).replace(tzinfo=None))
+        run_pipeline(
+            candidates,
+            send_stage,
+            write_stage,
+            concurrency=NOTIFY_CONCURRENCY,
+            queue_size=PIPELINE_QUEUE_SIZE,
+            # flush บัฟเฟอร์ที่ค้างเกิน SHEET_WRITE_FLUSH_SECONDS แม้ไม่มีผลการส่งใหม่เข้ามา
+            on_idle=lambda: handle_write_results(writer.flush_if_due()),
+            idle_seconds=max(0.1, writer.max_wait_seconds / 4)
+        )
+    except Exception as e:
+        logger.error(f"Critical error: {str(e)}")
+        logger.debug(lambda: f"Stack trace: {traceback.format_exc()}")
+        raise
+    finally:
+        # เขียนข้อมูลที่ยังค้างอยู่ในบัฟเฟอร์ทั้งหมด
+        handle_write_results(writer.flush())
+
+    noti_success = sum(1 for success in row_outcomes.values() if success)
+    noti_failed = len(row_outcomes) - noti_success
+    if deferred_rows:
+        logger.info(f"⏱️ ใกล้หมดเวลาของ invocation เลื่อนการส่ง {len(deferred_rows)} แถวไปรอบถัดไป")
+    stop_rows = deferred_rows + ([scan_info['deadline_row']] if scan_info.get('deadline_row') is not None else [])
 
-        # หน่วงเวลาเล็กน้อยเพื่อไม่ให้ยิง API ถี่เกินไป
-        time.sleep(1)
+    if run_state is not None:
+        # watermark = แถวต่ำสุดที่ยังไม่เสร็จ หรือแถวถัดจากข้อมูลสุดท้ายถ้าทุกแถวเสร็จแล้ว
+        unfinished_rows = [row_num for row_num, success in row_outcomes.items() if not success]
+        run_state['failed_rows'] = sorted(unfinished_rows)
+        run_state['deferred_rows'] = sorted(deferred_rows)
+        run_state['deadline_row'] = scan_info.get('deadline_row')
+        run_state['resume_row'] = min(stop_rows) if stop_rows else None
+        unfinished_rows.extend(stop_rows)
+        if scan_info['first_unfinished_row'] is not None:
+            unfinished_rows.append(scan_info['first_unfinished_row'])
+        if unfinished_rows:
+            run_state['watermark'] = min(unfinished_rows)
+        elif scan_info['last_row'] is not None:
+            run_state['watermark'] = scan_info['last_row'] + 1
 
-    return noti_success, noti_failed, len(rows_to_update) > 0
+    return noti_success, noti_failed, scan_info['candidates'] > 0
@@ -0,0 +1,56 @@
+# deadline.py
+# เวลาที่เหลือของ invocation (จาก context ของ Lambda) ใช้หยุดรับแถวใหม่ก่อนหมดเวลา
+
+import time
+from config import DEADLINE_SAFETY_MARGIN_SECONDS
+
+class Deadline:
+    """
+    เส้นตายของ invocation หนึ่งครั้ง: เวลาที่ Lambda จะหมดเวลาลบด้วย safety margin
+
+    Attributes:
+        stopped_rows (list): (ชื่อชีต, แถวที่หยุดรับ) ของแต่ละชีตที่หยุดเพราะใกล้หมดเวลา
+    """
+
+    def __init__(self, context=None, margin_seconds=DEADLINE_SAFETY_MARGIN_SECONDS):
+        self._expires_at = None
+        if context is not None and hasattr(context, "get_remaining_time_in_millis"):
+            remaining = context.get_remaining_time_in_millis() / 1000
+            self._expires_at = time.monotonic() + remaining - margin_seconds
+        self.stopped_rows = []
+
+    def limit(self, seconds):
+        """เลื่อนเส้นตายให้เร็วขึ้นเป็นไม่เกิน seconds วินาทีจากนี้ (เช่น ตามเวลาที่ coordinator เหลือ)"""
+        expires_at = time.monotonic() + seconds
+        if self._expires_at is None or expires_at < self._expires_at:
+            self._expires_at = expires_at
+
+    def remaining(self):
+        """จำนวนวินาทีที่เหลือก่อนถึง safety margin หรือ None ถ้าไม่มีเส้นตาย"""
+        if self._expires_at is None:
+            return None
+        return self._expires_at - time.monotonic()
+
+    def expired(self):
+        """True เมื่อถึง safety margin แล้ว ต้องหยุดรับแถวใหม่"""
+        return self._expires_at is not None and time.monotonic() >= self._expires_at
+
+    def stop(self, name, row_num):
+        """บันทึกว่าหยุดรับแถวใหม่ของชีต name ที่แถว row_num"""
+        self.stopped_rows.append((name, row_num))
+
+    @property
+    def stopped(self):
+        return bool(self.stopped_rows)
+
+_deadline = Deadline()
+
+def get_deadline():
+    """คืน Deadline ของ invocation ปัจจุบัน"""
+    return _deadline
+
+def reset_deadline(context=None):
+    """เริ่มนับเส้นตายใหม่จาก context ของ invocation ถัดไป"""
+    global _deadline
+    _deadline = Deadline(context)
+    return _deadline
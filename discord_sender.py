@@ -0,0 +1,171 @@
+# discord_sender.py
+# ส่งข้อความไปยัง Discord webhook ผ่าน background thread โดยเคารพ rate limit ของ Discord
+
+import json
+import time
+import threading
+import unicodedata
+from collections import deque
+from http_client import get_session
+from metrics import get_metrics, response_size
+from resilience import parse_retry_after
+from config import (
+    DISCORD_WEBHOOK_URL,
+    HTTP_CONNECT_TIMEOUT,
+    DISCORD_READ_TIMEOUT,
+    DISCORD_MAX_RETRIES
+)
+
+# อักขระที่ต้องอยู่ติดกับอักขระก่อนหน้า (เช่น ZWJ และ variation selector ของ emoji)
+_JOINING_CHARS = {'\u200d', '\ufe0e', '\ufe0f'}
+
+def _safe_split_point(text, limit):
+    """หาตำแหน่งตัดที่ไม่แยกสระ/วรรณยุกต์ หรือ emoji sequence ออกจากอักขระหลัก"""
+    cut = limit
+    while cut > 1 and (
+        unicodedata.category(text[cut]).startswith('M')
+        or text[cut] in _JOINING_CHARS
+        or text[cut - 1] == '\u200d'
+    ):
+        cut -= 1
+    return cut
+
+def split_message(text, limit):
+    """
+    แบ่งข้อความเป็นชิ้นไม่เกิน limit ตัวอักษร โดยตัดที่ขึ้นบรรทัดใหม่
+    ถ้าบรรทัดเดียวยาวเกิน limit จะตัดกลางบรรทัดในตำแหน่งที่ไม่แยกอักขระที่ประกอบกัน
+
+    Returns:
+        list: ข้อความแต่ละชิ้น
+    """
+    chunks = []
+    current = ""
+    for line in text.split("\n"):
+        while len(line) > limit:
+            if current:
+                chunks.append(current)
+                current = ""
+            cut = _safe_split_point(line, limit)
+            chunks.append(line[:cut])
+            line = line[cut:]
+        candidate = f"{current}\n{line}" if current else line
+        if len(candidate) > limit:
+            chunks.append(current)
+            current = line
+        else:
+            current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
+
+class DiscordSender:
+    """
+    ส่ง payload ไปยัง Discord webhook ตามลำดับด้วย background thread เดียว
+
+    - รอตาม X-RateLimit-Reset-After เมื่อ X-RateLimit-Remaining เหลือ 0
+    - เมื่อได้ 429 จะรอตาม retry_after แล้วส่งใหม่ (ไม่เกิน DISCORD_MAX_RETRIES ครั้ง)
+    """
+
+    def __init__(self, webhook_url=DISCORD_WEBHOOK_URL, max_retries=DISCORD_MAX_RETRIES):
+        self.webhook_url = webhook_url
+        self.max_retries = max_retries
+        self._queue = deque()
+        self._pending = 0
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def send(self, payload, files=None):
+        """
+        เพิ่ม payload เข้าคิว (ไม่ block)
+
+        Args:
+            payload (dict): JSON payload ของ webhook
+            files (list, optional): ไฟล์แนบ [(ชื่อไฟล์, bytes)] ส่งแบบ multipart/form-data
+        """
+        with self._condition:
+            self._queue.append((payload, files))
+            self._pending += 1
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="discord-sender", daemon=True)
+                self._thread.start()
+            self._condition.notify_all()
+
+    def flush(self, timeout):
+        """
+        รอจนกว่าจะส่งครบทุก payload หรือครบ timeout วินาที
+
+        Returns:
+            bool: True ถ้าส่งครบแล้ว
+        """
+        deadline = time.monotonic() + max(0, timeout)
+        with self._condition:
+            while self._pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            return True
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._queue:
+                    self._condition.wait()
+                payload, files = self._queue.popleft()
+            try:
+                self._deliver(payload, files)
+            except Exception as e:
+                print(f"Error sending to Discord: {e}")
+            finally:
+                with self._condition:
+                    self._pending -= 1
+                    self._condition.notify_all()
+
+    def _deliver(self, payload, files=None):
+        if files:
+            # ไฟล์แนบต้องส่ง payload ในฟิลด์ payload_json ของ multipart/form-data
+            request_args = {
+                'data': {'payload_json': json.dumps(payload)},
+                'files': {f"files[{i}]": (name, content) for i, (name, content) in enumerate(files)},
+            }
+        else:
+            request_args = {'json': payload}
+        for attempt in range(self.max_retries + 1):
+            with get_metrics().timer('discord_request') as sample:
+                response = get_session('discord').post(
+                    self.webhook_url,
+                    timeout=(HTTP_CONNECT_TIMEOUT, DISCORD_READ_TIMEOUT),
+                    **request_args
+                )
+                sample['bytes'] = response_size(response)
+                sample['error'] = response.status_code >= 400
+            if response.status_code == 429 and attempt < self.max_retries:
+                time.sleep(self._retry_after(response))
+                continue
+            response.raise_for_status()
+            # bucket ของ webhook หมดแล้ว ให้รอจน reset ก่อนส่งข้อความถัดไป
+            if response.headers.get('X-RateLimit-Remaining') == '0':
+                reset_after = parse_retry_after(response.headers.get('X-RateLimit-Reset-After'))
+                if reset_after:
+                    time.sleep(reset_after)
+            return
+
+    @staticmethod
+    def _retry_after(response):
+        """อ่านเวลาที่ต้องรอจาก body (retry_after) หรือ header Retry-After ของ 429"""
+        try:
+            retry_after = float(response.json().get('retry_after'))
+        except (ValueError, TypeError, AttributeError):
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+        return retry_after if retry_after is not None else 1.0
+
+_sender = None
+_sender_lock = threading.Lock()
+
+def get_discord_sender():
+    """คืน DiscordSender ที่ใช้ร่วมกันทั้ง process"""
+    global _sender
+    with _sender_lock:
+        if _sender is None:
+            _sender = DiscordSender()
+        return _sender
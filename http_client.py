@@ -0,0 +1,41 @@
+# http_client.py
+# requests.Session ระดับ module เพื่อใช้ connection (TCP/TLS) ซ้ำข้ามคำขอและข้าม warm invocation
+
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from config import HTTP_POOL_CONNECTIONS, HTTP_POOL_MAXSIZE
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+def get_session(name, pool_maxsize=HTTP_POOL_MAXSIZE):
+    """
+    รับ requests.Session ที่แคชไว้ตามชื่อ (เช่น 'sabai', 'discord')
+
+    Args:
+        name (str): ชื่อของ session
+        pool_maxsize (int): จำนวน connection สูงสุดต่อ host ควรเท่ากับจำนวน worker ที่ใช้ส่งพร้อมกัน
+
+    Returns:
+        requests.Session: session ที่มี connection pool ตามที่กำหนด
+    """
+    with _sessions_lock:
+        session = _sessions.get(name)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=HTTP_POOL_CONNECTIONS,
+                pool_maxsize=max(1, pool_maxsize)
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[name] = session
+        return session
+
+def close_sessions():
+    """ปิด session ทั้งหมดที่แคชไว้"""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
@@ -2,15 +2,253 @@
 # ฟังก์ชันหลักสำหรับ AWS Lambda
 
 import json
+import time
 
 from config import (
     DEV_DISCORD_USER_IDS,
+    NOTIFY_BURST,
+    NOTIFY_RATE_PER_SECOND,
+    PROFILE_DISCORD_ATTACHMENT,
+    SHARD_BACKEND,
+    SHEET_READ_MODE,
+    TARGET_CONCURRENCY,
     validate_config,
     X_API_KEY
 )
 from logger import Logger, load_discord_user_ids
-from sheets_service import get_sheet_data
-from data_processor import process_sheet_data
+from sheets_service import (
+    get_projected_sheet_data,
+    get_sheet_data,
+    get_sheet_headers,
+    get_sheet_service,
+    invalidate_sheet_clients,
+    iter_sheet_rows
+)
+from http_client import get_session
+from ledger import get_ledger
+from data_processor import process_rows, process_sheet_data
+from deadline import get_deadline, reset_deadline
+from metrics import get_metrics, reset_metrics
+from profiler import PROFILE_MODES, InvocationProfiler
+from rate_limiter import TokenBucket
+from outbox import drain_outbox, outbox_stage, outbox_watermark, scan_to_outbox
+from sharding import collect_due_rows, coordinate, run_shard, wants_sharding
+from single_row import parse_row_request, process_single_row, select_target
+from targets import load_targets
+from scan_state import plan_scan, record_scan
+
+def preload_clients():
+    """
+    โหลด module และ client ที่ใช้บ่อยไว้ล่วงหน้า (ใช้กับ warm-up event)
+
+    Returns:
+        list: ชื่อ client ที่โหลดสำเร็จ
+    """
+    import pytz
+
+    pytz.timezone('Asia/Bangkok')
+    get_session('sabai')
+    get_session('discord')
+    get_ledger()
+    get_sheet_service()
+    return ['pytz', 'sabai_session', 'discord_session', 'ledger', 'sheets_service']
+
+def process_target(target, logger, rate_limiter=None, stage=None, summary=None):
+    """
+    ประมวลผล target เดียว: วางแผนการสแกน → อ่านชีต → ส่งโนติฯ → บันทึก watermark
+
+    Args:
+        target (Target): spreadsheet/แท็บที่ต้องประมวลผล
+        logger (Logger): Logger สำหรับบันทึก log
+        rate_limiter (TokenBucket, optional): rate limiter ที่ใช้ร่วมกันหลาย target
+        stage (str, optional): stage ของ outbox จาก outbox_stage()
+            "scan" บันทึกแถวที่ต้องส่งลง outbox อย่างเดียว, "drain" ส่งจาก outbox อย่างเดียว,
+            "inline" ทำทั้งสองอย่าง และ None คือส่งโดยตรงแบบเดิม
+        summary (dict, optional): ถ้ากำหนด จะบันทึก 'enqueued' (จำนวนแถวที่ scan stage บันทึกลง outbox) ลงไป
+
+    Returns:
+        tuple: (จำนวนการแจ้งเตือนที่ส่งสำเร็จ, จำนวนที่ล้มเหลว, มีการอัพเดตข้อมูลหรือไม่)
+    """
+    metrics = get_metrics()
+    if stage == "drain":
+        with metrics.timer('drain'):
+            return drain_outbox(target, logger, rate_limiter=rate_limiter)
+
+    # รับข้อมูลจาก Google Sheets (อ่านตั้งแต่ watermark ถ้าเปิดโหมด incremental)
+    with metrics.timer('plan_scan'):
+        start_row = plan_scan(target.spreadsheet_id, target.sheet_name)
+    if start_row:
+        logger.debug("Incremental scan เริ่มจากแถวที่ %s", start_row)
+    run_state = {}
+    scan_hint = None
+    if SHEET_READ_MODE == "projected":
+        # อ่านเฉพาะคอลัมน์สถานะ แล้วอ่านทั้งแถวเฉพาะแถวที่ต้องส่งโนติฯ
+        with metrics.timer('fetch'):
+            sheet_headers, rows, scan_hint = get_projected_sheet_data(
+                start_row=start_row,
+                spreadsheet_id=target.spreadsheet_id,
+                sheet_name=target.sheet_name,
+                columns=target.columns
+            )
+        logger.info(f"เริ่มประมวลผลข้อมูลแบบ projected จำนวนแถวที่ต้องตรวจสอบ: {len(rows)}")
+    elif SHEET_READ_MODE == "paged":
+        # อ่านทีละหน้าระหว่างประมวลผล (เวลาอ่านจึงรวมอยู่ใน stage process/scan)
+        with metrics.timer('fetch'):
+            sheet_headers = get_sheet_headers(
+                refresh=True, spreadsheet_id=target.spreadsheet_id, sheet_name=target.sheet_name
+            )
+        rows = iter_sheet_rows(
+            sheet_headers, start_row=start_row,
+            spreadsheet_id=target.spreadsheet_id, sheet_name=target.sheet_name
+        )
+        if SHARD_BACKEND != "none" and stage is None:
+            # การตัดสินใจแบ่ง shard ต้องรู้จำนวนแถวที่ต้องส่งก่อน: วนหน้าทั้งหมดหนึ่งรอบ
+            # เก็บไว้เฉพาะแถวที่ต้องส่ง (เหมือนโหมด projected) ไม่โหลดทั้งชีตเข้า memory
+            rows, scan_hint = collect_due_rows(sheet_headers, rows, target)
+        logger.info("เริ่มประมวลผลข้อมูลแบบ paged")
+    else:
+        with metrics.timer('fetch'):
+            values = get_sheet_data(
+                start_row=start_row,
+                spreadsheet_id=target.spreadsheet_id,
+                sheet_name=target.sheet_name
+            )
+        sheet_headers = values[0]
+        # outbox และการแบ่ง shard ต้องวนแถวมากกว่าหนึ่งรอบ
+        rows = None
+        if stage is not None or SHARD_BACKEND != "none":
+            rows = list(enumerate(values[1:], start=start_row or 2))
+
+    # ประมวลผลข้อมูล
+    if stage is not None:
+        # outbox: บันทึกแถวที่ต้องส่งลงคิว แล้วส่งทันทีถ้าเป็นโหมด inline
+        with metrics.timer('scan'):
+            enqueued = scan_to_outbox(target, sheet_headers, rows, logger, run_state=run_state, scan_hint=scan_hint)
+        if summary is not None:
+            summary['enqueued'] = enqueued
+        noti_success, noti_failed, has_updates = 0, 0, False
+        if stage == "inline":
+            with metrics.timer('drain'):
+                noti_success, noti_failed, has_updates = drain_outbox(target, logger, rate_limiter=rate_limiter)
+            run_state['watermark'] = outbox_watermark(target, run_state['scan_info'])
+    elif rows is not None and wants_sharding(sheet_headers, rows, target):
+        # แบ่ง shard ให้ worker ถ้ามีแถวที่ต้องส่งมาก
+        with metrics.timer('process'):
+            noti_success, noti_failed, has_updates = coordinate(
+                target, sheet_headers, rows, logger, run_state=run_state, scan_hint=scan_hint
+            )
+    elif SHEET_READ_MODE in ("projected", "paged"):
+        with metrics.timer('process'):
+            noti_success, noti_failed, has_updates = process_rows(
+                sheet_headers, rows, logger, run_state=run_state, scan_hint=scan_hint,
+                target=target, rate_limiter=rate_limiter
+            )
+    else:
+        with metrics.timer('process'):
+            noti_success, noti_failed, has_updates = process_sheet_data(
+                values, logger, first_row=start_row or 2, run_state=run_state,
+                target=target, rate_limiter=rate_limiter
+            )
+    if run_state.get('watermark') is None:
+        run_state['watermark'] = start_row or 2
+    resume_row = run_state.get('resume_row')
+    if resume_row is not None:
+        # หยุดก่อนหมดเวลา: บันทึก checkpoint ให้รอบถัดไปทำต่อจากแถวนี้
+        get_deadline().stop(target.name, resume_row)
+        logger.info(f"บันทึก checkpoint รอบถัดไปจะทำต่อจากแถวที่ {resume_row}")
+    record_scan(
+        run_state.get('watermark'), full_scan=start_row is None,
+        spreadsheet_id=target.spreadsheet_id, sheet_name=target.sheet_name,
+        resume_row=resume_row
+    )
+    return noti_success, noti_failed, has_updates
+
+def run_targets(targets, logger, stage=None):
+    """
+    ประมวลผลหลาย target พร้อมกัน (ไม่เกิน TARGET_CONCURRENCY) โดยใช้ connection pool, Sheets service
+    และ rate limiter ของ SABAI API ร่วมกัน ข้อผิดพลาดของ target หนึ่งไม่กระทบ target อื่น
+
+    Args:
+        targets (list): รายการ Target
+        logger (Logger): Logger สำหรับบันทึก log
+        stage (str, optional): stage ของ outbox (ดู process_target)
+
+    Returns:
+        list: ผลลัพธ์ราย target ตามลำดับเดิม
+            [{'target', 'success', 'noti_success', 'noti_failed', 'has_updates', 'enqueued', 'error'}]
+    """
+    import traceback
+    from concurrent.futures import ThreadPoolExecutor
+
+    rate_limiter = TokenBucket(NOTIFY_RATE_PER_SECOND, NOTIFY_BURST)
+
+    def run(target):
+        target_logger = logger.child(target.name)
+        summary = {'enqueued': 0}
+        try:
+            noti_success, noti_failed, has_updates = process_target(
+                target, target_logger, rate_limiter, stage, summary=summary
+            )
+            return {
+                'target': target.name,
+                'success': True,
+                'noti_success': noti_success,
+                'noti_failed': noti_failed,
+                'has_updates': has_updates,
+                'enqueued': summary['enqueued'],
+                'error': None
+            }
+        except Exception as e:
+            target_logger.error(f"เกิดข้อผิดพลาด: {str(e)}")
+            target_logger.debug(lambda: f"Stack trace:\n{traceback.format_exc()}")
+            return {
+                'target': target.name,
+                'success': False,
+                'noti_success': 0,
+                'noti_failed': 0,
+                'has_updates': False,
+                'enqueued': summary['enqueued'],
+                'error': str(e)
+            }
+
+    logger.info(f"ประมวลผล {len(targets)} target (พร้อมกันสูงสุด {TARGET_CONCURRENCY})")
+    with ThreadPoolExecutor(max_workers=max(1, min(TARGET_CONCURRENCY, len(targets))), thread_name_prefix="target") as pool:
+        return list(pool.map(run, targets))
+
+def stop_profiler(profiler, logger):
+    """
+    หยุด profiler แล้วแนบผลฉบับเต็มไปกับ log ของ Discord (ถ้าเปิด PROFILE_DISCORD_ATTACHMENT)
+
+    Returns:
+        dict: สรุปผล profile สำหรับใส่ใน response หรือ None ถ้าไม่ได้ profile
+    """
+    if profiler is None:
+        return None
+    report = profiler.stop()
+    logger.info(f"Profile ({report['mode']}) ใช้เวลา {report['duration_ms']} ms")
+    if PROFILE_DISCORD_ATTACHMENT:
+        logger.attach(f"profile-{report['mode']}.txt", profiler.render_text())
+    return report
+
+def finish_response(status_code, body, metrics, started_at, include_metrics=False):
+    """
+    บันทึกเวลารวมของ handler, พิมพ์ metrics เป็น EMF แล้วสร้าง response
+
+    Args:
+        status_code (int): HTTP status code
+        body (dict): ข้อมูลที่จะส่งกลับ
+        metrics (Metrics): metrics ของ invocation นี้
+        started_at (float): เวลาเริ่ม handler จาก time.perf_counter()
+        include_metrics (bool): แนบสรุป metrics ไปใน body ด้วยหรือไม่
+
+    Returns:
+        dict: response ของ Lambda
+    """
+    metrics.record('handler', (time.perf_counter() - started_at) * 1000, error=status_code >= 500)
+    metrics.emit_emf()
+    if include_metrics:
+        body['metrics'] = metrics.summary()
+    return {'statusCode': status_code, 'body': json.dumps(body)}
 
 def lambda_handler(event, context):
     """
@@ -23,6 +261,14 @@ def lambda_handler(event, context):
     Returns:
         dict: ผลลัพธ์การทำงาน
     """
+    # Warm-up event (เช่น {"warmup": true} จาก EventBridge) แค่โหลด client ไว้ล่วงหน้าแล้วจบ
+    if event and event.get("warmup"):
+        try:
+            loaded = preload_clients()
+            return {"statusCode": 200, "body": json.dumps({"success": True, "message": "warmed", "loaded": loaded})}
+        except Exception as e:
+            return {"statusCode": 500, "body": json.dumps({"success": False, "message": f"warm-up failed: {str(e)}"})}
+
     headers = event.get("headers") or {}
     provided_api_key = headers.get("x-api-key")
 
@@ -39,6 +285,21 @@ def lambda_handler(event, context):
     if query_params.get("verbose") == "true":
         verbose_mode = True
     
+    # แนบสรุป metrics ของแต่ละ stage ไปกับ response ถ้าขอมา
+    include_metrics = headers.get("metrics") == "true" or query_params.get("metrics") == "true"
+    started_at = time.perf_counter()
+    metrics = reset_metrics()
+    # หยุดรับแถวใหม่เมื่อเวลาที่เหลือของ invocation น้อยกว่า DEADLINE_SAFETY_MARGIN_SECONDS
+    deadline = reset_deadline(context)
+
+    # profile การทำงานของ invocation นี้ (profile=cpu หรือ profile=mem)
+    profile_mode = (headers.get("profile") or query_params.get("profile") or "").lower()
+
+    # ล้าง credentials ที่แคชไว้เมื่อมีการ rotate secret
+    if (headers.get("refresh-credentials") == "true"
+            or query_params.get("refresh_credentials") == "true"):
+        invalidate_sheet_clients()
+    
     # โหลด Discord user IDs
     discord_user_ids = load_discord_user_ids()
     
@@ -50,34 +311,102 @@ def lambda_handler(event, context):
     else:
         logger.debug("📝 Normal mode - จะแสดงเฉพาะ log ที่สำคัญ")
 
+    # Worker ของ coordinator: ประมวลผลเฉพาะแถวใน shard แล้วคืนผลพร้อม log (coordinator เป็นผู้ส่ง Discord)
+    if event.get("shard"):
+        try:
+            validate_config()
+            result = run_shard(event["shard"], logger)
+        except Exception as e:
+            result = {'shard': event["shard"].get('index'), 'success': False, 'error': str(e)}
+        result['logs'] = list(logger.logs)
+        return finish_response(200 if result['success'] else 500, result, metrics, started_at, include_metrics)
+
+    profiler = None
+    if profile_mode in PROFILE_MODES:
+        profiler = InvocationProfiler(profile_mode).start()
+    elif profile_mode:
+        logger.info(f"ไม่รู้จัก profile mode '{profile_mode}' (รองรับ: {', '.join(PROFILE_MODES)}) ข้ามการ profile")
+    profile_report = None
+
     try:
         # ตรวจสอบค่า configuration
         validate_config()
 
-        # รับข้อมูลจาก Google Sheets
-        values = get_sheet_data()
-        
-        # ประมวลผลข้อมูล
-        noti_success, noti_failed, has_updates = process_sheet_data(values, logger)
+        # โหลดรายการ spreadsheet/แท็บที่ต้องประมวลผล
+        targets = load_targets(event)
+        stage = outbox_stage(event)
+        # แถวที่เปลี่ยนจาก event (เช่น Apps Script onEdit) ประมวลผลเฉพาะแถวนั้น
+        row_request = parse_row_request(event)
+        target_results = None
+        failed_targets = []
+        summary = {'enqueued': 0}
+        if row_request is not None:
+            noti_success, noti_failed, has_updates = process_single_row(
+                select_target(targets, row_request), row_request, logger
+            )
+        elif len(targets) == 1:
+            noti_success, noti_failed, has_updates = process_target(targets[0], logger, stage=stage, summary=summary)
+        else:
+            target_results = run_targets(targets, logger, stage)
+            failed_targets = [result for result in target_results if not result['success']]
+            if len(failed_targets) == len(targets):
+                raise Exception(f"ประมวลผลไม่สำเร็จทุก target: {failed_targets[0]['error']}")
+            noti_success = sum(result['noti_success'] for result in target_results)
+            noti_failed = sum(result['noti_failed'] for result in target_results)
+            has_updates = any(result['has_updates'] for result in target_results)
+            summary['enqueued'] = sum(result['enqueued'] for result in target_results)
+        # scan stage ไม่ได้ส่งโนติฯ เอง: รายงานจำนวนแถวที่บันทึกลง outbox แทน
+        scan_only = stage == "scan" and row_request is None
+        enqueued = summary['enqueued'] if scan_only else 0
 
         # แท็กผู้ใช้เฉพาะเมื่อมีการอัพเดตข้อมูล
-        if has_updates:
-            logger.print(f"ส่งโนติฯ Payment Link สำเร็จ {noti_success} รายการ, ล้มเหลว {noti_failed} รายการ")
-            if noti_failed > 0:
-                logger.send_to_discord(discord_user_ids + DEV_DISCORD_USER_IDS)  # ส่งโนติฯ ไปที่ Discord พร้อมแท็กผู้ใช้
+        profile_report = stop_profiler(profiler, logger)
+
+        with metrics.timer('discord_flush'):
+            if deadline.stopped:
+                resume_at = ", ".join(
+                    f"{name} แถวที่ {row_num}" if len(targets) > 1 else f"แถวที่ {row_num}"
+                    for name, row_num in deadline.stopped_rows
+                )
+                logger.print(f"⏱️ หยุดก่อนหมดเวลาของ Lambda (ผลลัพธ์บางส่วน) รอบถัดไปจะทำต่อจาก {resume_at}")
+            if failed_targets:
+                logger.print(f"ประมวลผลไม่สำเร็จ {len(failed_targets)} จาก {len(targets)} target")
+            if has_updates:
+                logger.print(f"ส่งโนติฯ Payment Link สำเร็จ {noti_success} รายการ, ล้มเหลว {noti_failed} รายการ")
+                if noti_failed > 0 or failed_targets:
+                    logger.send_to_discord(discord_user_ids + DEV_DISCORD_USER_IDS)  # ส่งโนติฯ ไปที่ Discord พร้อมแท็กผู้ใช้
+                else:
+                    logger.send_to_discord(discord_user_ids)  # ส่งโนติฯ ไปที่ Discord พร้อมแท็กผู้ใช้
+            elif enqueued:
+                logger.print(f"บันทึกแถวที่ต้องส่งโนติฯ ลง outbox {enqueued} รายการ (รอ drain stage ส่ง)")
+                logger.send_to_discord(DEV_DISCORD_USER_IDS if failed_targets else None)
+            elif failed_targets:
+                logger.print("ไม่พบข้อมูลที่ต้องส่งโนติฯ")
+                logger.send_to_discord(DEV_DISCORD_USER_IDS)
+            elif deadline.stopped:
+                logger.send_to_discord()
+            elif row_request is not None:
+                # แถวที่แก้ไขยังไม่เข้าเงื่อนไข ไม่ต้องแจ้ง Discord ทุกครั้งที่มีการแก้ชีต
+                logger.print(f"แถวที่ {row_request['row_num']} ไม่ต้องส่งโนติฯ")
             else:
-                logger.send_to_discord(discord_user_ids)  # ส่งโนติฯ ไปที่ Discord พร้อมแท็กผู้ใช้
-        else:
-            logger.print("ไม่พบข้อมูลที่ต้องส่งโนติฯ")
-            logger.send_to_discord()  # ไม่ต้องแท็กผู้ใช้ถ้าไม่มีการอัพเดต
+                logger.print("ไม่พบข้อมูลที่ต้องส่งโนติฯ")
+                logger.send_to_discord()  # ไม่ต้องแท็กผู้ใช้ถ้าไม่มีการอัพเดต
         
-        return {
-            'statusCode': 200,
-            'body': json.dumps({
-                'success': True,
-                'message': f'ส่งโนติฯ Payment Link สำเร็จ {noti_success} รายการ, ล้มเหลว {noti_failed} รายการ',
-            })
+        body = {
+            'success': True,
+            'message': f'ส่งโนติฯ Payment Link สำเร็จ {noti_success} รายการ, ล้มเหลว {noti_failed} รายการ',
         }
+        if scan_only:
+            body['message'] = f'บันทึกแถวที่ต้องส่งโนติฯ ลง outbox {enqueued} รายการ'
+            body['enqueued'] = enqueued
+        if target_results is not None:
+            body['targets'] = target_results
+        if deadline.stopped:
+            body['partial'] = True
+            body['resume'] = [{'target': name, 'row': row_num} for name, row_num in deadline.stopped_rows]
+        if profile_report is not None:
+            body['profile'] = profile_report
+        return finish_response(200, body, metrics, started_at, include_metrics)
     
     except Exception as e:
         import traceback
@@ -85,14 +414,15 @@ def lambda_handler(event, context):
         error_traceback = traceback.format_exc()
         logger.print(f"🚨🚨🚨\nเกิดข้อผิดพลาด: {error_message}")
         logger.print(f"Stack trace:\n{error_traceback}")
+        profile_report = profile_report or stop_profiler(profiler, logger)
         logger.send_to_discord(DEV_DISCORD_USER_IDS)
-        return {
-            'statusCode': 500,
-            'body': json.dumps({
-                'success': False,
-                'message': f'เกิดข้อผิดพลาด: {error_message}'
-            })
+        body = {
+            'success': False,
+            'message': f'เกิดข้อผิดพลาด: {error_message}'
         }
+        if profile_report is not None:
+            body['profile'] = profile_report
+        return finish_response(500, body, metrics, started_at, include_metrics)
 
 # สำหรับการทดสอบในเครื่อง local
 if __name__ == "__main__":
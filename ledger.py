@@ -0,0 +1,88 @@
+# ledger.py
+# บันทึกการส่งโนติฯ ที่สำเร็จ (idempotency ledger) เพื่อไม่ให้ส่ง payment link เดิมซ้ำ
+# เมื่อส่งสำเร็จแล้วแต่เขียนสถานะกลับ Google Sheets ไม่สำเร็จ
+
+import time
+import sqlite3
+import threading
+from config import IDEMPOTENCY_LEDGER, LEDGER_PATH, LEDGER_RETENTION_DAYS
+
+class SendLedger:
+    """
+    Ledger แบบ SQLite โดยใช้ (land_no, payment_link) เป็น key
+
+    ไฟล์เริ่มต้นอยู่ใน /tmp จึงคงอยู่ข้าม warm invocation ของ container เดียวกัน
+    """
+
+    def __init__(self, path=LEDGER_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sent_notifications (
+                land_no TEXT NOT NULL,
+                payment_link TEXT NOT NULL,
+                row_num INTEGER,
+                sent_at REAL NOT NULL,
+                PRIMARY KEY (land_no, payment_link)
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_sent_notifications_sent_at ON sent_notifications (sent_at)"
+        )
+        self._conn.commit()
+
+    def has_sent(self, land_no, payment_link):
+        """ตรวจสอบว่าเคยส่งโนติฯ ของ (land_no, payment_link) นี้สำเร็จแล้วหรือไม่"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT 1 FROM sent_notifications WHERE land_no = ? AND payment_link = ?",
+                (land_no or "", payment_link or "")
+            )
+            return cursor.fetchone() is not None
+
+    def record(self, land_no, payment_link, row_num=None):
+        """บันทึกว่าส่งโนติฯ สำเร็จแล้ว"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sent_notifications (land_no, payment_link, row_num, sent_at) VALUES (?, ?, ?, ?)",
+                (land_no or "", payment_link or "", row_num, time.time())
+            )
+            self._conn.commit()
+
+    def prune(self, retention_days=LEDGER_RETENTION_DAYS):
+        """
+        ลบรายการที่เก่ากว่า retention_days วัน
+
+        Returns:
+            int: จำนวนรายการที่ถูกลบ
+        """
+        cutoff = time.time() - retention_days * 86400
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM sent_notifications WHERE sent_at < ?", (cutoff,))
+            self._conn.commit()
+            return cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+_ledger = None
+_ledger_lock = threading.Lock()
+
+def get_ledger():
+    """
+    คืน ledger ที่ใช้งานอยู่ (เปิดครั้งเดียวต่อ process)
+
+    Returns:
+        SendLedger | None: None ถ้าปิดการใช้งานด้วย IDEMPOTENCY_LEDGER=false
+    """
+    global _ledger
+    if not IDEMPOTENCY_LEDGER:
+        return None
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = SendLedger()
+        return _ledger
@@ -2,100 +2,194 @@
 # คลาส Logger สำหรับการเก็บ log และส่งไปที่ Discord
 
 import json
-import requests
-import pytz
+import time
+from collections import deque
 from datetime import datetime
-from config import DISCORD_WEBHOOK_URL
+from discord_sender import get_discord_sender, split_message
+from config import (
+    DISCORD_CHUNK_SIZE,
+    DISCORD_FLUSH_BUDGET_SECONDS,
+    LOG_BUFFER_SIZE,
+    LOG_FORMAT
+)
 
 class Logger:
-    def __init__(self, verbose=False):
-        self.logs = []
+    def __init__(self, verbose=False, max_entries=LOG_BUFFER_SIZE, log_format=LOG_FORMAT):
+        # Ring buffer: keeps only the newest max_entries entries as (level, message) tuples
+        self.logs = deque(maxlen=max(1, max_entries))
+        self.dropped = 0
+        self.attachments = []
         self.verbose = verbose
+        self.log_format = log_format
         self.log_levels = {
             'ERROR': 0,
             'INFO': 1,
             'DEBUG': 2
         }
+        self._max_level = self.log_levels['DEBUG'] if verbose else self.log_levels['INFO']
     
-    def _log(self, message, level='INFO'):
-        """Internal logging method with level support"""
-        print(message)
-        log_entry = {
-            'message': str(message),
-            'level': level
-        }
-        self.logs.append(log_entry)
+    @property
+    def debug_enabled(self):
+        """True when DEBUG entries are recorded (verbose mode)"""
+        return self._max_level >= self.log_levels['DEBUG']
+    
+    def _log(self, prefix, message, args, level='INFO'):
+        """
+        Internal logging method with level support
+
+        The message is only formatted when the level is enabled: format arguments are
+        applied with the % operator and callables are invoked to build the message.
+        """
+        if self.log_levels[level] > self._max_level:
+            return
+        if callable(message):
+            message = message()
+        elif args:
+            message = message % args
+        text = f"{prefix} {message}"
+        if self.log_format == 'json':
+            print(json.dumps({'ts': round(time.time(), 3), 'level': level, 'message': str(message)}, ensure_ascii=False))
+        else:
+            print(text)
+        if len(self.logs) == self.logs.maxlen:
+            self.dropped += 1
+        self.logs.append((level, text))
     
-    def error(self, message):
+    def error(self, message, *args):
         """Log error messages (always sent to Discord)"""
-        self._log(f"❌ {message}", 'ERROR')
+        self._log("❌", message, args, 'ERROR')
     
-    def info(self, message):
+    def info(self, message, *args):
         """Log info messages (always sent to Discord)"""
-        self._log(f"ℹ️ {message}", 'INFO')
+        self._log("ℹ️", message, args, 'INFO')
     
-    def debug(self, message):
-        """Log debug messages (sent only in verbose mode)"""
-        self._log(f"🔍 {message}", 'DEBUG')
+    def debug(self, message, *args):
+        """Log debug messages (dropped immediately unless verbose mode is on)"""
+        if self._max_level < 2:  # DEBUG disabled: skip formatting entirely
+            return
+        self._log("🔍", message, args, 'DEBUG')
     
-    def print(self, message):
+    def print(self, message, *args):
         """Legacy method for backward compatibility"""
-        self.info(message)
+        self.info(message, *args)
+    
+    def extend(self, entries, prefix=""):
+        """
+        Append (level, message) entries recorded by another Logger (e.g. a shard worker)
+        without printing them again
+        """
+        for level, text in entries:
+            if self.log_levels.get(level, 0) > self._max_level:
+                continue
+            if len(self.logs) == self.logs.maxlen:
+                self.dropped += 1
+            self.logs.append((level, f"{prefix} {text}" if prefix else text))
+    
+    def child(self, name):
+        """Return a logger that prefixes every message with [name] and writes into this logger's buffer"""
+        return PrefixedLogger(self, f"[{name}]")
+    
+    def attach(self, filename, content):
+        """Attach a text file to the next Discord log message"""
+        self.attachments.append((filename, content.encode("utf-8")))
     
     def get_log_text(self):
         """Get filtered log text based on verbose setting"""
         if self.verbose:
             # Verbose mode: return all logs
-            return "\n".join([log['message'] for log in self.logs])
+            lines = [message for _, message in self.logs]
         else:
             # Normal mode: return only ERROR and INFO logs
-            filtered_logs = [
-                log['message'] for log in self.logs 
-                if log['level'] in ['ERROR', 'INFO']
+            lines = [
+                message for level, message in self.logs 
+                if level in ('ERROR', 'INFO')
             ]
-            return "\n".join(filtered_logs)
+        if self.dropped:
+            lines.insert(0, f"... (ตัด log เก่าออก {self.dropped} รายการ)")
+        return "\n".join(lines)
     
-    def send_to_discord(self, user_ids=None):
+    def send_to_discord(self, user_ids=None, flush_timeout=DISCORD_FLUSH_BUDGET_SECONDS):
+        """
+        Queue the log (and optional user mentions) for the background Discord sender,
+        then wait at most flush_timeout seconds for delivery
+
+        Returns:
+            bool: True if every message was delivered within the budget
+        """
         log_text = self.get_log_text()
         if not log_text:
-            return
+            return True
         
-        # แบ่งข้อความถ้ายาวเกิน 2000 ตัวอักษร (ข้อจำกัดของ Discord)
-        chunks = [log_text[i:i+1900] for i in range(0, len(log_text), 1900)]
+        # แบ่งข้อความตามบรรทัดถ้ายาวเกิน 2000 ตัวอักษร (ข้อจำกัดของ Discord)
+        chunks = split_message(log_text, DISCORD_CHUNK_SIZE)
         
         # รับเวลาปัจจุบันในรูปแบบ timezone ของไทย
+        import pytz
         thai_tz = pytz.timezone('Asia/Bangkok')
         timestamp = datetime.now(thai_tz).strftime("%Y-%m-%d %H:%M:%S")
         
+        sender = get_discord_sender()
+        
         # ส่งข้อความแรกพร้อมกับ log
         first_message = f"**SABAI Payment Link Notification Log - {timestamp}**\n```\n{chunks[0]}\n```"
-        payload = {"content": first_message}
-        try:
-            response = requests.post(DISCORD_WEBHOOK_URL, json=payload)
-            response.raise_for_status()
-        except Exception as e:
-            print(f"Error sending to Discord: {e}")
+        sender.send({"content": first_message}, files=self.attachments or None)
+        self.attachments = []
         
         # ส่งข้อความต่อไป (ถ้ามี)
         for i in range(1, len(chunks)):
             message = f"**Continued ({i+1}/{len(chunks)}):**\n```\n{chunks[i]}\n```"
-            payload = {"content": message}
-            try:
-                response = requests.post(DISCORD_WEBHOOK_URL, json=payload)
-                response.raise_for_status()
-            except Exception as e:
-                print(f"Error sending to Discord: {e}")
+            sender.send({"content": message})
         
         # แท็กผู้ใช้ Discord (ถ้ามี)
         if user_ids and len(user_ids) > 0:
             mentions = " ".join([f"<@{user_id}>" for user_id in user_ids])
-            notification_message = f"cc {mentions}"
-            payload = {"content": notification_message}
-            try:
-                response = requests.post(DISCORD_WEBHOOK_URL, json=payload)
-                response.raise_for_status()
-            except Exception as e:
-                print(f"Error sending mentions to Discord: {e}")
+            sender.send({"content": f"cc {mentions}"})
+        
+        delivered = sender.flush(flush_timeout)
+        if not delivered:
+            print(f"Discord log ยังส่งไม่ครบภายใน {flush_timeout} วินาที จะส่งต่อใน background")
+        return delivered
+
+class PrefixedLogger:
+    """
+    View of a Logger that prefixes every message (e.g. with the target name)
+    Formatting stays lazy: the prefixed message is only built when the level is enabled.
+    """
+
+    def __init__(self, parent, prefix):
+        self.parent = parent
+        self.prefix = prefix
+
+    @property
+    def debug_enabled(self):
+        return self.parent.debug_enabled
+
+    def _prefixed(self, message, args):
+        if callable(message):
+            return lambda: f"{self.prefix} {message()}"
+        if args:
+            return lambda: f"{self.prefix} {message % args}"
+        return f"{self.prefix} {message}"
+
+    def error(self, message, *args):
+        self.parent.error(self._prefixed(message, args))
+
+    def info(self, message, *args):
+        self.parent.info(self._prefixed(message, args))
+
+    def debug(self, message, *args):
+        if not self.parent.debug_enabled:
+            return
+        self.parent.debug(self._prefixed(message, args))
+
+    def print(self, message, *args):
+        self.info(message, *args)
+
+    def extend(self, entries, prefix=""):
+        self.parent.extend(entries, f"{self.prefix} {prefix}".rstrip())
+
+    def attach(self, filename, content):
+        self.parent.attach(filename, content)
 
 def load_discord_user_ids():
     """โหลด Discord user IDs จากไฟล์ JSON"""
@@ -0,0 +1,134 @@
+# metrics.py
+# เก็บเวลาที่ใช้ของแต่ละ stage และการเรียก API ภายนอก แล้วพิมพ์ออกเป็น CloudWatch Embedded Metric Format (EMF)
+
+import json
+import math
+import time
+import threading
+from contextlib import contextmanager
+from config import METRICS_ENABLED, METRICS_NAMESPACE
+
+def percentile(sorted_values, percent):
+    """คำนวณ percentile แบบ nearest-rank จากรายการที่เรียงแล้ว"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(percent / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+class Metrics:
+    """เก็บ duration (ms), จำนวนไบต์ และจำนวน error แยกตามชื่อ stage (thread-safe)"""
+
+    def __init__(self, namespace=METRICS_NAMESPACE, enabled=METRICS_ENABLED):
+        self.namespace = namespace
+        self.enabled = enabled
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, duration_ms, bytes_transferred=0, error=False):
+        """บันทึกการทำงาน 1 ครั้งของ stage"""
+        if not self.enabled:
+            return
+        with self._lock:
+            stage = self._stages.setdefault(name, {'durations': [], 'bytes': 0, 'errors': 0})
+            stage['durations'].append(duration_ms)
+            stage['bytes'] += bytes_transferred or 0
+            if error:
+                stage['errors'] += 1
+
+    @contextmanager
+    def timer(self, name):
+        """
+        จับเวลาบล็อกโค้ดแล้วบันทึกเป็น stage name
+
+        Yields:
+            dict: กำหนด 'bytes' เพื่อบันทึกจำนวนไบต์ที่รับส่ง และ 'error' เพื่อนับเป็น error
+                (ถ้าเกิด exception จะนับเป็น error เอง)
+        """
+        sample = {'bytes': 0, 'error': False}
+        started_at = time.perf_counter()
+        error = False
+        try:
+            yield sample
+        except Exception:
+            error = True
+            raise
+        finally:
+            self.record(name, (time.perf_counter() - started_at) * 1000, sample['bytes'], error or sample['error'])
+
+    def summary(self):
+        """
+        สรุปผลแยกตาม stage
+
+        Returns:
+            dict: {stage: {'count', 'p50_ms', 'p95_ms', 'max_ms', 'total_ms', 'bytes', 'errors'}}
+        """
+        with self._lock:
+            stages = {name: dict(stage, durations=sorted(stage['durations'])) for name, stage in self._stages.items()}
+        result = {}
+        for name, stage in stages.items():
+            durations = stage['durations']
+            result[name] = {
+                'count': len(durations),
+                'p50_ms': round(percentile(durations, 50), 2),
+                'p95_ms': round(percentile(durations, 95), 2),
+                'max_ms': round(durations[-1], 2) if durations else 0.0,
+                'total_ms': round(sum(durations), 2),
+                'bytes': stage['bytes'],
+                'errors': stage['errors'],
+            }
+        return result
+
+    def emit_emf(self):
+        """พิมพ์ผลแต่ละ stage เป็น EMF JSON line ลง stdout (CloudWatch Logs จะแปลงเป็น metric เอง)"""
+        if not self.enabled:
+            return
+        timestamp = int(time.time() * 1000)
+        for name, stage in self.summary().items():
+            print(json.dumps({
+                "_aws": {
+                    "Timestamp": timestamp,
+                    "CloudWatchMetrics": [{
+                        "Namespace": self.namespace,
+                        "Dimensions": [["Stage"]],
+                        "Metrics": [
+                            {"Name": "Count", "Unit": "Count"},
+                            {"Name": "P50", "Unit": "Milliseconds"},
+                            {"Name": "P95", "Unit": "Milliseconds"},
+                            {"Name": "Max", "Unit": "Milliseconds"},
+                            {"Name": "Bytes", "Unit": "Bytes"},
+                            {"Name": "Errors", "Unit": "Count"},
+                        ]
+                    }]
+                },
+                "Stage": name,
+                "Count": stage['count'],
+                "P50": stage['p50_ms'],
+                "P95": stage['p95_ms'],
+                "Max": stage['max_ms'],
+                "Bytes": stage['bytes'],
+                "Errors": stage['errors'],
+            }))
+
+_metrics = Metrics()
+
+def get_metrics():
+    """คืน Metrics ของ invocation ปัจจุบัน"""
+    return _metrics
+
+def reset_metrics():
+    """เริ่มเก็บ metrics ใหม่สำหรับ invocation ถัดไป"""
+    global _metrics
+    _metrics = Metrics()
+    return _metrics
+
+def response_size(response):
+    """ประมาณจำนวนไบต์ที่รับส่งจาก requests.Response (body ที่ส่ง + body ที่ได้รับ)"""
+    sent = response.request.body if response.request is not None else None
+    sent_bytes = len(sent) if isinstance(sent, (bytes, str)) else 0
+    return sent_bytes + len(response.content or b"")
+
+def payload_size(payload):
+    """ประมาณจำนวนไบต์ของ JSON payload (ใช้กับ request/response ของ Google Sheets API)"""
+    if not METRICS_ENABLED or payload is None:
+        return 0
+    return len(json.dumps(payload, ensure_ascii=False).encode("utf-8"))
@@ -1,25 +1,136 @@
 # notification.py
 # ฟังก์ชันสำหรับการส่งการแจ้งเตือนไปยัง API
 
+import time
 import requests
+from deadline import get_deadline
+from http_client import get_session
+from metrics import get_metrics, response_size
+from resilience import (
+    NOT_PROCESSED_STATUS_CODES,
+    RETRYABLE_STATUS_CODES,
+    CircuitBreaker,
+    backoff_delay,
+    parse_retry_after
+)
 from config import (
     SABAI_API_URL, 
     SABAI_API_TOKEN, 
+    HTTP_CONNECT_TIMEOUT,
+    SABAI_READ_TIMEOUT,
+    SABAI_MAX_ATTEMPTS,
+    SABAI_RETRY_BASE_DELAY,
+    SABAI_RETRY_MAX_DELAY,
+    SABAI_BREAKER_THRESHOLD,
+    SABAI_BREAKER_RESET_SECONDS,
     NOTIFICATION_TITLE, 
     NOTIFICATION_DESCRIPTION
 )
 
+# ข้อความที่บันทึกในคอลัมน์ Error เมื่อ circuit breaker เปิดอยู่
+CIRCUIT_OPEN_ERROR = "SABAI API ไม่พร้อมใช้งาน (circuit breaker เปิดอยู่) ยังไม่ได้ส่งโนติฯ จะลองใหม่รอบถัดไป"
+
+# ใช้ร่วมกันทุก worker และคงอยู่ข้าม warm invocation
+sabai_breaker = CircuitBreaker(SABAI_BREAKER_THRESHOLD, SABAI_BREAKER_RESET_SECONDS)
+
 def xstr(s):
     """แปลงค่าว่างเป็น None"""
     return None if s in ['', 'null'] else str(s).strip()
 
-def send_notification(row_data, indices):
+def request_not_sent(error):
+    """
+    ตรวจสอบว่าคำขอไม่ถึง server แน่นอน (connect timeout หรือเปิด connection ไม่ได้) จึงลองใหม่ได้โดยไม่ส่งซ้ำ
+    read timeout หรือ connection หลุดหลังส่งคำขอแล้ว server อาจได้รับไปแล้ว จึงไม่นับ
+    """
+    from urllib3.exceptions import NewConnectionError
+
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(error, requests.exceptions.ConnectionError) and isinstance(reason, NewConnectionError)
+
+def attempt_timeout(remaining):
+    """
+    (connect, read) timeout ของคำขอหนึ่งครั้ง ไม่เกินเวลาที่เหลือก่อนถึง safety margin ของ invocation
+    เพื่อให้การส่งที่เริ่มก่อนเส้นตายจบทันเขียนผลและ checkpoint ก่อน Lambda หมดเวลา
+
+    Args:
+        remaining (float | None): วินาทีที่เหลือจาก Deadline.remaining() (None = ไม่มีเส้นตาย)
+    """
+    if remaining is None:
+        return (HTTP_CONNECT_TIMEOUT, SABAI_READ_TIMEOUT)
+    remaining = max(remaining, 0.1)
+    return (min(HTTP_CONNECT_TIMEOUT, remaining), min(SABAI_READ_TIMEOUT, remaining))
+
+def has_time_for_retry(deadline, delay):
+    """True ถ้ายังมีเวลารอ delay วินาทีแล้วลองใหม่ก่อนถึงเส้นตาย"""
+    remaining = deadline.remaining()
+    return remaining is None or remaining > delay
+
+def post_with_retry(payload):
+    """
+    ส่งคำขอไปยัง SABAI API พร้อม retry แบบ exponential backoff
+
+    การส่งโนติฯ ไม่ idempotent จึงลองใหม่เฉพาะเมื่อคำขอไม่ถึง server (connect timeout / เชื่อมต่อไม่ได้)
+    หรือได้ status 429/502/503 (server ยังไม่ได้ประมวลผลคำขอ) โดยใช้ค่า Retry-After ถ้ามี
+    500/504 ไม่ลองใหม่ เพราะ SABAI อาจส่งโนติฯ ไปแล้วก่อนตอบ error
+    (ถ้า Retry-After นานกว่า SABAI_RETRY_MAX_DELAY จะไม่รอและคืน response นั้นเลย)
+    read timeout จะไม่ลองใหม่ เพราะ server อาจได้รับคำขอแล้วและผู้ใช้จะได้โนติฯ ซ้ำ
+    timeout ของแต่ละครั้งและการลองใหม่ถูกจำกัดด้วยเวลาที่เหลือของ invocation (get_deadline())
+
+    Returns:
+        requests.Response: response สุดท้ายที่ได้รับ
+
+    Raises:
+        requests.exceptions.RequestException: เมื่อครบจำนวนครั้งแล้วยังเชื่อมต่อไม่สำเร็จ
+    """
+    deadline = get_deadline()
+    for attempt in range(1, max(1, SABAI_MAX_ATTEMPTS) + 1):
+        is_last_attempt = attempt >= SABAI_MAX_ATTEMPTS
+        try:
+            with get_metrics().timer('sabai_request') as sample:
+                response = get_session('sabai').post(
+                    SABAI_API_URL, 
+                    json=payload, 
+                    headers={"Authorization": SABAI_API_TOKEN},
+                    timeout=attempt_timeout(deadline.remaining())
+                )
+                sample['bytes'] = response_size(response)
+                sample['error'] = response.status_code != 200
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+            if is_last_attempt or not request_not_sent(e):
+                raise
+            delay = backoff_delay(attempt, SABAI_RETRY_BASE_DELAY, SABAI_RETRY_MAX_DELAY)
+            if not has_time_for_retry(deadline, delay):
+                print(f"[send_notification] {type(e).__name__} (ครั้งที่ {attempt}) ใกล้หมดเวลาของ invocation ไม่ลองใหม่")
+                raise
+            print(f"[send_notification] {type(e).__name__} (ครั้งที่ {attempt}) จะลองใหม่ใน {delay:.2f} วินาที")
+            time.sleep(delay)
+            continue
+
+        if response.status_code not in NOT_PROCESSED_STATUS_CODES or is_last_attempt:
+            return response
+
+        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+        if retry_after is not None and retry_after > SABAI_RETRY_MAX_DELAY:
+            print(f"[send_notification] Retry-After {retry_after:.0f} วินาที นานเกินกำหนด ไม่ลองใหม่")
+            return response
+        delay = retry_after if retry_after is not None else backoff_delay(attempt, SABAI_RETRY_BASE_DELAY, SABAI_RETRY_MAX_DELAY)
+        if not has_time_for_retry(deadline, delay):
+            print(f"[send_notification] Response status {response.status_code} (ครั้งที่ {attempt}) ใกล้หมดเวลาของ invocation ไม่ลองใหม่")
+            return response
+        print(f"[send_notification] Response status {response.status_code} (ครั้งที่ {attempt}) จะลองใหม่ใน {delay:.2f} วินาที")
+        time.sleep(delay)
+
+def send_notification(row_data, indices, title=NOTIFICATION_TITLE, description=NOTIFICATION_DESCRIPTION):
     """
     ส่งการแจ้งเตือนไปยัง API
     
     Args:
         row_data (list): ข้อมูลแถวที่ต้องการส่งการแจ้งเตือน
         indices (dict): ดัชนีของคอลัมน์ต่างๆ
+        title (str): หัวข้อของการแจ้งเตือน
+        description (str): รายละเอียดของการแจ้งเตือน
     
     Returns:
         dict: ผลลัพธ์การส่งการแจ้งเตือน
@@ -61,10 +172,10 @@ def send_notification(row_data, indices):
         
         payload = {
             'unit_id': unit_id,
-            'title_en': NOTIFICATION_TITLE,
-            'title_th': NOTIFICATION_TITLE,
-            'description_en': NOTIFICATION_DESCRIPTION,
-            'description_th': NOTIFICATION_DESCRIPTION,
+            'title_en': title,
+            'title_th': title,
+            'description_en': description,
+            'description_th': description,
             'feature': "payment::link",
             'phone': phone,
             'email': email,
@@ -73,14 +184,27 @@ def send_notification(row_data, indices):
         
         print(f"[send_notification] Payload: {payload}")
         
+        # ถ้า SABAI API ล่มต่อเนื่อง ให้ล้มเหลวทันทีโดยไม่ต้องรอ timeout
+        if not sabai_breaker.allow():
+            print(f"[send_notification] {CIRCUIT_OPEN_ERROR}")
+            return {
+                'success': False,
+                'error': CIRCUIT_OPEN_ERROR,
+                'circuit_open': True
+            }
+        
         # ส่งคำขอไปยัง API
         print(f"[send_notification] กำลังส่งคำขอไปยัง: {SABAI_API_URL}")
-        response = requests.post(
-            SABAI_API_URL, 
-            json=payload, 
-            headers={"Authorization": SABAI_API_TOKEN},
-            timeout=30  # เพิ่ม timeout
-        )
+        try:
+            response = post_with_retry(payload)
+        except Exception:
+            sabai_breaker.record_failure()
+            raise
+        
+        if response.status_code in RETRYABLE_STATUS_CODES:
+            sabai_breaker.record_failure()
+        else:
+            sabai_breaker.record_success()
         
         print(f"[send_notification] Response status: {response.status_code}")
         print(f"[send_notification] Response text: {response.text}")
@@ -0,0 +1,446 @@
+# outbox.py
+# Outbox แบบ SQLite: scan stage บันทึกแถวที่ต้องส่งโนติฯ ลงคิว แล้ว drain stage claim ทีละ batch ไปส่งและเขียนกลับชีต
+# แถวที่ claim แล้วมี lease ซึ่งถูกต่ออายุตลอดเวลาที่ worker ยังประมวลผล batch อยู่
+# ถ้า worker ล่มกลางทาง lease จะไม่ถูกต่อ และแถวนั้นจะถูก claim ใหม่เมื่อ lease หมดอายุ
+# (ส่วนการส่งซ้ำป้องกันด้วย idempotency ledger)
+
+import json
+import os
+import time
+import sqlite3
+import threading
+import traceback
+from config import (
+    NOTIFY_BURST,
+    NOTIFY_RATE_PER_SECOND,
+    OUTBOX_BATCH_SIZE,
+    OUTBOX_DRAIN_WORKERS,
+    OUTBOX_LEASE_SECONDS,
+    OUTBOX_MAX_ATTEMPTS,
+    OUTBOX_MODE,
+    OUTBOX_PATH,
+    OUTBOX_RETENTION_DAYS
+)
+from data_processor import iter_rows_to_update, process_rows, stopped_rows
+from deadline import get_deadline
+from rate_limiter import TokenBucket
+from row_schema import compile_schema
+from sheets_service import get_sheet_headers, get_sheet_rows
+
+OUTBOX_STAGES = ("inline", "scan", "drain")
+
+class Outbox:
+    """
+    คิวแถวที่ต้องส่งโนติฯ โดยใช้ (spreadsheet_id, sheet_name, row_num) เป็น key
+
+    status: pending (รอส่ง), sending (claim แล้ว มี lease), sent (ส่งและเขียนกลับแล้ว), failed (ส่งไม่สำเร็จ)
+    ไฟล์เริ่มต้นอยู่ใน /tmp จึงคงอยู่ข้าม warm invocation ของ container เดียวกัน
+    """
+
+    def __init__(self, path=OUTBOX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        # isolation_level=None: จัดการ transaction เอง (BEGIN IMMEDIATE) เพื่อ claim แบบ atomic ข้าม process
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        # ใช้ rollback journal แทน WAL เพราะ WAL ต้องใช้ shared memory ในเครื่องเดียวกัน ใช้กับ EFS/NFS ไม่ได้
+        # (ไฟล์ที่เคยเปิดเป็น WAL จะคงโหมดไว้ จึงต้องตั้งค่ากลับทุกครั้ง)
+        self._conn.execute("PRAGMA journal_mode=DELETE")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                spreadsheet_id TEXT NOT NULL,
+                sheet_name TEXT NOT NULL,
+                row_num INTEGER NOT NULL,
+                cells TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                lease_until REAL,
+                last_error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                UNIQUE (spreadsheet_id, sheet_name, row_num)
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_outbox_claim ON outbox (spreadsheet_id, sheet_name, status, row_num)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_updated_at ON outbox (updated_at)")
+
+    def enqueue(self, spreadsheet_id, sheet_name, rows):
+        """
+        บันทึกแถวที่ต้องส่งลงคิว แถวที่มีอยู่แล้วจะอัพเดตข้อมูลแถว
+        และถ้าเคยเสร็จ (sent/failed) แต่ชีตยังไม่เป็น Done จะกลับเป็น pending เพื่อส่งใหม่
+
+        Args:
+            spreadsheet_id (str): ID ของ spreadsheet
+            sheet_name (str): ชื่อแท็บ
+            rows (list): (แถวใน spreadsheet, ข้อมูลแถว)
+
+        Returns:
+            int: จำนวนแถวที่อยู่ในสถานะ pending หลังบันทึก
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    """
+                    INSERT INTO outbox (spreadsheet_id, sheet_name, row_num, cells, created_at, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (spreadsheet_id, sheet_name, row_num) DO UPDATE SET
+                        cells = excluded.cells,
+                        attempts = CASE WHEN status IN ('sent', 'failed') THEN 0 ELSE attempts END,
+                        status = CASE WHEN status IN ('sent', 'failed') THEN 'pending' ELSE status END,
+                        updated_at = excluded.updated_at
+                    """,
+                    [
+                        (spreadsheet_id, sheet_name, row_num, json.dumps(cells, ensure_ascii=False), now, now)
+                        for row_num, cells in rows
+                    ]
+                )
+                cursor = self._conn.execute(
+                    "SELECT COUNT(*) FROM outbox WHERE spreadsheet_id = ? AND sheet_name = ? AND status = 'pending'",
+                    (spreadsheet_id, sheet_name)
+                )
+                pending = cursor.fetchone()[0]
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return pending
+
+    def claim(self, spreadsheet_id, sheet_name, limit=OUTBOX_BATCH_SIZE, lease_seconds=OUTBOX_LEASE_SECONDS):
+        """
+        Claim แถวที่รอส่ง (หรือที่ lease หมดอายุ) ไม่เกิน limit แถว แล้วตั้ง lease
+
+        Returns:
+            list: [(id, แถวใน spreadsheet, ข้อมูลแถว)] เรียงตามแถว
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # แถวที่ lease หมดอายุครบจำนวนครั้งแล้ว (worker ล่มซ้ำๆ) ให้เลิก claim
+                self._conn.execute(
+                    """
+                    UPDATE outbox SET status = 'failed', last_error = 'lease หมดอายุครบจำนวนครั้ง', updated_at = ?
+                    WHERE spreadsheet_id = ? AND sheet_name = ? AND status = 'sending'
+                        AND lease_until < ? AND attempts >= ?
+                    """,
+                    (now, spreadsheet_id, sheet_name, now, OUTBOX_MAX_ATTEMPTS)
+                )
+                claimed = self._conn.execute(
+                    """
+                    SELECT id, row_num, cells FROM outbox
+                    WHERE spreadsheet_id = ? AND sheet_name = ?
+                        AND (status = 'pending' OR (status = 'sending' AND lease_until < ?))
+                    ORDER BY row_num LIMIT ?
+                    """,
+                    (spreadsheet_id, sheet_name, now, max(1, limit))
+                ).fetchall()
+                self._conn.executemany(
+                    """
+                    UPDATE outbox SET status = 'sending', attempts = attempts + 1, lease_until = ?, updated_at = ?
+                    WHERE id = ?
+                    """,
+                    [(now + lease_seconds, now, item_id) for item_id, _, _ in claimed]
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [(item_id, row_num, json.loads(cells)) for item_id, row_num, cells in claimed]
+
+    def complete(self, outcomes):
+        """
+        บันทึกผลของแถวที่ claim ไป
+
+        Args:
+            outcomes (list): [(id, สำเร็จหรือไม่, ข้อความ error)]
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "UPDATE outbox SET status = ?, last_error = ?, lease_until = NULL, updated_at = ? WHERE id = ?",
+                    [('sent' if success else 'failed', error, now, item_id) for item_id, success, error in outcomes]
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def renew(self, item_ids, lease_seconds=OUTBOX_LEASE_SECONDS):
+        """ต่ออายุ lease ของแถวที่ยัง claim อยู่ (ป้องกัน invocation อื่น claim ซ้ำระหว่างที่ยังส่งไม่เสร็จ)"""
+        lease_until = time.time() + lease_seconds
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "UPDATE outbox SET lease_until = ? WHERE id = ? AND status = 'sending'",
+                    [(lease_until, item_id) for item_id in item_ids]
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def release(self, item_ids):
+        """คืนแถวที่ claim ไปแต่ยังไม่ได้ส่งกลับเข้าคิว (ไม่นับเป็นการพยายามส่ง)"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    """
+                    UPDATE outbox SET status = 'pending', attempts = MAX(attempts - 1, 0), lease_until = NULL, updated_at = ?
+                    WHERE id = ?
+                    """,
+                    [(now, item_id) for item_id in item_ids]
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def first_unsent_row(self, spreadsheet_id, sheet_name):
+        """แถวต่ำสุดในคิวที่ยังไม่ได้ส่งสำเร็จ (ใช้คำนวณ watermark) หรือ None"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT MIN(row_num) FROM outbox WHERE spreadsheet_id = ? AND sheet_name = ? AND status != 'sent'",
+                (spreadsheet_id, sheet_name)
+            )
+            return cursor.fetchone()[0]
+
+    def counts(self, spreadsheet_id, sheet_name):
+        """จำนวนแถวในคิวแยกตาม status"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT status, COUNT(*) FROM outbox WHERE spreadsheet_id = ? AND sheet_name = ? GROUP BY status",
+                (spreadsheet_id, sheet_name)
+            )
+            return dict(cursor.fetchall())
+
+    def prune(self, retention_days=OUTBOX_RETENTION_DAYS):
+        """
+        ลบแถวที่เสร็จแล้ว (sent/failed) ที่เก่ากว่า retention_days วัน
+
+        Returns:
+            int: จำนวนแถวที่ถูกลบ
+        """
+        cutoff = time.time() - retention_days * 86400
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM outbox WHERE status IN ('sent', 'failed') AND updated_at < ?", (cutoff,)
+            )
+            return cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+_outbox = None
+_outbox_lock = threading.Lock()
+
+def get_outbox():
+    """คืน outbox ที่ใช้งานอยู่ (เปิดครั้งเดียวต่อ process)"""
+    global _outbox
+    with _outbox_lock:
+        if _outbox is None:
+            _outbox = Outbox()
+        return _outbox
+
+def outbox_stage(event=None):
+    """
+    stage ของ outbox ที่ต้องทำในรอบนี้: event["outbox"] ("scan", "drain" หรือ "inline") แทนค่าจาก OUTBOX_MODE ได้
+
+    Returns:
+        str | None: None ถ้าไม่ใช้ outbox (ประมวลผลแบบเดิม)
+    """
+    stage = ((event or {}).get("outbox") or OUTBOX_MODE).lower()
+    if stage == "off":
+        return None
+    if stage not in OUTBOX_STAGES:
+        raise ValueError(f"ไม่รองรับ outbox stage: {stage} (รองรับ: off, {', '.join(OUTBOX_STAGES)})")
+    # scan แยกจาก drain คนละ invocation ซึ่งอาจไม่ได้อยู่ container เดียวกัน
+    # คิวใน /tmp ของ container ที่ scan จะไม่ถูก drain และแถวเหล่านั้นจะค้างจนกว่า container นั้นจะถูกใช้อีก
+    if stage == "scan" and not is_shared_path(OUTBOX_PATH):
+        raise ValueError(
+            f"outbox stage scan ต้องตั้ง OUTBOX_PATH ไปที่ storage ที่ใช้ร่วมกันข้าม container (เช่น EFS) "
+            f"ตอนนี้เป็น {OUTBOX_PATH} ซึ่งอยู่เฉพาะ container นี้ (ใช้ OUTBOX_MODE=inline แทนได้)"
+        )
+    return stage
+
+def is_shared_path(path):
+    """ไฟล์ outbox อยู่นอก /tmp (ซึ่งเป็นพื้นที่เฉพาะของแต่ละ container ของ Lambda) หรือไม่"""
+    real_path = os.path.realpath(path)
+    return real_path != "/tmp" and not real_path.startswith("/tmp/")
+
+def scan_to_outbox(target, headers, rows, logger, run_state=None, scan_hint=None):
+    """
+    Scan stage: คัดแถวที่ต้องส่งโนติฯ แล้วบันทึกลง outbox โดยไม่ส่ง
+
+    Args:
+        target (Target): ชีตที่ประมวลผล
+        headers (list): หัวข้อคอลัมน์
+        rows (iterable): (แถวใน spreadsheet, ข้อมูลแถว) เรียงตามลำดับแถว
+        logger (Logger): Logger สำหรับบันทึก log
+        run_state (dict, optional): ถ้ากำหนด จะบันทึก 'watermark' ลงไป (แถวที่ยังไม่ได้ส่งใน outbox นับเป็นยังไม่เสร็จ)
+        scan_hint (dict, optional): 'first_unfinished_row' และ 'last_row' ของแถวที่ไม่ได้ส่งมาใน rows
+
+    Returns:
+        int: จำนวนแถวที่บันทึกลง outbox
+    """
+    schema = compile_schema(headers, target.columns)
+    schema.validate()
+    scan_info = {'first_unfinished_row': None, 'last_row': None, 'candidates': 0}
+    if scan_hint:
+        scan_info['first_unfinished_row'] = scan_hint.get('first_unfinished_row')
+        scan_info['last_row'] = scan_hint.get('last_row')
+    due_rows = [(row.row_num, row.cells) for row in iter_rows_to_update(rows, schema, logger, scan_info)]
+
+    outbox = get_outbox()
+    pending = outbox.enqueue(target.spreadsheet_id, target.sheet_name, due_rows) if due_rows else 0
+    logger.info(f"บันทึกแถวที่ต้องส่งลง outbox {len(due_rows)} แถว (รอส่งทั้งหมด {pending} แถว)")
+
+    if run_state is not None:
+        run_state['scan_info'] = scan_info
+        run_state['watermark'] = outbox_watermark(target, scan_info)
+        run_state['resume_row'] = scan_info.get('deadline_row')
+    return len(due_rows)
+
+def outbox_watermark(target, scan_info):
+    """
+    watermark ของ target เมื่อใช้ outbox: แถวต่ำสุดที่ยังไม่เสร็จในชีตหรือยังไม่ได้ส่งใน outbox
+    หรือแถวถัดจากข้อมูลสุดท้ายถ้าเสร็จทั้งหมด (None ถ้าไม่มีข้อมูล)
+    """
+    unfinished_rows = [
+        row_num for row_num in (
+            scan_info['first_unfinished_row'],
+            get_outbox().first_unsent_row(target.spreadsheet_id, target.sheet_name)
+        ) if row_num is not None
+    ]
+    if unfinished_rows:
+        return min(unfinished_rows)
+    if scan_info['last_row'] is not None:
+        return scan_info['last_row'] + 1
+    return None
+
+def drain_outbox(target, logger, rate_limiter=None, workers=OUTBOX_DRAIN_WORKERS, batch_size=OUTBOX_BATCH_SIZE):
+    """
+    Drain stage: worker หลายตัว claim แถวจาก outbox ทีละ batch อ่านแถวเหล่านั้นใหม่จากชีต
+    แล้วส่งโนติฯ และเขียนกลับด้วย process_rows จนกว่าคิวของ target จะว่าง
+    (cells ที่บันทึกไว้ตอน scan เป็นเพียงข้อมูลอ้างอิง ไม่ได้ใช้ส่ง)
+
+    Args:
+        target (Target): ชีตที่ประมวลผล
+        logger (Logger): Logger สำหรับบันทึก log
+        rate_limiter (TokenBucket, optional): rate limiter ที่ใช้ร่วมกันทุก worker
+        workers (int): จำนวน drain worker
+        batch_size (int): จำนวนแถวที่ claim ต่อครั้ง
+
+    Returns:
+        tuple: (จำนวนการแจ้งเตือนที่ส่งสำเร็จ, จำนวนที่ล้มเหลว, มีการอัพเดตข้อมูลหรือไม่)
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    outbox = get_outbox()
+    pruned = outbox.prune()
+    if pruned:
+        logger.debug("ลบรายการเก่าออกจาก outbox %s รายการ", pruned)
+    headers = get_sheet_headers(spreadsheet_id=target.spreadsheet_id, sheet_name=target.sheet_name)
+    rate_limiter = rate_limiter or TokenBucket(NOTIFY_RATE_PER_SECOND, NOTIFY_BURST)
+    totals = {'noti_success': 0, 'noti_failed': 0, 'has_updates': False}
+    totals_lock = threading.Lock()
+
+    deadline = get_deadline()
+    stopped = threading.Event()
+    finished = threading.Event()
+    # id ของแถวที่ worker แต่ละตัวกำลังประมวลผลอยู่ (ต่ออายุ lease ให้จนกว่าจะเสร็จ)
+    leased = {}
+    leased_lock = threading.Lock()
+
+    def keep_leases():
+        while not finished.wait(OUTBOX_LEASE_SECONDS / 3):
+            with leased_lock:
+                item_ids = [item_id for item_ids in leased.values() for item_id in item_ids]
+            if item_ids:
+                try:
+                    outbox.renew(item_ids)
+                except Exception as e:
+                    logger.error(f"ต่ออายุ lease ของ outbox ไม่สำเร็จ: {str(e)}")
+
+    def drain_worker():
+        worker = threading.get_ident()
+        try:
+            drain_batches(worker)
+        finally:
+            with leased_lock:
+                leased.pop(worker, None)
+
+    def drain_batches(worker):
+        while True:
+            if deadline.expired():
+                # แถวที่ยังไม่ claim คงอยู่ในคิว drain รอบถัดไปทำต่อ
+                stopped.set()
+                return
+            claimed = outbox.claim(target.spreadsheet_id, target.sheet_name, limit=batch_size)
+            if not claimed:
+                return
+            with leased_lock:
+                leased[worker] = [item_id for item_id, _, _ in claimed]
+            logger.debug("Claim แถวจาก outbox %s แถว: %s", len(claimed), [row_num for _, row_num, _ in claimed])
+            run_state = {}
+            try:
+                # อ่านแถวใหม่จากชีตแทนข้อมูลตอน scan: แถวที่ถูกส่งไปแล้วระหว่างนั้น
+                # (โหมดแถวเดียว, container อื่น หรือแก้ด้วยมือ) เป็น Done แล้วจะถูกกรองออก
+                rows = get_sheet_rows(
+                    [row_num for _, row_num, _ in claimed],
+                    spreadsheet_id=target.spreadsheet_id, sheet_name=target.sheet_name
+                )
+                noti_success, noti_failed, has_updates = process_rows(
+                    headers, rows, logger,
+                    run_state=run_state, target=target, rate_limiter=rate_limiter
+                )
+            except Exception as e:
+                # ปล่อยให้ลองใหม่รอบหน้า (แถวยังไม่เป็น Done ในชีต จึงถูก scan กลับเข้าคิว)
+                logger.error(f"Drain outbox ไม่สำเร็จ: {str(e)}")
+                logger.debug(lambda: f"Stack trace:\n{traceback.format_exc()}")
+                outbox.complete([(item_id, False, str(e)) for item_id, _, _ in claimed])
+                with totals_lock:
+                    totals['noti_failed'] += len(claimed)
+                    totals['has_updates'] = True
+                continue
+            failed_rows = set(run_state.get('failed_rows', []))
+            # แถวที่ถูกเลื่อน และแถวที่ filter ยังไม่ได้ตรวจเพราะหยุดที่ deadline_row ต้องกลับเข้าคิว
+            deferred_rows = set(stopped_rows(run_state, [row_num for _, row_num, _ in claimed]))
+            outbox.complete([
+                (item_id, row_num not in failed_rows, "ส่งหรือเขียนกลับไม่สำเร็จ" if row_num in failed_rows else None)
+                for item_id, row_num, _ in claimed if row_num not in deferred_rows
+            ])
+            if deferred_rows:
+                outbox.release([item_id for item_id, row_num, _ in claimed if row_num in deferred_rows])
+            with totals_lock:
+                totals['noti_success'] += noti_success
+                totals['noti_failed'] += noti_failed
+                totals['has_updates'] = totals['has_updates'] or has_updates
+
+    workers = max(1, workers)
+    lease_keeper = threading.Thread(target=keep_leases, name="outbox-lease", daemon=True)
+    lease_keeper.start()
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="outbox") as pool:
+            for future in [pool.submit(drain_worker) for _ in range(workers)]:
+                future.result()
+    finally:
+        finished.set()
+        lease_keeper.join()
+    if stopped.is_set():
+        first_row = outbox.first_unsent_row(target.spreadsheet_id, target.sheet_name)
+        if first_row is not None:
+            logger.info(f"⏱️ ใกล้หมดเวลาของ invocation หยุด drain outbox (ยังเหลือตั้งแต่แถวที่ {first_row})")
+            deadline.stop(target.name, first_row)
+    return totals['noti_success'], totals['noti_failed'], totals['has_updates']
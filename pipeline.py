@@ -0,0 +1,92 @@
+# pipeline.py
+# รันงานแบบ streaming หลาย stage พร้อมกัน (filter → send → write) เชื่อมกันด้วย queue แบบจำกัดขนาด
+
+import queue
+import threading
+
+_END = object()
+
+def run_pipeline(source, send_fn, handle_result, concurrency=1, queue_size=50, on_idle=None, idle_seconds=1.0):
+    """
+    รัน pipeline แบบ 3 stage
+
+    - filter stage: thread ที่วนอ่าน source แล้วส่งงานเข้า send queue
+    - send stage: worker threads จำนวน concurrency ที่เรียก send_fn กับงานแต่ละชิ้น
+    - write stage: thread ที่เรียกฟังก์ชันนี้ จะเรียก handle_result ทีละผลลัพธ์ตามลำดับที่ส่งเสร็จ
+
+    queue ทั้งสองจำกัดขนาดไว้ที่ queue_size ทำให้ stage ที่เร็วกว่าถูกหน่วง (backpressure)
+    และ pipeline จะรอจน stage ทั้งหมดทำงานเสร็จก่อน return
+
+    Args:
+        source (iterable): งานที่ต้องส่ง
+        send_fn (callable): send_fn(item) -> result
+        handle_result (callable): handle_result(item, result, error) โดย error เป็น exception
+            ที่เกิดใน send_fn (ถ้ามี)
+        concurrency (int): จำนวน worker ใน send stage
+        queue_size (int): ขนาดสูงสุดของแต่ละ queue
+        on_idle (callable, optional): เรียกใน write stage เมื่อไม่มีผลลัพธ์ใหม่ภายใน idle_seconds
+            (เช่น flush บัฟเฟอร์ที่ค้างนานระหว่างที่การส่งช้าหรือหยุดนิ่ง)
+        idle_seconds (float): เวลารอผลลัพธ์ก่อนเรียก on_idle
+
+    Raises:
+        Exception: error แรกที่เกิดใน filter stage หรือ write stage (หลังจาก pipeline drain เสร็จแล้ว)
+    """
+    concurrency = max(1, concurrency)
+    send_queue = queue.Queue(maxsize=max(1, queue_size))
+    result_queue = queue.Queue(maxsize=max(1, queue_size))
+    errors = []
+
+    def filter_stage():
+        try:
+            for item in source:
+                send_queue.put(item)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            for _ in range(concurrency):
+                send_queue.put(_END)
+
+    def send_stage():
+        while True:
+            item = send_queue.get()
+            if item is _END:
+                result_queue.put(_END)
+                return
+            try:
+                result_queue.put((item, send_fn(item), None))
+            except Exception as e:
+                result_queue.put((item, None, e))
+
+    threads = [threading.Thread(target=filter_stage, name="pipeline-filter", daemon=True)]
+    threads += [
+        threading.Thread(target=send_stage, name=f"pipeline-send-{i}", daemon=True)
+        for i in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+
+    # write stage: รับผลลัพธ์จนกว่า worker ทุกตัวจะส่งสัญญาณจบ
+    finished_workers = 0
+    while finished_workers < concurrency:
+        try:
+            entry = result_queue.get(timeout=idle_seconds if on_idle is not None else None)
+        except queue.Empty:
+            try:
+                on_idle()
+            except Exception as e:
+                errors.append(e)
+            continue
+        if entry is _END:
+            finished_workers += 1
+            continue
+        try:
+            handle_result(*entry)
+        except Exception as e:
+            # ยังต้อง drain ต่อเพื่อไม่ให้ worker ค้างอยู่ที่ queue
+            errors.append(e)
+
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        raise errors[0]
@@ -0,0 +1,86 @@
+# priority.py
+# จัดลำดับแถวที่ต้องส่งโนติฯ ตามอายุของคำขอ (คอลัมน์ประทับเวลา) เป็นระดับตาม PRIORITY_AGE_TIERS_HOURS
+
+from datetime import datetime
+from itertools import islice
+from config import PRIORITY_AGE_TIERS_HOURS, PRIORITY_TIMESTAMP_FORMATS, PRIORITY_WINDOW_SIZE
+
+def parse_timestamp(value, formats=PRIORITY_TIMESTAMP_FORMATS):
+    """
+    แปลงค่าประทับเวลาจากชีตเป็น datetime (เวลาท้องถิ่น ไม่มี timezone)
+    รองรับปี พ.ศ. (เช่น 1/12/2568) โดยแปลงเป็น ค.ศ.
+
+    Returns:
+        datetime | None: None ถ้าค่าว่างหรือไม่ตรงรูปแบบใด
+    """
+    value = (value or "").strip()
+    if not value:
+        return None
+    for fmt in formats:
+        try:
+            parsed = datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+        if parsed.year > 2400:
+            parsed = parsed.replace(year=parsed.year - 543)
+        return parsed
+    return None
+
+def age_tier(age_hours, tiers=PRIORITY_AGE_TIERS_HOURS):
+    """
+    ระดับความเร่งด่วนของคำขอ (0 = เร่งด่วนที่สุด)
+
+    Args:
+        age_hours (float | None): อายุของคำขอเป็นชั่วโมง (None ถ้าไม่ทราบ)
+        tiers (list): ขอบเขตอายุของแต่ละระดับ เรียงจากมากไปน้อย
+
+    Returns:
+        int: 0 ถึง len(tiers) (คำขอที่ไม่ทราบอายุอยู่ระดับสุดท้าย)
+    """
+    if age_hours is not None:
+        for tier, min_hours in enumerate(tiers):
+            if age_hours >= min_hours:
+                return tier
+    return len(tiers)
+
+def prioritize(rows, schema, logger, now, tiers=PRIORITY_AGE_TIERS_HOURS, window_size=PRIORITY_WINDOW_SIZE):
+    """
+    เรียงแถวที่ต้องส่งตามระดับอายุ (เก่าสุดก่อน) ภายในช่วงละ window_size แถว
+    แถวในระดับเดียวกันคงลำดับเดิมตามชีต
+
+    อ่านจาก filter stage ล่วงหน้าไม่เกิน window_size แถว ไม่ต้องรอคัดแถวครบทั้งชีต
+    จึงเริ่มส่งได้ทันทีและ memory / backpressure ของ pipeline ยังมีขอบเขต
+    (คำขอเก่าที่อยู่คนละ window จะได้ส่งก่อนเฉพาะภายใน window ของตัวเอง)
+
+    Args:
+        rows (iterable): RowView ของแถวที่ต้องส่งโนติฯ
+        schema (ColumnSchema): schema ของคอลัมน์ (ใช้คอลัมน์ประทับเวลา)
+        logger (Logger): Logger สำหรับบันทึก log
+        now (datetime): เวลาปัจจุบัน (เวลาท้องถิ่นเดียวกับค่าในชีต ไม่มี timezone)
+        tiers (list): ขอบเขตอายุของแต่ละระดับ (ชั่วโมง) เรียงจากมากไปน้อย
+        window_size (int): จำนวนแถวสูงสุดที่เรียงรวมกันในแต่ละช่วง
+
+    Yields:
+        RowView: เรียงตามความเร่งด่วนภายในแต่ละ window
+    """
+    counts = [0] * (len(tiers) + 1)
+    rows = iter(rows)
+    while True:
+        ranked = []
+        for row in islice(rows, max(1, window_size)):
+            submitted_at = parse_timestamp(schema.get(row.cells, schema.timestamp))
+            age_hours = (now - submitted_at).total_seconds() / 3600 if submitted_at else None
+            ranked.append((age_tier(age_hours, tiers), row))
+        if not ranked:
+            break
+        # sort แบบ stable: ในระดับเดียวกันยังเรียงตามแถว
+        ranked.sort(key=lambda item: item[0])
+        for tier, row in ranked:
+            counts[tier] += 1
+            yield row
+
+    if any(counts):
+        labels = [f">= {hours:g} ชม." for hours in tiers] + ["ที่เหลือ"]
+        logger.info("จัดลำดับการส่งตามอายุคำขอ: " + ", ".join(
+            f"{label} {count} แถว" for label, count in zip(labels, counts) if count
+        ))
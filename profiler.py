@@ -0,0 +1,154 @@
+# profiler.py
+# โหมด profile ตามคำขอ: "cpu" ใช้ cProfile, "mem" ใช้ tracemalloc แล้วสรุป hotspot อันดับต้นๆ
+
+import io
+import sys
+import time
+import threading
+from config import PROFILE_TOP_N, PROFILE_TRACEBACK_FRAMES
+
+PROFILE_MODES = ("cpu", "mem")
+
+# cProfile ของ Python 3.12 ขึ้นไปจับทุก thread ด้วย profile เดียว (sys.monitoring)
+PER_THREAD_PROFILES = sys.version_info < (3, 12)
+
+class InvocationProfiler:
+    """
+    Profile การทำงานของ invocation หนึ่งครั้ง
+
+    - cpu: cProfile จับทุก thread ของ pipeline (filter, send และ write stage, worker ของ target และ outbox)
+      Python 3.12 ขึ้นไป cProfile ทำงานผ่าน sys.monitoring ซึ่งครอบคลุมทุก thread อยู่แล้วจึงใช้ profile เดียว
+      (และเปิด profile ตัวที่สองพร้อมกันไม่ได้) ส่วนเวอร์ชันก่อนหน้าจะแยก profile ต่อ thread ที่เริ่มหลัง start()
+      แล้วรวมเป็นผลเดียว โดย thread ที่เริ่มไว้ก่อน start() (เช่น Discord sender ที่ทำงานอยู่แล้ว) จะไม่ถูกจับ
+    - mem: tracemalloc จับการจอง memory ของทุก thread แล้วสรุปตามบรรทัดที่จอง
+    """
+
+    def __init__(self, mode, top_n=PROFILE_TOP_N):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"ไม่รองรับ profile mode: {mode}")
+        self.mode = mode
+        self.top_n = top_n
+        self._profile = None
+        self._thread_profiles = []
+        self._thread_profiles_lock = threading.Lock()
+        self._stats = None
+        self._snapshot = None
+        self._peak = 0
+        self._started_at = None
+        self._duration = None
+
+    def start(self):
+        self._started_at = time.perf_counter()
+        if self.mode == "cpu":
+            import cProfile
+            self._profile = cProfile.Profile()
+            if PER_THREAD_PROFILES:
+                # thread ที่เริ่มใหม่จะเรียก _profile_thread ครั้งแรกแล้วเปลี่ยนไปใช้ profile ของตัวเอง
+                threading.setprofile(self._profile_thread)
+            self._profile.enable()
+        else:
+            import tracemalloc
+            tracemalloc.start(max(1, PROFILE_TRACEBACK_FRAMES))
+        return self
+
+    def stop(self):
+        """หยุด profile (เรียกซ้ำได้) แล้วคืนสรุปผล"""
+        if self._duration is None and self._started_at is not None:
+            if self.mode == "cpu":
+                self._profile.disable()
+                if PER_THREAD_PROFILES:
+                    threading.setprofile(None)
+                self._stats = self._merge_stats()
+            else:
+                import tracemalloc
+                self._snapshot = tracemalloc.take_snapshot()
+                _, self._peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+            self._duration = time.perf_counter() - self._started_at
+        return self.report()
+
+    def report(self):
+        """
+        สรุปผล profile
+
+        Returns:
+            dict: {'mode', 'duration_ms', 'top': [...]} และ 'peak_kib' สำหรับโหมด mem
+        """
+        result = {'mode': self.mode, 'duration_ms': round((self._duration or 0) * 1000, 2)}
+        if self.mode == "cpu":
+            result['top'] = [
+                {
+                    'function': f"{file}:{line}({name})",
+                    'calls': calls,
+                    'tottime_ms': round(tottime * 1000, 3),
+                    'cumtime_ms': round(cumtime * 1000, 3),
+                }
+                for (file, line, name), calls, tottime, cumtime in self._cpu_rows()[:self.top_n]
+            ]
+        else:
+            result['peak_kib'] = round(self._peak / 1024, 1)
+            result['top'] = [
+                {
+                    'location': str(stat.traceback[0]),
+                    'size_kib': round(stat.size / 1024, 1),
+                    'count': stat.count,
+                }
+                for stat in self._memory_stats()[:self.top_n]
+            ]
+        return result
+
+    def render_text(self, limit=None):
+        """ผล profile แบบข้อความเต็ม (ใช้เป็นไฟล์แนบใน Discord)"""
+        limit = limit or max(self.top_n, 50)
+        if self.mode == "cpu":
+            stream = io.StringIO()
+            if self._stats is not None:
+                self._stats.stream = stream
+                self._stats.sort_stats('cumulative').print_stats(limit)
+            return stream.getvalue()
+        lines = [f"peak: {self._peak / 1024:.1f} KiB"]
+        for stat in self._memory_stats()[:limit]:
+            lines.append(f"{stat.size / 1024:10.1f} KiB {stat.count:8d} blocks  {stat.traceback[0]}")
+            for frame in list(stat.traceback)[1:]:
+                lines.append(f"{'':30}{frame}")
+        return "\n".join(lines) + "\n"
+
+    def _profile_thread(self, frame, event, arg):
+        """profile function ของ thread ที่เริ่มหลัง start(): สร้าง cProfile ของ thread นั้นแล้วเปิดใช้"""
+        import cProfile
+        profile = cProfile.Profile()
+        with self._thread_profiles_lock:
+            self._thread_profiles.append(profile)
+        profile.enable()
+
+    def _merge_stats(self):
+        """รวมผลของทุก thread เป็น pstats.Stats เดียว (ข้าม profile ที่ไม่มีข้อมูล)"""
+        import pstats
+        merged = None
+        with self._thread_profiles_lock:
+            profiles = [self._profile, *self._thread_profiles]
+        for profile in profiles:
+            profile.create_stats()
+            if not profile.stats:
+                continue
+            if merged is None:
+                merged = pstats.Stats(profile)
+            else:
+                merged.add(profile)
+        return merged
+
+    def _cpu_rows(self):
+        if self._stats is None:
+            return []
+        rows = [
+            (func, calls, tottime, cumtime)
+            for func, (_, calls, tottime, cumtime, _) in self._stats.stats.items()
+        ]
+        rows.sort(key=lambda row: row[3], reverse=True)
+        return rows
+
+    def _memory_stats(self):
+        if self._snapshot is None:
+            return []
+        key_type = 'traceback' if PROFILE_TRACEBACK_FRAMES > 1 else 'lineno'
+        return self._snapshot.statistics(key_type)
@@ -0,0 +1,39 @@
+# rate_limiter.py
+# Token bucket สำหรับคุมอัตราการเรียก API ภายนอก (ใช้ร่วมกันได้หลาย thread)
+
+import time
+import threading
+
+class TokenBucket:
+    """
+    Token bucket แบบ thread-safe
+
+    Args:
+        rate (float): จำนวน token ที่เติมต่อวินาที (<= 0 คือไม่จำกัดอัตรา)
+        burst (int): จำนวน token สูงสุดที่สะสมได้
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def acquire(self, tokens=1):
+        """รอจนกว่าจะมี token พอ แล้วหัก token ออก"""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait_seconds = (tokens - self._tokens) / self.rate
+            time.sleep(wait_seconds)
@@ -0,0 +1,99 @@
+# resilience.py
+# นโยบาย retry แบบ exponential backoff และ circuit breaker สำหรับการเรียก API ภายนอก
+
+import time
+import random
+import threading
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+
+# HTTP status ที่ถือว่าเป็นปัญหาชั่วคราวและควรลองใหม่
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+# status ที่ยืนยันได้ว่า server ยังไม่ได้ประมวลผลคำขอ จึงลองใหม่ได้แม้คำขอไม่ idempotent
+# (500/504 อาจเกิดหลังจากทำงานไปแล้ว เช่น ส่งโนติฯ สำเร็จแต่ตอบกลับไม่ทัน)
+NOT_PROCESSED_STATUS_CODES = (429, 502, 503)
+
+def parse_retry_after(value):
+    """
+    แปลงค่า header Retry-After (วินาที หรือ HTTP-date) เป็นจำนวนวินาที
+
+    Returns:
+        float | None: จำนวนวินาทีที่ต้องรอ หรือ None ถ้าไม่มี/อ่านค่าไม่ได้
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt, base_delay, max_delay):
+    """
+    คำนวณเวลารอก่อนลองใหม่แบบ exponential backoff พร้อม full jitter
+
+    Args:
+        attempt (int): ครั้งที่ลองไปแล้ว (เริ่มจาก 1)
+        base_delay (float): เวลารอพื้นฐาน (วินาที)
+        max_delay (float): เวลารอสูงสุด (วินาที)
+    """
+    return random.uniform(0, min(max_delay, base_delay * (2 ** (attempt - 1))))
+
+class CircuitBreaker:
+    """
+    Circuit breaker แบบ thread-safe
+
+    - closed: ส่งคำขอได้ตามปกติ
+    - open: ล้มเหลวติดกันครบ failure_threshold ครั้ง จะปฏิเสธทันทีจนกว่าจะครบ reset_timeout วินาที
+    - half_open: หลังครบ reset_timeout ยอมให้ส่งทดลองได้ 1 คำขอ ถ้าสำเร็จจะกลับเป็น closed
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=60):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self._state = 'closed'
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        return self._state
+
+    def allow(self):
+        """ตรวจสอบว่าส่งคำขอได้หรือไม่"""
+        with self._lock:
+            if self._state == 'closed':
+                return True
+            if self._state == 'open':
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self._state = 'half_open'
+                self._trial_in_flight = False
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        """บันทึกว่าคำขอสำเร็จ"""
+        with self._lock:
+            self._state = 'closed'
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        """บันทึกว่าคำขอล้มเหลว"""
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._state == 'half_open' or self._failures >= self.failure_threshold:
+                self._state = 'open'
+                self._opened_at = time.monotonic()
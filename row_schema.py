@@ -0,0 +1,148 @@
+# row_schema.py
+# Schema ของคอลัมน์ที่คำนวณครั้งเดียวต่อแถวหัวข้อ และ row view ที่ไม่ต้อง copy ข้อมูลแถว
+
+from functools import lru_cache
+from config import (
+    ERROR_RES,
+    IS_GEN_PAYMENT_LINK, 
+    IS_SEND_NOTI, 
+    PAYMENT_LINK,
+    LAND_NO,
+    PHONE,
+    EMAIL,
+    TIMESTAMP
+)
+
+# หัวข้อคอลัมน์ของแต่ละ field (ค่าเริ่มต้นจาก config) ชีตอื่นกำหนด mapping เองได้ผ่าน Target.columns
+DEFAULT_COLUMNS = {
+    'timestamp': TIMESTAMP,
+    'payment_link': PAYMENT_LINK,
+    'is_gen_payment_link': IS_GEN_PAYMENT_LINK,
+    'is_send_noti': IS_SEND_NOTI,
+    'land_no': LAND_NO,
+    'phone': PHONE,
+    'email': EMAIL,
+    'error': ERROR_RES,
+}
+
+# field ที่ไม่ต้องแสดงใน log เมื่อพบแถวที่ต้องส่งโนติฯ
+HIDDEN_LOG_FIELDS = ('payment_link', 'is_gen_payment_link', 'is_send_noti', 'timestamp')
+
+def find_column_indices(headers, columns=None):
+    """
+    หาตำแหน่งคอลัมน์ที่ต้องการ
+    
+    Args:
+        headers (list): รายการหัวข้อคอลัมน์
+        columns (dict, optional): field -> หัวข้อคอลัมน์ (ค่าเริ่มต้นคือ DEFAULT_COLUMNS)
+    
+    Returns:
+        dict: ดัชนีของคอลัมน์ต่างๆ
+    """
+    fields = {header: field for field, header in (columns or DEFAULT_COLUMNS).items()}
+    indices = {
+        'payment_link': -1,
+        'is_gen_payment_link': -1,
+        'is_send_noti': -1,
+        'land_no': -1,
+        'phone': -1,
+        'email': -1
+    }
+    
+    for i, header in enumerate(headers):
+        field = fields.get(header)
+        if field is not None:
+            indices[field] = i
+    
+    return indices
+
+class ColumnSchema:
+    """
+    ตำแหน่งคอลัมน์ที่คำนวณไว้แล้วจากแถวหัวข้อ ใช้ตรวจสอบแถวโดยไม่ต้องคำนวณ bounds ซ้ำทุกแถว
+
+    Attributes:
+        indices (dict): ผลจาก find_column_indices (ใช้ส่งต่อให้ send_notification)
+        payment_link, is_gen_payment_link, is_send_noti, land_no, phone, email, timestamp, error (int):
+            index ของแต่ละคอลัมน์ (-1 ถ้าไม่พบ)
+        min_length (int): จำนวนคอลัมน์ขั้นต่ำที่แถวต้องมีจึงจะตรวจสอบเงื่อนไขได้
+        display_columns (tuple): (index, หัวข้อ) ของคอลัมน์ที่แสดงใน log
+    """
+
+    __slots__ = (
+        'headers', 'indices', 'payment_link', 'is_gen_payment_link', 'is_send_noti',
+        'land_no', 'phone', 'email', 'timestamp', 'error', 'min_length', 'display_columns'
+    )
+
+    def __init__(self, headers, columns=None):
+        self.headers = tuple(headers)
+        self.indices = find_column_indices(headers, columns)
+        self.payment_link = self.indices['payment_link']
+        self.is_gen_payment_link = self.indices['is_gen_payment_link']
+        self.is_send_noti = self.indices['is_send_noti']
+        self.land_no = self.indices['land_no']
+        self.phone = self.indices['phone']
+        self.email = self.indices['email']
+        self.timestamp = self.indices.get('timestamp', -1)
+        self.error = self.indices.get('error', -1)
+        self.min_length = max(self.payment_link, self.is_gen_payment_link) + 1
+        hidden_headers = {(columns or DEFAULT_COLUMNS).get(field) for field in HIDDEN_LOG_FIELDS}
+        self.display_columns = tuple(
+            (j, header) for j, header in enumerate(self.headers)
+            if header not in hidden_headers
+        )
+
+    def validate(self):
+        """ตรวจสอบว่าพบคอลัมน์ที่จำเป็นหรือไม่"""
+        required_columns = ['payment_link', 'is_gen_payment_link', 'is_send_noti']
+        for col in required_columns:
+            if self.indices[col] == -1:
+                raise Exception(f"ไม่พบคอลัมน์ที่จำเป็น ({col})")
+
+    @staticmethod
+    def get(row, index):
+        """อ่านค่าเซลล์อย่างปลอดภัย คืนค่าว่างถ้าไม่มีคอลัมน์นั้น"""
+        return row[index] if 0 <= index < len(row) else ""
+
+    def is_send_noti_done(self, row):
+        return self.is_send_noti < len(row) and row[self.is_send_noti] == "Done"
+
+    def is_due(self, row):
+        """
+        ตรวจสอบเงื่อนไข: is Gen Payment Link = Done และ Payment Link เริ่มต้นด้วย https://
+        และ is Send Noti ไม่เท่ากับ Done (แถวต้องยาวอย่างน้อย min_length)
+        """
+        return (row[self.is_gen_payment_link] == "Done"
+                and row[self.payment_link].startswith("https://")
+                and not self.is_send_noti_done(row))
+
+@lru_cache(maxsize=32)
+def _compile_schema(headers, column_items):
+    return ColumnSchema(headers, dict(column_items) if column_items else None)
+
+def compile_schema(headers, columns=None):
+    """
+    คืน ColumnSchema ของแถวหัวข้อ (แคชตาม hash ของแถวหัวข้อและ mapping ใช้ซ้ำข้าม invocation ได้)
+
+    Args:
+        headers (list): รายการหัวข้อคอลัมน์
+        columns (dict, optional): field -> หัวข้อคอลัมน์ (ค่าเริ่มต้นคือ DEFAULT_COLUMNS)
+    """
+    return _compile_schema(tuple(headers), tuple(sorted(columns.items())) if columns else None)
+
+class RowView:
+    """
+    มุมมองของแถวที่ต้องส่งโนติฯ โดยไม่ copy ข้อมูลแถวเดิม
+    เก็บเฉพาะเซลล์ที่เปลี่ยน (is Send Noti, timestamp, Error) ไว้ใน changes
+    """
+
+    __slots__ = ('row_num', 'cells', 'changes')
+
+    def __init__(self, row_num, cells):
+        self.row_num = row_num
+        self.cells = cells
+        self.changes = {}
+
+    def set(self, index, value):
+        """บันทึกการเปลี่ยนค่าเซลล์ (ไม่แก้ไขข้อมูลแถวเดิม)"""
+        if index >= 0:
+            self.changes[index] = value
@@ -0,0 +1,127 @@
+# scan_state.py
+# เก็บสถานะการสแกน Google Sheets (watermark) เพื่อให้รอบถัดไปอ่านเฉพาะแถวที่ยังไม่เสร็จ
+
+import os
+import json
+import time
+import threading
+from config import (
+    INCREMENTAL_SCAN,
+    SCAN_STATE_PATH,
+    FULL_RESCAN_INTERVAL_SECONDS,
+    SPREADSHEET_ID,
+    SHEET_NAME
+)
+
+class FileStateStore:
+    """เก็บสถานะเป็นไฟล์ JSON ในเครื่อง (ค่าเริ่มต้นอยู่ใน /tmp ซึ่งคงอยู่ข้าม warm invocation)"""
+
+    def __init__(self, path=SCAN_STATE_PATH):
+        self.path = path
+
+    def load(self):
+        """อ่านสถานะทั้งหมด คืน dict ว่างถ้ายังไม่มีไฟล์หรือไฟล์เสีย"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def save(self, state):
+        """บันทึกสถานะทั้งหมด (เขียนไฟล์ชั่วคราวแล้ว rename เพื่อไม่ให้ไฟล์เสียกลางทาง)"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(state, file, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+_state_store = None
+# record_scan อ่าน-แก้-เขียนไฟล์สถานะทั้งก้อน ต้องทำทีละ thread เมื่อประมวลผลหลาย target พร้อมกัน
+_state_lock = threading.Lock()
+
+def get_state_store():
+    """คืน state store ที่ใช้งานอยู่ (สร้าง FileStateStore ถ้ายังไม่ได้กำหนด)"""
+    global _state_store
+    if _state_store is None:
+        _state_store = FileStateStore()
+    return _state_store
+
+def set_state_store(store):
+    """
+    เปลี่ยน state store ที่ใช้งาน
+
+    Args:
+        store: object ที่มีเมธอด load() -> dict และ save(dict)
+    """
+    global _state_store
+    _state_store = store
+
+def _state_key(spreadsheet_id=SPREADSHEET_ID, sheet_name=SHEET_NAME):
+    return f"{spreadsheet_id}!{sheet_name}"
+
+def plan_scan(spreadsheet_id=SPREADSHEET_ID, sheet_name=SHEET_NAME):
+    """
+    ตัดสินใจว่ารอบนี้ต้องอ่านชีตตั้งแต่แถวไหน
+
+    Returns:
+        int | None: แถวเริ่มต้นสำหรับการอ่านแบบ incremental (หรือแถวที่ต้องทำต่อจากรอบที่หยุดเพราะใกล้หมดเวลา)
+            หรือ None ถ้าต้องสแกนทั้งชีต
+    """
+    entry = get_state_store().load().get(_state_key(spreadsheet_id, sheet_name))
+    # รอบก่อนหยุดรับแถวใหม่เพราะใกล้หมดเวลา ทำต่อจาก checkpoint ก่อน (ใช้ได้แม้ไม่ได้เปิด incremental scan)
+    if entry and entry.get("resume_row"):
+        return int(entry["resume_row"])
+
+    if not INCREMENTAL_SCAN:
+        return None
+    if not entry or not entry.get("watermark"):
+        return None
+
+    # สแกนทั้งชีตเป็นระยะ เผื่อมีแถวเก่าที่ถูกแก้กลับเป็นยังไม่เสร็จ
+    if time.time() - entry.get("last_full_scan_at", 0) >= FULL_RESCAN_INTERVAL_SECONDS:
+        return None
+
+    watermark = int(entry["watermark"])
+    return watermark if watermark > 2 else None
+
+def record_scan(watermark, full_scan, spreadsheet_id=SPREADSHEET_ID, sheet_name=SHEET_NAME, resume_row=None):
+    """
+    บันทึก watermark หลังประมวลผลเสร็จ
+
+    Args:
+        watermark (int): แถวต่ำสุดที่ยังไม่เสร็จ
+        full_scan (bool): รอบนี้เป็นการสแกนทั้งชีตหรือไม่
+        resume_row (int, optional): แถวที่หยุดรับเพราะใกล้หมดเวลา รอบถัดไปจะเริ่มจากแถวนี้
+            (None คือรอบนี้ทำจนจบ ล้าง checkpoint เดิม)
+    """
+    if resume_row is None and (not INCREMENTAL_SCAN or watermark is None):
+        # ไม่มีอะไรต้องบันทึก แต่ยังต้องล้าง checkpoint ที่ค้างจากรอบก่อน (ถ้ามี)
+        _clear_resume_row(spreadsheet_id, sheet_name)
+        return
+
+    with _state_lock:
+        store = get_state_store()
+        state = store.load()
+        key = _state_key(spreadsheet_id, sheet_name)
+        entry = state.get(key, {})
+        if INCREMENTAL_SCAN and watermark is not None:
+            if entry.get("resume_row") and entry.get("watermark"):
+                # รอบนี้ทำต่อจาก checkpoint อ่านเฉพาะแถวตั้งแต่ resume_row จึงต้องคงแถวที่ยังไม่เสร็จก่อนหน้าไว้
+                watermark = min(int(entry["watermark"]), int(watermark))
+            entry["watermark"] = int(watermark)
+            if full_scan:
+                entry["last_full_scan_at"] = time.time()
+        if resume_row is not None:
+            entry["resume_row"] = int(resume_row)
+        else:
+            entry.pop("resume_row", None)
+        entry["updated_at"] = time.time()
+        state[key] = entry
+        store.save(state)
+
+def _clear_resume_row(spreadsheet_id, sheet_name):
+    with _state_lock:
+        store = get_state_store()
+        state = store.load()
+        entry = state.get(_state_key(spreadsheet_id, sheet_name))
+        if entry and entry.pop("resume_row", None) is not None:
+            store.save(state)
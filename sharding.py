@@ -0,0 +1,303 @@
+# sharding.py
+# แบ่งแถวที่ต้องส่งโนติฯ เป็น shard ให้ worker หลายตัวทำพร้อมกัน แล้วรวมผลกลับที่ coordinator
+
+import json
+import traceback
+from config import (
+    DEADLINE_SAFETY_MARGIN_SECONDS,
+    NOTIFY_BURST,
+    NOTIFY_RATE_PER_SECOND,
+    SHARD_BACKEND,
+    SHARD_MAX_WORKERS,
+    SHARD_MIN_ROWS,
+    SHARD_WORKER_FUNCTION,
+    SHARD_WORKER_TIMEOUT_SECONDS,
+    X_API_KEY
+)
+from data_processor import iter_rows_to_update, process_rows, stopped_rows
+from deadline import get_deadline
+from logger import Logger
+from rate_limiter import TokenBucket
+from row_schema import compile_schema
+from sheets_service import get_sheet_headers, get_sheet_rows
+from targets import Target
+
+SHARD_BACKENDS = ("none", "lambda", "process")
+
+class _QuietLogger:
+    """Logger ที่ไม่บันทึกอะไร ใช้ตอน coordinator คัดแถวที่ต้องส่ง (worker จะ log รายละเอียดเอง)"""
+
+    debug_enabled = False
+
+    def error(self, message, *args):
+        pass
+
+    info = debug = print = error
+
+def split_shards(row_nums, shard_count):
+    """
+    แบ่งรายการแถวเป็นช่วงต่อเนื่องที่มีขนาดใกล้เคียงกัน
+
+    Args:
+        row_nums (list): แถวใน spreadsheet เรียงตามลำดับ
+        shard_count (int): จำนวน shard ที่ต้องการ
+
+    Returns:
+        list: รายการ shard (แต่ละ shard คือ list ของแถว) ไม่มี shard ว่าง
+    """
+    shard_count = max(1, min(shard_count, len(row_nums)))
+    size, extra = divmod(len(row_nums), shard_count)
+    shards = []
+    start = 0
+    for i in range(shard_count):
+        end = start + size + (1 if i < extra else 0)
+        if end > start:
+            shards.append(row_nums[start:end])
+        start = end
+    return shards
+
+def count_due_rows(schema, rows):
+    """นับแถวที่ต้องส่งโนติฯ โดยไม่ log (ใช้ตัดสินว่าจะแบ่ง shard หรือไม่)"""
+    min_length = schema.min_length
+    return sum(1 for _, row in rows if len(row) >= min_length and schema.is_due(row))
+
+def collect_due_rows(headers, rows, target):
+    """
+    วนแถวแบบ stream หนึ่งรอบแล้วเก็บไว้เฉพาะแถวที่ต้องส่งโนติฯ
+    ใช้กับการอ่านแบบ paged ที่ต้องตัดสินใจแบ่ง shard โดยไม่โหลดทั้งชีตเข้า memory
+
+    Args:
+        headers (list): หัวข้อคอลัมน์
+        rows (iterable): (แถวใน spreadsheet, ข้อมูลแถว) เรียงตามลำดับแถว
+        target (Target): ชีตที่ประมวลผล
+
+    Returns:
+        tuple: (list ของ (แถวใน spreadsheet, ข้อมูลแถว) ที่ต้องส่ง,
+            scan_hint {'first_unfinished_row', 'last_row', 'deadline_row'} ของแถวทั้งหมดที่วนผ่าน)
+    """
+    schema = compile_schema(headers, target.columns)
+    schema.validate()
+    scan_info = {'first_unfinished_row': None, 'last_row': None, 'candidates': 0}
+    due_rows = [(row.row_num, row.cells) for row in iter_rows_to_update(rows, schema, _QuietLogger(), scan_info)]
+    scan_hint = {key: scan_info.get(key) for key in ('first_unfinished_row', 'last_row', 'deadline_row')}
+    return due_rows, scan_hint
+
+def wants_sharding(headers, rows, target):
+    """
+    ตรวจสอบว่าควรแบ่ง shard หรือไม่: เปิด SHARD_BACKEND และมีแถวที่ต้องส่งอย่างน้อย SHARD_MIN_ROWS แถว
+
+    Args:
+        headers (list): หัวข้อคอลัมน์
+        rows (list): (แถวใน spreadsheet, ข้อมูลแถว)
+        target (Target): ชีตที่ประมวลผล
+    """
+    if SHARD_BACKEND == "none" or SHARD_MAX_WORKERS < 2:
+        return False
+    if SHARD_BACKEND not in SHARD_BACKENDS:
+        raise ValueError(f"ไม่รองรับ SHARD_BACKEND: {SHARD_BACKEND} (รองรับ: {', '.join(SHARD_BACKENDS)})")
+    schema = compile_schema(headers, target.columns)
+    schema.validate()
+    return count_due_rows(schema, rows) >= max(1, SHARD_MIN_ROWS)
+
+def run_shard(shard, logger):
+    """
+    Worker: อ่านแถวของ shard ใหม่จากชีตแล้วประมวลผลด้วย process_rows
+    แถวที่ถูกส่งไปแล้วระหว่างนั้น (is Send Noti = Done) จะถูกกรองออกอีกครั้งจากข้อมูลล่าสุด
+
+    Args:
+        shard (dict): {'index', 'count', 'target', 'rows', 'rate_per_second', 'burst', 'time_budget_seconds'}
+            time_budget_seconds คือเวลาที่ coordinator รอผลได้ worker จะหยุดรับแถวใหม่ก่อนหมดเวลานี้
+        logger (Logger): Logger ของ worker
+
+    Returns:
+        dict: {'shard', 'success', 'noti_success', 'noti_failed', 'has_updates', 'failed_rows', 'resume_row', 'error'}
+            failed_rows รวมแถวที่ยังไม่ได้ทำเพราะใกล้หมดเวลา (resume_row คือแถวแรกในกลุ่มนั้น)
+    """
+    result = {
+        'shard': shard['index'],
+        'success': False,
+        'noti_success': 0,
+        'noti_failed': 0,
+        'has_updates': False,
+        'failed_rows': list(shard['rows']),
+        'resume_row': None,
+        'error': None
+    }
+    try:
+        if shard.get('time_budget_seconds') is not None:
+            # ต้องส่งผลกลับก่อน coordinator หมดเวลา: เผื่อเวลาเขียนข้อมูลค้างเท่ากับ safety margin
+            get_deadline().limit(shard['time_budget_seconds'] - DEADLINE_SAFETY_MARGIN_SECONDS)
+        target = Target.from_dict(shard['target'])
+        headers = get_sheet_headers(
+            refresh=True, spreadsheet_id=target.spreadsheet_id, sheet_name=target.sheet_name
+        )
+        rows = get_sheet_rows(shard['rows'], spreadsheet_id=target.spreadsheet_id, sheet_name=target.sheet_name)
+        rate_limiter = TokenBucket(shard.get('rate_per_second', NOTIFY_RATE_PER_SECOND), shard.get('burst', NOTIFY_BURST))
+        run_state = {}
+        noti_success, noti_failed, has_updates = process_rows(
+            headers, rows, logger, run_state=run_state, target=target, rate_limiter=rate_limiter
+        )
+        unfinished_rows = stopped_rows(run_state, shard['rows'])
+        result.update(
+            success=True,
+            noti_success=noti_success,
+            noti_failed=noti_failed,
+            has_updates=has_updates,
+            failed_rows=sorted(set(run_state.get('failed_rows', [])).union(unfinished_rows)),
+            resume_row=unfinished_rows[0] if unfinished_rows else None
+        )
+    except Exception as e:
+        logger.error(f"เกิดข้อผิดพลาดใน shard {shard['index'] + 1}/{shard['count']}: {str(e)}")
+        logger.debug(lambda: f"Stack trace:\n{traceback.format_exc()}")
+        result['error'] = str(e)
+    return result
+
+def _run_shard_in_process(shard):
+    """จุดเริ่มของ worker ใน process pool: สร้าง Logger ใหม่แล้วคืนผลพร้อม log"""
+    logger = Logger(verbose=shard.get('verbose', False))
+    result = run_shard(shard, logger)
+    result['logs'] = list(logger.logs)
+    return result
+
+def _invoke_lambda_worker(shard):
+    """
+    ส่ง shard ให้ Lambda worker (SHARD_WORKER_FUNCTION) แบบ RequestResponse แล้วคืนผล
+    ไม่ให้ botocore ลองใหม่ (read timeout ค่าเริ่มต้น 60 วินาทีจะ invoke ซ้ำทั้งที่ worker ตัวแรกยังส่งโนติฯ อยู่)
+    และรอได้นานเท่า timeout ของ worker (ไม่เกินเวลาที่ coordinator เหลือ)
+    """
+    import boto3
+    from botocore.config import Config
+
+    wait_seconds = SHARD_WORKER_TIMEOUT_SECONDS
+    if shard.get('time_budget_seconds') is not None:
+        wait_seconds = min(wait_seconds, max(shard['time_budget_seconds'], 1))
+    client = boto3.client('lambda', config=Config(
+        read_timeout=wait_seconds + 10,
+        retries={'max_attempts': 0}
+    ))
+    response = client.invoke(
+        FunctionName=SHARD_WORKER_FUNCTION,
+        InvocationType='RequestResponse',
+        Payload=json.dumps({"headers": {"x-api-key": X_API_KEY}, "shard": shard}).encode("utf-8")
+    )
+    payload = json.loads(response['Payload'].read() or b"{}")
+    if response.get('FunctionError'):
+        raise Exception(f"Lambda worker ผิดพลาด: {payload.get('errorMessage', payload)}")
+    return json.loads(payload.get('body') or "{}")
+
+def dispatch_shards(shards):
+    """
+    ส่ง shard ทั้งหมดให้ worker ตาม SHARD_BACKEND และรอผลทั้งหมด
+
+    Returns:
+        list: ผลลัพธ์ของแต่ละ shard ตามลำดับเดิม (shard ที่ส่งไม่สำเร็จจะมี success = False)
+    """
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+    if SHARD_BACKEND == "lambda":
+        if not SHARD_WORKER_FUNCTION:
+            raise ValueError("SHARD_BACKEND=lambda ต้องกำหนด SHARD_WORKER_FUNCTION")
+        executor = ThreadPoolExecutor(max_workers=len(shards), thread_name_prefix="shard")
+        run = _invoke_lambda_worker
+    else:
+        import multiprocessing
+        executor = ProcessPoolExecutor(max_workers=len(shards), mp_context=multiprocessing.get_context("spawn"))
+        run = _run_shard_in_process
+
+    results = []
+    with executor:
+        futures = [executor.submit(run, shard) for shard in shards]
+        for shard, future in zip(shards, futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append({
+                    'shard': shard['index'],
+                    'success': False,
+                    'noti_success': 0,
+                    'noti_failed': 0,
+                    'has_updates': False,
+                    'failed_rows': list(shard['rows']),
+                    'resume_row': None,
+                    'error': str(e)
+                })
+    return results
+
+def coordinate(target, headers, rows, logger, run_state=None, scan_hint=None):
+    """
+    Coordinator: คัดแถวที่ต้องส่งโนติฯ แบ่งเป็น shard ส่งให้ worker แล้วรวมผลเป็นผลลัพธ์เดียว
+    (รูปแบบเดียวกับ process_rows)
+
+    Args:
+        target (Target): ชีตที่ประมวลผล
+        headers (list): หัวข้อคอลัมน์
+        rows (iterable): (แถวใน spreadsheet, ข้อมูลแถว) เรียงตามลำดับแถว
+        logger (Logger): Logger สำหรับบันทึก log (รวม log ของ worker ด้วย)
+        run_state (dict, optional): ถ้ากำหนด จะบันทึก 'watermark' และ 'failed_rows' ลงไป
+        scan_hint (dict, optional): 'first_unfinished_row', 'last_row' และ 'deadline_row' ของแถวที่ไม่ได้ส่งมาใน rows
+
+    Returns:
+        tuple: (จำนวนการแจ้งเตือนที่ส่งสำเร็จ, จำนวนที่ล้มเหลว, มีการอัพเดตข้อมูลหรือไม่)
+    """
+    schema = compile_schema(headers, target.columns)
+    scan_info = {'first_unfinished_row': None, 'last_row': None, 'candidates': 0}
+    if scan_hint:
+        scan_info['first_unfinished_row'] = scan_hint.get('first_unfinished_row')
+        scan_info['last_row'] = scan_hint.get('last_row')
+        scan_info['deadline_row'] = scan_hint.get('deadline_row')
+    due_rows = [row.row_num for row in iter_rows_to_update(rows, schema, _QuietLogger(), scan_info)]
+
+    shards = [
+        {
+            'index': i,
+            'count': 0,
+            'target': target.to_dict(),
+            'rows': row_nums,
+            'verbose': logger.debug_enabled,
+        }
+        for i, row_nums in enumerate(split_shards(due_rows, SHARD_MAX_WORKERS))
+    ]
+    time_budget = get_deadline().remaining()
+    for shard in shards:
+        shard['time_budget_seconds'] = time_budget
+        # แบ่ง rate ของ SABAI API ให้ worker เพื่อให้อัตรารวมไม่เกิน NOTIFY_RATE_PER_SECOND
+        shard['count'] = len(shards)
+        shard['rate_per_second'] = NOTIFY_RATE_PER_SECOND / len(shards) if NOTIFY_RATE_PER_SECOND > 0 else 0
+        shard['burst'] = max(1, NOTIFY_BURST // len(shards))
+    logger.info(f"แบ่งแถวที่ต้องส่ง {len(due_rows)} แถวเป็น {len(shards)} shard (backend: {SHARD_BACKEND})")
+
+    results = dispatch_shards(shards) if shards else []
+
+    noti_success = noti_failed = 0
+    has_updates = False
+    failed_rows = []
+    resume_rows = [scan_info['deadline_row']] if scan_info.get('deadline_row') is not None else []
+    for shard, result in zip(shards, results):
+        label = f"[shard {shard['index'] + 1}/{shard['count']}]"
+        logger.extend(result.get('logs', []), label)
+        if result['success']:
+            noti_success += result['noti_success']
+            noti_failed += result['noti_failed']
+            has_updates = has_updates or result['has_updates']
+            failed_rows.extend(result.get('failed_rows', []))
+            if result.get('resume_row') is not None:
+                resume_rows.append(result['resume_row'])
+        else:
+            # worker ล้มเหลวทั้ง shard นับทุกแถวใน shard เป็นล้มเหลว
+            logger.error(f"{label} ประมวลผลไม่สำเร็จ ({len(shard['rows'])} แถว): {result['error']}")
+            noti_failed += len(shard['rows'])
+            has_updates = True
+            failed_rows.extend(shard['rows'])
+
+    if run_state is not None:
+        run_state['failed_rows'] = sorted(failed_rows)
+        run_state['resume_row'] = min(resume_rows) if resume_rows else None
+        unfinished_rows = list(failed_rows)
+        if scan_info['first_unfinished_row'] is not None:
+            unfinished_rows.append(scan_info['first_unfinished_row'])
+        if unfinished_rows:
+            run_state['watermark'] = min(unfinished_rows)
+        elif scan_info['last_row'] is not None:
+            run_state['watermark'] = scan_info['last_row'] + 1
+
+    return noti_success, noti_failed, has_updates
@@ -3,74 +3,203 @@
 
 import os
 import json
-import boto3
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
-from config import SCOPES, SPREADSHEET_ID, SHEET_NAME
+import time
+import threading
+from config import (
+    SCOPES,
+    SPREADSHEET_ID,
+    SHEET_NAME,
+    SHEETS_API_ENDPOINT,
+    SHEETS_ANONYMOUS_CREDENTIALS,
+    CREDENTIALS_CACHE_TTL_SECONDS,
+    HEADER_CACHE_TTL_SECONDS,
+    SHEET_BATCH_GET_SIZE,
+    SHEET_PAGE_PREFETCH,
+    SHEET_PAGE_SIZE,
+    SHEET_WRITE_BATCH_SIZE,
+    SHEET_WRITE_FLUSH_SECONDS,
+    SHEET_WRITE_MAX_ATTEMPTS,
+    SHEET_WRITE_RETRY_BASE_DELAY,
+    SHEET_WRITE_RETRY_MAX_DELAY
+)
+from deadline import get_deadline
+from metrics import get_metrics, payload_size
+from resilience import RETRYABLE_STATUS_CODES, backoff_delay, parse_retry_after
+from row_schema import compile_schema
+
+# boto3 และ googleapiclient ถูก import ภายในฟังก์ชันเมื่อใช้งานจริง เพื่อลดเวลา cold start
+
+# แคชระดับ process สำหรับใช้ซ้ำข้าม warm invocation ของ Lambda
+_client_cache = {
+    'secrets_client': None,
+    'credentials': None,
+    'credentials_loaded_at': 0.0,
+    'service': None,
+    'service_credentials': None,
+}
+_client_cache_lock = threading.RLock()
+
+def _get_secrets_client():
+    """สร้างหรือใช้ client ของ Secrets Manager ที่แคชไว้"""
+    if _client_cache['secrets_client'] is None:
+        import boto3
+        region_name = "ap-southeast-1"  # เปลี่ยนเป็นภูมิภาคที่คุณใช้
+        session = boto3.session.Session()
+        _client_cache['secrets_client'] = session.client(
+            service_name='secretsmanager',
+            region_name=region_name
+        )
+    return _client_cache['secrets_client']
+
+def _load_credentials():
+    """โหลด credentials ใหม่จาก Secrets Manager หรือไฟล์ในเครื่อง"""
+    from google.oauth2 import service_account
+
+    # สำหรับ stand-in ในเครื่อง (benchmark) ไม่ต้องใช้ service account
+    if SHEETS_ANONYMOUS_CREDENTIALS:
+        from google.auth.credentials import AnonymousCredentials
+        return AnonymousCredentials()
+
+    # สำหรับ AWS Lambda ใช้ Secrets Manager
+    if 'AWS_LAMBDA_FUNCTION_NAME' in os.environ:
+        secret_name = "google_sheets_credentials"
+
+        # รับค่า secret
+        get_secret_value_response = _get_secrets_client().get_secret_value(
+            SecretId=secret_name
+        )
+
+        # แปลงค่า secret เป็น JSON
+        secret = get_secret_value_response['SecretString']
+        service_account_info = json.loads(secret)
+
+        # สร้าง credentials จาก service account info
+        return service_account.Credentials.from_service_account_info(
+            service_account_info, scopes=SCOPES)
+
+    # สำหรับการทดสอบในเครื่อง local
+    return service_account.Credentials.from_service_account_file(
+        'credentials.json', scopes=SCOPES)
 
 def get_credentials():
     """
     รับ credentials สำหรับ Google Sheets API
     สำหรับ AWS Lambda จะใช้ credentials จาก AWS Secrets Manager
+
+    credentials จะถูกแคชไว้ตาม CREDENTIALS_CACHE_TTL_SECONDS และจะ refresh token
+    ให้เองเมื่อ token เดิมหมดอายุ
     """
     try:
-        # สำหรับ AWS Lambda ใช้ Secrets Manager
-        if 'AWS_LAMBDA_FUNCTION_NAME' in os.environ:
-            secret_name = "google_sheets_credentials"
-            region_name = "ap-southeast-1"  # เปลี่ยนเป็นภูมิภาคที่คุณใช้
-            
-            # สร้าง client สำหรับ Secrets Manager
-            session = boto3.session.Session()
-            client = session.client(
-                service_name='secretsmanager',
-                region_name=region_name
-            )
-            
-            # รับค่า secret
-            get_secret_value_response = client.get_secret_value(
-                SecretId=secret_name
-            )
-            
-            # แปลงค่า secret เป็น JSON
-            secret = get_secret_value_response['SecretString']
-            service_account_info = json.loads(secret)
-            
-            # สร้าง credentials จาก service account info
-            credentials = service_account.Credentials.from_service_account_info(
-                service_account_info, scopes=SCOPES)
-            
-            return credentials
-        else:
-            # สำหรับการทดสอบในเครื่อง local
-            credentials = service_account.Credentials.from_service_account_file(
-                'credentials.json', scopes=SCOPES)
+        with _client_cache_lock:
+            credentials = _client_cache['credentials']
+            age = time.monotonic() - _client_cache['credentials_loaded_at']
+            if credentials is None or age >= CREDENTIALS_CACHE_TTL_SECONDS:
+                credentials = _load_credentials()
+                _client_cache['credentials'] = credentials
+                _client_cache['credentials_loaded_at'] = time.monotonic()
+            elif credentials.expired:
+                from google.auth.transport.requests import Request
+                credentials.refresh(Request())
             return credentials
     except Exception as e:
         print(f"Error getting credentials: {e}")
         raise
 
+def build_sheets_service(credentials):
+    """
+    สร้าง Sheets v4 resource จาก discovery document ที่มากับแพ็กเกจ google-api-python-client
+    (static_discovery) โดยไม่ดึงเอกสารจากเครือข่ายและไม่เขียน discovery cache
+    """
+    from googleapiclient.discovery import build
+    return build(
+        'sheets', 'v4',
+        credentials=credentials,
+        static_discovery=True,
+        cache_discovery=False,
+        client_options={"api_endpoint": SHEETS_API_ENDPOINT} if SHEETS_API_ENDPOINT else None
+    )
+
 def get_sheet_service():
-    """สร้าง service สำหรับ Google Sheets API"""
+    """สร้าง service สำหรับ Google Sheets API (ใช้ตัวที่แคชไว้ถ้า credentials ยังเป็นชุดเดิม)"""
     try:
-        credentials = get_credentials()
-        service = build('sheets', 'v4', credentials=credentials)
-        return service
+        with _client_cache_lock:
+            credentials = get_credentials()
+            service = _client_cache['service']
+            if service is None or _client_cache['service_credentials'] is not credentials:
+                service = build_sheets_service(credentials)
+                _client_cache['service'] = service
+                _client_cache['service_credentials'] = credentials
+            return service
     except Exception as e:
         print(f"Error creating sheet service: {e}")
         raise
 
-def get_sheet_data():
-    """รับข้อมูลจาก Google Sheets"""
+def invalidate_sheet_clients():
+    """
+    ล้าง credentials และ Sheets service ที่แคชไว้
+    ใช้เมื่อมีการ rotate secret เพื่อให้การเรียกครั้งถัดไปโหลด credentials ใหม่
+    """
+    with _client_cache_lock:
+        _client_cache['credentials'] = None
+        _client_cache['credentials_loaded_at'] = 0.0
+        _client_cache['service'] = None
+        _client_cache['service_credentials'] = None
+
+# httplib2.Http ไม่ thread-safe: แต่ละ thread ใช้ transport ของตัวเองกับ service ที่แคชไว้ร่วมกัน
+_thread_local = threading.local()
+
+def _thread_http():
+    """คืน AuthorizedHttp ของ thread ปัจจุบัน (สร้างใหม่เมื่อ credentials เปลี่ยน)"""
+    credentials = get_credentials()
+    if getattr(_thread_local, 'credentials', None) is not credentials:
+        import google_auth_httplib2
+        from googleapiclient.http import build_http
+        _thread_local.http = google_auth_httplib2.AuthorizedHttp(credentials, http=build_http())
+        _thread_local.credentials = credentials
+    return _thread_local.http
+
+def _execute(request, stage, body=None):
+    """
+    เรียก request.execute() ด้วย transport ของ thread ปัจจุบัน
+    พร้อมบันทึก metrics ของ stage (เวลาและจำนวนไบต์โดยประมาณ)
+    """
+    with get_metrics().timer(stage) as sample:
+        result = request.execute(http=_thread_http())
+        sample['bytes'] = payload_size(body) + payload_size(result)
+    return result
+
+def get_sheet_data(start_row=None, spreadsheet_id=SPREADSHEET_ID, sheet_name=SHEET_NAME):
+    """
+    รับข้อมูลจาก Google Sheets
+
+    Args:
+        start_row (int, optional): ถ้ากำหนด จะอ่านเฉพาะแถวหัวข้อและแถวตั้งแต่ start_row ลงไป
+        spreadsheet_id (str): ID ของ spreadsheet
+        sheet_name (str): ชื่อแท็บ
+
+    Returns:
+        list: แถวหัวข้อตามด้วยข้อมูลแต่ละแถว
+    """
+    from googleapiclient.errors import HttpError
     try:
         service = get_sheet_service()
         sheet = service.spreadsheets()
-        result = sheet.values().get(
-            spreadsheetId=SPREADSHEET_ID, 
-            range=SHEET_NAME
-        ).execute()
-        
-        values = result.get('values', [])
+        if start_row:
+            result = _execute(sheet.values().batchGet(
+                spreadsheetId=spreadsheet_id,
+                ranges=[f"{sheet_name}!1:1", f"{sheet_name}!A{start_row}:ZZZ"]
+            ), 'sheets_read')
+            value_ranges = result.get('valueRanges', [])
+            headers = value_ranges[0].get('values', []) if value_ranges else []
+            rows = value_ranges[1].get('values', []) if len(value_ranges) > 1 else []
+            values = headers[:1] + rows
+        else:
+            result = _execute(sheet.values().get(
+                spreadsheetId=spreadsheet_id, 
+                range=sheet_name
+            ), 'sheets_read')
+            values = result.get('values', [])
+
         if not values:
             raise Exception("ไม่พบข้อมูลใน Google Sheet")
             
@@ -82,45 +211,445 @@ def get_sheet_data():
         print(f"Error getting sheet data: {e}")
         raise
 
-def update_sheet_row(row_num, data):
-    """อัพเดตข้อมูลใน Google Sheets"""
-    import traceback
+# แถวหัวข้อที่แคชไว้: (spreadsheet_id, sheet_name) -> (headers, เวลาที่โหลด)
+_header_cache = {}
+
+def column_letter(index):
+    """แปลง index ของคอลัมน์ (เริ่มจาก 0) เป็นตัวอักษรแบบ A1 notation เช่น 0 -> A, 26 -> AA"""
+    letters = ""
+    index += 1
+    while index > 0:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+def get_sheet_headers(refresh=False, spreadsheet_id=SPREADSHEET_ID, sheet_name=SHEET_NAME):
+    """
+    รับแถวหัวข้อของชีต (แคชไว้ตาม HEADER_CACHE_TTL_SECONDS)
+
+    Args:
+        refresh (bool): บังคับอ่านใหม่จาก Google Sheets
+        spreadsheet_id (str): ID ของ spreadsheet
+        sheet_name (str): ชื่อแท็บ
+    """
+    key = (spreadsheet_id, sheet_name)
+    cached = _header_cache.get(key)
+    if not refresh and cached and time.monotonic() - cached[1] < HEADER_CACHE_TTL_SECONDS:
+        return cached[0]
+
+    result = _execute(get_sheet_service().spreadsheets().values().get(
+        spreadsheetId=spreadsheet_id,
+        range=f"{sheet_name}!1:1"
+    ), 'sheets_read')
+    values = result.get('values', [])
+    if not values:
+        raise Exception("ไม่พบแถวหัวข้อใน Google Sheet")
+    _header_cache[key] = (values[0], time.monotonic())
+    return values[0]
+
+def _batch_get(ranges, major_dimension="ROWS", spreadsheet_id=SPREADSHEET_ID):
+    """เรียก values.batchGet ทีละไม่เกิน SHEET_BATCH_GET_SIZE range แล้วรวม valueRanges ตามลำดับ"""
+    sheet = get_sheet_service().spreadsheets()
+    value_ranges = []
+    for i in range(0, len(ranges), max(1, SHEET_BATCH_GET_SIZE)):
+        result = _execute(sheet.values().batchGet(
+            spreadsheetId=spreadsheet_id,
+            ranges=ranges[i:i + SHEET_BATCH_GET_SIZE],
+            majorDimension=major_dimension
+        ), 'sheets_read')
+        value_ranges.extend(result.get('valueRanges', []))
+    return value_ranges
+
+def get_projected_sheet_data(start_row=None, spreadsheet_id=SPREADSHEET_ID, sheet_name=SHEET_NAME, columns=None):
+    """
+    อ่านข้อมูลแบบเลือกเฉพาะคอลัมน์ (projected read)
+
+    1. อ่านคอลัมน์ is Gen Payment Link, Payment Link, is Send Noti (และ timestamp ถ้ามี)
+       ด้วย values.batchGet แบบ majorDimension=COLUMNS พร้อมแถวหัวข้อเพื่อตรวจว่าแคชยังถูกต้อง
+    2. อ่านข้อมูลทั้งแถวเฉพาะแถวที่ต้องส่งโนติฯ
+
+    Args:
+        start_row (int, optional): แถวเริ่มต้น (ค่าเริ่มต้นคือแถวที่ 2)
+        spreadsheet_id (str): ID ของ spreadsheet
+        sheet_name (str): ชื่อแท็บ
+        columns (dict, optional): field -> หัวข้อคอลัมน์ (ดู row_schema.DEFAULT_COLUMNS)
+
+    Returns:
+        tuple: (headers, [(แถวใน spreadsheet, ข้อมูลแถว)], scan_hint)
+            โดย scan_hint มี 'first_unfinished_row' และ 'last_row' ของแถวที่ไม่ได้อ่านทั้งแถว
+    """
+    from googleapiclient.errors import HttpError
+    start_row = start_row or 2
     try:
-        # ใช้ print เพื่อให้ debug logs ยังคงแสดงใน console
-        print(f"[update_sheet_row] กำลังอัพเดตแถวที่ {row_num}, จำนวนข้อมูล: {len(data)} คอลัมน์")
-        print(f"[update_sheet_row] ข้อมูล: {data}")
-        
-        service = get_sheet_service()
-        sheet = service.spreadsheets()
-        
-        # ตรวจสอบว่าข้อมูลไม่ว่าง
-        if not data:
-            raise Exception("ข้อมูลที่จะอัพเดตเป็นรายการว่าง")
-        
-        # คำนวณ range สำหรับการอัพเดต
-        end_column = chr(65 + len(data) - 1)  # A=65, B=66, etc.
-        update_range = f"{SHEET_NAME}!A{row_num}:{end_column}{row_num}"
-        
-        print(f"[update_sheet_row] Update range: {update_range}")
-        
-        body = {"values": [data]}
-        
-        result = sheet.values().update(
-            spreadsheetId=SPREADSHEET_ID,
-            range=update_range,
-            valueInputOption="RAW",
-            body=body
-        ).execute()
-        
-        print(f"[update_sheet_row] อัพเดตสำเร็จ: {result.get('updatedCells', 0)} เซลล์")
-        return True
-        
+        headers = get_sheet_headers(spreadsheet_id=spreadsheet_id, sheet_name=sheet_name)
+        for attempt in range(2):
+            schema = compile_schema(headers, columns)
+            schema.validate()
+            status_columns = [schema.is_gen_payment_link, schema.payment_link, schema.is_send_noti]
+            if schema.timestamp >= 0:
+                status_columns.append(schema.timestamp)
+            ranges = [f"{sheet_name}!1:1"] + [
+                f"{sheet_name}!{column_letter(col)}{start_row}:{column_letter(col)}" for col in status_columns
+            ]
+            value_ranges = _batch_get(ranges, major_dimension="COLUMNS", spreadsheet_id=spreadsheet_id)
+
+            # แถวหัวข้อเปลี่ยน (เช่น มีการแทรกคอลัมน์) ให้โหลดแถวหัวข้อใหม่แล้วอ่านอีกครั้ง
+            current_headers = [column[0] if column else "" for column in value_ranges[0].get('values', [])]
+            if current_headers == list(headers):
+                break
+            headers = get_sheet_headers(refresh=True, spreadsheet_id=spreadsheet_id, sheet_name=sheet_name)
+        else:
+            raise Exception("แถวหัวข้อเปลี่ยนระหว่างการอ่านข้อมูล")
+
+        column_values = [
+            (value_range.get('values') or [[]])[0] for value_range in value_ranges[1:]
+        ]
+        length = max((len(values) for values in column_values), default=0)
+
+        # ประกอบแถวที่มีเฉพาะคอลัมน์สถานะในตำแหน่งเดิม เพื่อใช้เงื่อนไขเดียวกับ ColumnSchema ของการอ่านทั้งแถว
+        width = max(status_columns) + 1
+
+        def status_row(offset):
+            row = [""] * width
+            for column, index in enumerate(status_columns):
+                values = column_values[column]
+                if offset < len(values):
+                    row[index] = values[offset]
+            return row
+
+        candidate_rows = []
+        scan_hint = {'first_unfinished_row': None, 'last_row': None}
+        for offset in range(length):
+            row_num = start_row + offset
+            row = status_row(offset)
+            if schema.is_due(row):
+                candidate_rows.append(row_num)
+                continue
+            if any(row):
+                scan_hint['last_row'] = row_num
+                if not schema.is_send_noti_done(row) and scan_hint['first_unfinished_row'] is None:
+                    scan_hint['first_unfinished_row'] = row_num
+
+        print(f"[get_projected_sheet_data] อ่านคอลัมน์สถานะ {length} แถว พบแถวที่ต้องส่ง {len(candidate_rows)} แถว")
+
+        rows = get_sheet_rows(candidate_rows, spreadsheet_id=spreadsheet_id, sheet_name=sheet_name)
+        return headers, rows, scan_hint
     except HttpError as err:
-        print(f"[update_sheet_row] Google API error: {err}")
-        print(f"[update_sheet_row] Stack trace: {traceback.format_exc()}")
+        print(f"Google API error: {err}")
         raise
     except Exception as e:
-        print(f"[update_sheet_row] Error updating sheet: {e}")
-        print(f"[update_sheet_row] Stack trace: {traceback.format_exc()}")
-        print(f"[update_sheet_row] Row: {row_num}, Data length: {len(data) if data else 0}")
+        print(f"Error getting projected sheet data: {e}")
         raise
+
+def get_sheet_rows(row_nums, spreadsheet_id=SPREADSHEET_ID, sheet_name=SHEET_NAME):
+    """
+    อ่านข้อมูลทั้งแถวเฉพาะแถวที่ระบุด้วย values.batchGet
+
+    Args:
+        row_nums (list): แถวใน spreadsheet (เริ่มจาก 1)
+        spreadsheet_id (str): ID ของ spreadsheet
+        sheet_name (str): ชื่อแท็บ
+
+    Returns:
+        list: [(แถวใน spreadsheet, ข้อมูลแถว)] ตามลำดับของ row_nums
+    """
+    if not row_nums:
+        return []
+    row_ranges = _batch_get(
+        [f"{sheet_name}!{row_num}:{row_num}" for row_num in row_nums],
+        spreadsheet_id=spreadsheet_id
+    )
+    rows = []
+    for row_num, value_range in zip(row_nums, row_ranges):
+        values = value_range.get('values', [])
+        rows.append((row_num, values[0] if values else []))
+    return rows
+
+def get_sheet_row(row_num, spreadsheet_id=SPREADSHEET_ID, sheet_name=SHEET_NAME):
+    """
+    อ่านแถวหัวข้อและข้อมูลแถวเดียว ถ้ายังไม่มีหัวข้อในแคชจะอ่านทั้งสองแถวใน batchGet ครั้งเดียว
+
+    Args:
+        row_num (int): แถวใน spreadsheet (เริ่มจาก 1)
+        spreadsheet_id (str): ID ของ spreadsheet
+        sheet_name (str): ชื่อแท็บ
+
+    Returns:
+        tuple: (หัวข้อคอลัมน์, ข้อมูลแถว)
+    """
+    key = (spreadsheet_id, sheet_name)
+    cached = _header_cache.get(key)
+    if cached and time.monotonic() - cached[1] < HEADER_CACHE_TTL_SECONDS:
+        return cached[0], get_sheet_rows([row_num], spreadsheet_id=spreadsheet_id, sheet_name=sheet_name)[0][1]
+
+    header_range, row_range = _batch_get(
+        [f"{sheet_name}!1:1", f"{sheet_name}!{row_num}:{row_num}"],
+        spreadsheet_id=spreadsheet_id
+    )
+    headers = header_range.get('values', [])
+    if not headers:
+        raise Exception("ไม่พบแถวหัวข้อใน Google Sheet")
+    _header_cache[key] = (headers[0], time.monotonic())
+    values = row_range.get('values', [])
+    return headers[0], values[0] if values else []
+
+def _get_page(start_row, end_row, last_column, spreadsheet_id, sheet_name):
+    """อ่านข้อมูลแถว start_row ถึง end_row (หนึ่งหน้า)"""
+    result = _execute(get_sheet_service().spreadsheets().values().get(
+        spreadsheetId=spreadsheet_id,
+        range=f"{sheet_name}!A{start_row}:{last_column}{end_row}"
+    ), 'sheets_read')
+    return result.get('values', [])
+
+def get_sheet_row_count(spreadsheet_id=SPREADSHEET_ID, sheet_name=SHEET_NAME):
+    """อ่านจำนวนแถวทั้งหมดของแท็บ (gridProperties.rowCount รวมแถวว่างท้ายชีต)"""
+    result = _execute(get_sheet_service().spreadsheets().get(
+        spreadsheetId=spreadsheet_id,
+        ranges=[sheet_name],
+        fields="sheets(properties(gridProperties(rowCount)))"
+    ), 'sheets_read')
+    sheets = result.get('sheets') or [{}]
+    return sheets[0].get('properties', {}).get('gridProperties', {}).get('rowCount', 0)
+
+def iter_sheet_rows(headers, start_row=None, spreadsheet_id=SPREADSHEET_ID, sheet_name=SHEET_NAME,
+                    page_size=SHEET_PAGE_SIZE, prefetch=SHEET_PAGE_PREFETCH):
+    """
+    อ่านข้อมูลทีละหน้า (page_size แถว เช่น A2:Z5001, A5002:Z10001, ...) แล้ว yield ทีละแถว
+    เก็บข้อมูลไว้ใน memory ไม่เกิน 2 หน้า (หน้าปัจจุบันและหน้าที่ prefetch)
+    อ่านจนถึงแถวสุดท้ายของ grid (gridProperties.rowCount) เพราะ Sheets API ตัดแถวว่างท้ายแต่ละช่วงออก
+    หน้าที่สั้นกว่า page_size จึงไม่ได้แปลว่าหมดข้อมูล (แถวว่างคั่นกลางข้อมูลจะถูกข้ามไปเฉยๆ)
+
+    Args:
+        headers (list): หัวข้อคอลัมน์ (ใช้กำหนดคอลัมน์สุดท้ายที่อ่าน)
+        start_row (int, optional): แถวแรกที่อ่าน (ค่าเริ่มต้นคือแถวถัดจากหัวข้อ)
+        spreadsheet_id (str): ID ของ spreadsheet
+        sheet_name (str): ชื่อแท็บ
+        page_size (int): จำนวนแถวต่อหน้า
+        prefetch (bool): อ่านหน้าถัดไปใน background ระหว่างที่หน้าปัจจุบันถูกประมวลผล
+
+    Yields:
+        tuple: (แถวใน spreadsheet, ข้อมูลแถว)
+    """
+    page_size = max(1, page_size)
+    last_column = column_letter(max(len(headers), 1) - 1)
+    page_start = start_row or 2
+    row_count = get_sheet_row_count(spreadsheet_id, sheet_name)
+    if page_start > row_count:
+        return
+
+    def fetch(first_row):
+        return _get_page(first_row, min(first_row + page_size - 1, row_count), last_column, spreadsheet_id, sheet_name)
+
+    executor = None
+    if prefetch:
+        from concurrent.futures import ThreadPoolExecutor
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sheet-page")
+    try:
+        page = fetch(page_start)
+        while True:
+            has_next = page_start + page_size <= row_count
+            next_page = None
+            if executor is not None and has_next:
+                next_page = executor.submit(fetch, page_start + page_size)
+            for offset, row in enumerate(page):
+                yield page_start + offset, row
+            if not has_next:
+                return
+            page_start += page_size
+            page = next_page.result() if next_page is not None else fetch(page_start)
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+def get_cell_ranges(row_num, changes, sheet_name=SHEET_NAME):
+    """
+    แปลงเซลล์ที่เปลี่ยนในแถวเป็น range แบบ A1 notation โดยรวมเซลล์ที่อยู่ติดกันเป็น range เดียว
+
+    Args:
+        row_num (int): แถวใน spreadsheet (เริ่มจาก 1)
+        changes (dict): index ของคอลัมน์ (เริ่มจาก 0) -> ค่าใหม่
+        sheet_name (str): ชื่อแท็บ
+
+    Returns:
+        list: [(range, [ค่าในแต่ละเซลล์])]
+    """
+    ranges = []
+    run_start, run_values = None, []
+    for index in sorted(changes):
+        if run_values and index == run_start + len(run_values):
+            run_values.append(changes[index])
+            continue
+        if run_values:
+            ranges.append((run_start, run_values))
+        run_start, run_values = index, [changes[index]]
+    if run_values:
+        ranges.append((run_start, run_values))
+
+    result = []
+    for start, values in ranges:
+        start_cell = f"{column_letter(start)}{row_num}"
+        if len(values) == 1:
+            result.append((f"{sheet_name}!{start_cell}", values))
+        else:
+            end_cell = f"{column_letter(start + len(values) - 1)}{row_num}"
+            result.append((f"{sheet_name}!{start_cell}:{end_cell}", values))
+    return result
+
+def _is_retryable_write_error(error):
+    """error ชั่วคราวที่ลองเขียนซ้ำได้: HttpError 429/5xx หรือ connection/timeout (batchUpdate เขียนค่าเดิมซ้ำได้)"""
+    resp = getattr(error, 'resp', None)
+    if resp is not None and getattr(resp, 'status', None) is not None:
+        return int(resp.status) in RETRYABLE_STATUS_CODES
+    return isinstance(error, (OSError, TimeoutError))
+
+class SheetBatchWriter:
+    """
+    เก็บเซลล์ที่ต้องอัพเดตไว้ในบัฟเฟอร์ แล้วเขียนกลับรวดเดียวด้วย values.batchUpdate
+    โดยเขียนเฉพาะเซลล์ที่เปลี่ยน ไม่เขียนทับคอลัมน์อื่นในแถว
+
+    จะ flush อัตโนมัติเมื่อจำนวนแถวถึง max_rows หรือข้อมูลแรกในบัฟเฟอร์ค้างนานเกิน
+    max_wait_seconds (ตรวจตอน add และผู้เรียกควรเรียก flush_if_due เป็นระยะเมื่อไม่มีแถวใหม่เข้ามา)
+    และต้องเรียก flush() อีกครั้งตอนจบการทำงาน
+    """
+
+    def __init__(self, max_rows=SHEET_WRITE_BATCH_SIZE, max_wait_seconds=SHEET_WRITE_FLUSH_SECONDS,
+                 spreadsheet_id=SPREADSHEET_ID, sheet_name=SHEET_NAME):
+        self.spreadsheet_id = spreadsheet_id
+        self.sheet_name = sheet_name
+        self.max_rows = max(1, max_rows)
+        self.max_wait_seconds = max_wait_seconds
+        self._pending = []
+        self._pending_rows = 0
+        self._first_added_at = None
+
+    def __len__(self):
+        return self._pending_rows
+
+    def add(self, row_num, changes):
+        """
+        เพิ่มเซลล์ที่เปลี่ยนในแถวเข้าบัฟเฟอร์
+
+        Args:
+            row_num (int): แถวใน spreadsheet (เริ่มจาก 1)
+            changes (dict): index ของคอลัมน์ (เริ่มจาก 0) -> ค่าใหม่
+
+        Returns:
+            list: ผลลัพธ์ราย range ถ้ามีการ flush เกิดขึ้น ไม่เช่นนั้นเป็นรายการว่าง
+        """
+        if not changes:
+            raise Exception("ไม่มีเซลล์ที่ต้องอัพเดต")
+
+        for cell_range, values in get_cell_ranges(row_num, changes, self.sheet_name):
+            self._pending.append({
+                'row': row_num,
+                'range': cell_range,
+                'values': [values]
+            })
+        self._pending_rows += 1
+        if self._first_added_at is None:
+            self._first_added_at = time.monotonic()
+
+        if self.should_flush():
+            return self.flush()
+        return []
+
+    def should_flush(self):
+        """ตรวจสอบว่าถึงเกณฑ์จำนวนแถวหรือเวลาที่ต้อง flush แล้วหรือไม่"""
+        if not self._pending:
+            return False
+        if self._pending_rows >= self.max_rows:
+            return True
+        return time.monotonic() - self._first_added_at >= self.max_wait_seconds
+
+    def flush_if_due(self):
+        """flush เมื่อถึงเกณฑ์แล้ว (ให้ write loop เรียกเมื่อรอผลลัพธ์นานเกินไป) คืนผลลัพธ์ราย range"""
+        if self.should_flush():
+            return self.flush()
+        return []
+
+    def flush(self):
+        """
+        เขียนข้อมูลทั้งหมดในบัฟเฟอร์ด้วย values.batchUpdate ครั้งเดียว
+        ถ้าได้ 429/5xx หรือเชื่อมต่อไม่สำเร็จจะลองทั้งก้อนใหม่แบบ exponential backoff (ไม่เกินเส้นตายของ invocation)
+        ส่วน error อื่น (เช่น range ไม่ถูกต้อง) จะเขียนทีละ range เพื่อแยกแถวที่มีปัญหาจริงออกมา
+
+        Returns:
+            list: ผลลัพธ์ราย range [{'row', 'range', 'success', 'error'}]
+        """
+        pending = self._pending
+        pending_rows = self._pending_rows
+        self._pending = []
+        self._pending_rows = 0
+        self._first_added_at = None
+        if not pending:
+            return []
+
+        print(f"[SheetBatchWriter] กำลังเขียนข้อมูล {pending_rows} แถว ({len(pending)} range) ด้วย batchUpdate")
+        body = {
+            "valueInputOption": "RAW",
+            "data": [{"range": entry['range'], "values": entry['values']} for entry in pending]
+        }
+        try:
+            result = self._batch_update(body)
+        except Exception as e:
+            print(f"[SheetBatchWriter] batchUpdate ไม่สำเร็จ: {e}")
+            if len(pending) == 1 or _is_retryable_write_error(e):
+                # quota หรือ server ล่ม: เขียนทีละ range ก็จะล้มเหลวเหมือนกันและกิน quota เพิ่ม
+                return [self._result(entry, False, str(e)) for entry in pending]
+            # batchUpdate ล้มเหลวทั้งก้อน ให้เขียนทีละ range เพื่อแยกแถวที่มีปัญหาจริงออกมา
+            return [self._write_single(entry) for entry in pending]
+
+        responses = result.get('responses', [])
+        print(f"[SheetBatchWriter] อัพเดตสำเร็จ: {result.get('totalUpdatedCells', 0)} เซลล์")
+        results = []
+        for i, entry in enumerate(pending):
+            if i < len(responses) and responses[i].get('updatedRange'):
+                results.append(self._result(entry, True))
+            else:
+                results.append(self._result(entry, False, "ไม่พบผลการอัพเดตสำหรับ range นี้"))
+        return results
+
+    def _batch_update(self, body):
+        """เรียก values.batchUpdate พร้อมลองใหม่เมื่อได้ 429/5xx หรือเชื่อมต่อไม่สำเร็จ"""
+        deadline = get_deadline()
+        for attempt in range(1, max(1, SHEET_WRITE_MAX_ATTEMPTS) + 1):
+            try:
+                return _execute(get_sheet_service().spreadsheets().values().batchUpdate(
+                    spreadsheetId=self.spreadsheet_id,
+                    body=body
+                ), 'sheets_write', body)
+            except Exception as e:
+                if attempt >= SHEET_WRITE_MAX_ATTEMPTS or not _is_retryable_write_error(e):
+                    raise
+                resp = getattr(e, 'resp', None)
+                retry_after = parse_retry_after(resp.get('retry-after')) if resp is not None else None
+                delay = retry_after if retry_after is not None else backoff_delay(
+                    attempt, SHEET_WRITE_RETRY_BASE_DELAY, SHEET_WRITE_RETRY_MAX_DELAY
+                )
+                remaining = deadline.remaining()
+                if delay > SHEET_WRITE_RETRY_MAX_DELAY or (remaining is not None and remaining <= delay):
+                    raise
+                print(f"[SheetBatchWriter] batchUpdate ไม่สำเร็จ (ครั้งที่ {attempt}): {e} จะลองใหม่ใน {delay:.2f} วินาที")
+                time.sleep(delay)
+
+    def _write_single(self, entry):
+        try:
+            body = {"values": entry['values']}
+            _execute(get_sheet_service().spreadsheets().values().update(
+                spreadsheetId=self.spreadsheet_id,
+                range=entry['range'],
+                valueInputOption="RAW",
+                body=body
+            ), 'sheets_write', body)
+            return self._result(entry, True)
+        except Exception as e:
+            return self._result(entry, False, str(e))
+
+    @staticmethod
+    def _result(entry, success, error=None):
+        return {
+            'row': entry['row'],
+            'range': entry['range'],
+            'success': success,
+            'error': error
+        }
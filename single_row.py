@@ -0,0 +1,118 @@
+# single_row.py
+# โหมดแถวเดียว: ผู้เรียก (เช่น Apps Script onEdit / onFormSubmit) ระบุแถวที่เปลี่ยนมาใน event
+# จึงอ่าน ตรวจสอบ ส่งโนติฯ และเขียนกลับเฉพาะแถวนั้นแทนการอ่านทั้งชีต
+
+import json
+import base64
+from data_processor import process_rows
+from sheets_service import get_sheet_headers, get_sheet_row
+
+def parse_row_request(event):
+    """
+    อ่านคำขอแบบแถวเดียวจาก event รองรับ
+      {"row": 12}
+      {"row": {"row_num": 12, "values": [...] หรือ {"หัวข้อ": "ค่า"}, "spreadsheet_id": "...", "sheet_name": "..."}}
+    ทั้งใน event โดยตรง, ใน body (JSON) ของ API Gateway และ query parameter ?row=12
+
+    Returns:
+        dict | None: {'row_num', 'values', 'spreadsheet_id', 'sheet_name'} หรือ None ถ้าไม่ใช่คำขอแบบแถวเดียว
+
+    Raises:
+        ValueError: เมื่อเลขแถวไม่ถูกต้อง
+    """
+    event = event or {}
+    row = event.get("row")
+    if row is None and event.get("body"):
+        body = event["body"]
+        if event.get("isBase64Encoded"):
+            body = base64.b64decode(body).decode("utf-8")
+        try:
+            body = json.loads(body)
+        except (TypeError, ValueError):
+            body = None
+        if isinstance(body, dict):
+            row = body.get("row")
+    if row is None:
+        row = (event.get("queryStringParameters") or {}).get("row")
+    if row is None:
+        return None
+
+    request = row if isinstance(row, dict) else {"row_num": row}
+    try:
+        row_num = int(request.get("row_num"))
+    except (TypeError, ValueError):
+        raise ValueError(f"เลขแถวไม่ถูกต้อง: {request.get('row_num')!r}")
+    if row_num < 2:
+        raise ValueError(f"เลขแถวต้องอยู่หลังแถวหัวข้อ (ได้ {row_num})")
+    return {
+        'row_num': row_num,
+        'values': request.get("values"),
+        'spreadsheet_id': request.get("spreadsheet_id"),
+        'sheet_name': request.get("sheet_name"),
+    }
+
+def select_target(targets, request):
+    """
+    เลือก target ของคำขอแบบแถวเดียว: ตาม spreadsheet_id / sheet_name ที่ระบุ
+    หรือ target เดียวที่มีถ้าไม่ได้ระบุ (รับเฉพาะ target ที่ตั้งค่าไว้เท่านั้น)
+
+    Raises:
+        ValueError: เมื่อไม่พบ target หรือเลือกไม่ได้
+    """
+    matches = [
+        target for target in targets
+        if (not request['spreadsheet_id'] or target.spreadsheet_id == request['spreadsheet_id'])
+        and (not request['sheet_name'] or target.sheet_name == request['sheet_name'])
+    ]
+    if len(matches) == 1:
+        return matches[0]
+    if not matches:
+        raise ValueError("ไม่พบ target ที่ตรงกับ spreadsheet_id / sheet_name ของคำขอ")
+    raise ValueError("มีหลาย target ต้องระบุ spreadsheet_id และ sheet_name ของแถว")
+
+def row_cells_from_payload(headers, values):
+    """
+    แปลงข้อมูลแถวที่ส่งมากับ event เป็นรายการเซลล์ตามลำดับหัวข้อ
+
+    Args:
+        headers (list): หัวข้อคอลัมน์
+        values (list | dict): รายการเซลล์ หรือ {หัวข้อ: ค่า} (ค่าเป็น list ได้ เช่น namedValues ของ onFormSubmit)
+    """
+    if isinstance(values, dict):
+        cells = []
+        for header in headers:
+            value = values.get(header, "")
+            if isinstance(value, list):
+                value = value[0] if value else ""
+            cells.append(str(value))
+    elif isinstance(values, list):
+        cells = ["" if value is None else str(value) for value in values]
+    else:
+        raise ValueError("values ของแถวต้องเป็น list หรือ dict")
+    # ตัดเซลล์ว่างท้ายแถวเหมือนผลลัพธ์ของ Sheets API
+    while cells and cells[-1] == "":
+        cells.pop()
+    return cells
+
+def process_single_row(target, request, logger, rate_limiter=None):
+    """
+    ประมวลผลแถวเดียว: อ่านแถว (หรือใช้ข้อมูลที่ส่งมา) → ตรวจสอบเงื่อนไข → ส่งโนติฯ → เขียนกลับเฉพาะแถวนั้น
+    ไม่แก้ watermark ของการสแกนทั้งชีต
+
+    Args:
+        target (Target): ชีตของแถว
+        request (dict): ผลจาก parse_row_request
+        logger (Logger): Logger สำหรับบันทึก log
+        rate_limiter (TokenBucket, optional): rate limiter ของ SABAI API
+
+    Returns:
+        tuple: (จำนวนการแจ้งเตือนที่ส่งสำเร็จ, จำนวนที่ล้มเหลว, มีการอัพเดตข้อมูลหรือไม่)
+    """
+    row_num = request['row_num']
+    if request['values'] is None:
+        headers, cells = get_sheet_row(row_num, spreadsheet_id=target.spreadsheet_id, sheet_name=target.sheet_name)
+    else:
+        headers = get_sheet_headers(spreadsheet_id=target.spreadsheet_id, sheet_name=target.sheet_name)
+        cells = row_cells_from_payload(headers, request['values'])
+    logger.info(f"ประมวลผลแถวเดียว: แถวที่ {row_num} ({target.name})")
+    return process_rows(headers, [(row_num, cells)], logger, target=target, rate_limiter=rate_limiter)
@@ -0,0 +1,105 @@
+# targets.py
+# เป้าหมายที่ต้องประมวลผล: spreadsheet, แท็บ, การจับคู่คอลัมน์ และข้อความแจ้งเตือนของแต่ละโครงการ
+
+import json
+from config import (
+    NOTIFICATION_DESCRIPTION,
+    NOTIFICATION_TITLE,
+    SHEET_NAME,
+    SPREADSHEET_ID,
+    TARGETS_JSON
+)
+from row_schema import DEFAULT_COLUMNS
+
+class Target:
+    """
+    ชีตหนึ่งแท็บที่ต้องส่งโนติฯ
+
+    Attributes:
+        name (str): ชื่อที่ใช้ใน log และผลลัพธ์ (ค่าเริ่มต้นคือ "spreadsheet_id!sheet_name")
+        spreadsheet_id (str): ID ของ Google Spreadsheet
+        sheet_name (str): ชื่อแท็บ
+        columns (dict): field -> หัวข้อคอลัมน์ (field ที่ไม่ได้กำหนดใช้ค่าจาก DEFAULT_COLUMNS)
+        notification_title (str): หัวข้อของการแจ้งเตือน
+        notification_description (str): รายละเอียดของการแจ้งเตือน
+    """
+
+    __slots__ = ('name', 'spreadsheet_id', 'sheet_name', 'columns', 'notification_title', 'notification_description')
+
+    def __init__(self, spreadsheet_id, sheet_name=SHEET_NAME, columns=None, name=None,
+                 notification_title=NOTIFICATION_TITLE, notification_description=NOTIFICATION_DESCRIPTION):
+        unknown = set(columns or {}) - set(DEFAULT_COLUMNS)
+        if unknown:
+            raise ValueError(f"ไม่รู้จัก field ใน columns: {', '.join(sorted(unknown))}")
+        self.spreadsheet_id = spreadsheet_id
+        self.sheet_name = sheet_name
+        self.columns = dict(DEFAULT_COLUMNS, **(columns or {}))
+        self.name = name or f"{spreadsheet_id}!{sheet_name}"
+        self.notification_title = notification_title
+        self.notification_description = notification_description
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        สร้าง Target จาก dict เช่น
+        {"spreadsheet_id": "...", "sheet_name": "ชีต1", "name": "หมู่บ้าน A",
+         "columns": {"land_no": "เลขที่บ้าน"}, "notification_title": "...", "notification_description": "..."}
+        """
+        if not isinstance(data, dict) or not data.get('spreadsheet_id'):
+            raise ValueError("target ต้องกำหนด spreadsheet_id")
+        return cls(
+            data['spreadsheet_id'],
+            sheet_name=data.get('sheet_name') or SHEET_NAME,
+            columns=data.get('columns'),
+            name=data.get('name'),
+            notification_title=data.get('notification_title') or NOTIFICATION_TITLE,
+            notification_description=data.get('notification_description') or NOTIFICATION_DESCRIPTION,
+        )
+
+    def to_dict(self):
+        """แปลงเป็น dict สำหรับส่งต่อให้ worker (ใช้คู่กับ from_dict)"""
+        return {
+            'spreadsheet_id': self.spreadsheet_id,
+            'sheet_name': self.sheet_name,
+            'columns': dict(self.columns),
+            'name': self.name,
+            'notification_title': self.notification_title,
+            'notification_description': self.notification_description,
+        }
+
+    def __repr__(self):
+        return f"Target({self.name!r})"
+
+def default_target():
+    """Target จากค่า SPREADSHEET_ID และ SHEET_NAME ใน config"""
+    return Target(SPREADSHEET_ID, SHEET_NAME)
+
+def load_targets(event=None):
+    """
+    โหลดรายการ target ตามลำดับความสำคัญ: event["targets"] (เช่น input ของ EventBridge),
+    ตัวแปร TARGETS_JSON แล้วจึงใช้ SPREADSHEET_ID / SHEET_NAME ตัวเดียว
+
+    Returns:
+        list: รายการ Target
+
+    Raises:
+        ValueError: เมื่อรายการ target ไม่ถูกต้องหรือชื่อซ้ำกัน
+    """
+    raw_targets = (event or {}).get("targets")
+    if raw_targets is None and TARGETS_JSON:
+        raw_targets = json.loads(TARGETS_JSON)
+    if raw_targets is None:
+        return [default_target()]
+
+    if not isinstance(raw_targets, list) or not raw_targets:
+        raise ValueError("targets ต้องเป็นรายการที่มีอย่างน้อย 1 target")
+    targets = [Target.from_dict(data) for data in raw_targets]
+    names = [target.name for target in targets]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"ชื่อ target ซ้ำกัน: {', '.join(duplicates)}")
+    # แท็บเดียวกันห้ามอยู่หลาย target เพราะจะถูกประมวลผลและเขียนกลับพร้อมกัน
+    sheets = [(target.spreadsheet_id, target.sheet_name) for target in targets]
+    if len(set(sheets)) != len(sheets):
+        raise ValueError("มี target ที่ชี้ไปยังแท็บเดียวกันมากกว่า 1 รายการ")
+    return targets
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# test_deadline.py
+# ทดสอบการหยุดก่อนหมดเวลาของ invocation ระหว่าง filter stage (outbox drain และ shard worker)
+# จำลอง Sheets API และ SABAI API ไม่ต้องต่อเครือข่าย
+
+import threading
+import data_processor
+import deadline
+import outbox
+import sharding
+from config import IS_GEN_PAYMENT_LINK, PAYMENT_LINK, IS_SEND_NOTI, ERROR_RES, LAND_NO, PHONE, EMAIL
+from logger import Logger
+from targets import Target
+
+HEADERS = [LAND_NO, PHONE, EMAIL, IS_GEN_PAYMENT_LINK, PAYMENT_LINK, IS_SEND_NOTI, ERROR_RES]
+TARGET = Target("test-spreadsheet", "Sheet1")
+
+class CountingDeadline(deadline.Deadline):
+    """Deadline ที่ยังไม่หมดเวลาเฉพาะ allowed_checks ครั้งแรกที่ถูกตรวจ"""
+
+    def __init__(self, allowed_checks):
+        super().__init__()
+        self.allowed_checks = allowed_checks
+        self.checks = 0
+        self._lock = threading.Lock()
+
+    def expired(self):
+        with self._lock:
+            self.checks += 1
+            return self.checks > self.allowed_checks
+
+class OfflineWriter:
+    """SheetBatchWriter ที่ไม่เรียก Sheets API"""
+
+    max_wait_seconds = 10
+
+    def __init__(self, **kwargs):
+        pass
+
+    def add(self, row_num, changes):
+        return []
+
+    def flush(self):
+        return []
+
+    def flush_if_due(self):
+        return []
+
+def due_rows(row_nums):
+    return [
+        (row_num, [f"1000-{row_num:03d}", "0800000000", "", "Done", f"https://pay.example/{row_num}", "", ""])
+        for row_num in row_nums
+    ]
+
+def offline_pipeline(monkeypatch, allowed_checks):
+    """ตั้ง deadline และแทนที่การส่งโนติฯ / เขียนกลับชีต คืนรายการแถวที่ถูกส่งจริง"""
+    sent_rows = []
+
+    def send(row, indices, *args):
+        sent_rows.append(row[0])
+        return {'success': True, 'response': {}}
+
+    monkeypatch.setattr(deadline, "_deadline", CountingDeadline(allowed_checks))
+    monkeypatch.setattr(data_processor, "send_notification", send)
+    monkeypatch.setattr(data_processor, "SheetBatchWriter", OfflineWriter)
+    monkeypatch.setattr(data_processor, "get_ledger", lambda: None)
+    return sent_rows
+
+def test_drain_releases_rows_after_filter_deadline(monkeypatch, tmp_path):
+    """แถวที่ claim แล้วแต่ filter หยุดก่อนถึง ต้องกลับเป็น pending ไม่ใช่ sent"""
+    queue = outbox.Outbox(str(tmp_path / "outbox.sqlite3"))
+    monkeypatch.setattr(outbox, "_outbox", queue)
+    monkeypatch.setattr(outbox, "get_sheet_headers", lambda **kwargs: HEADERS)
+    monkeypatch.setattr(outbox, "get_sheet_rows", lambda row_nums, **kwargs: due_rows(row_nums))
+    queue.enqueue(TARGET.spreadsheet_id, TARGET.sheet_name, due_rows(range(2, 12)))
+    # ครั้งแรกคือการตรวจก่อน claim ครั้งที่สองคือ filter ของแถวแรก
+    sent_rows = offline_pipeline(monkeypatch, allowed_checks=1)
+
+    outbox.drain_outbox(TARGET, Logger(), workers=1, batch_size=10)
+
+    assert sent_rows == []
+    assert queue.counts(TARGET.spreadsheet_id, TARGET.sheet_name) == {'pending': 10}
+    assert deadline.get_deadline().stopped_rows == [(TARGET.name, 2)]
+    queue.close()
+
+def test_drain_counts_match_sends_when_deadline_trips_mid_batch(monkeypatch, tmp_path):
+    """ไม่ว่าจะหยุดที่ filter หรือ send stage จำนวน sent ใน outbox ต้องเท่ากับจำนวนที่ส่งจริง"""
+    queue = outbox.Outbox(str(tmp_path / "outbox.sqlite3"))
+    monkeypatch.setattr(outbox, "_outbox", queue)
+    monkeypatch.setattr(outbox, "get_sheet_headers", lambda **kwargs: HEADERS)
+    monkeypatch.setattr(outbox, "get_sheet_rows", lambda row_nums, **kwargs: due_rows(row_nums))
+    queue.enqueue(TARGET.spreadsheet_id, TARGET.sheet_name, due_rows(range(2, 12)))
+    sent_rows = offline_pipeline(monkeypatch, allowed_checks=3)
+
+    outbox.drain_outbox(TARGET, Logger(), workers=1, batch_size=10)
+
+    counts = queue.counts(TARGET.spreadsheet_id, TARGET.sheet_name)
+    assert counts.get('sent', 0) == len(sent_rows)
+    assert counts.get('pending', 0) == 10 - len(sent_rows)
+    queue.close()
+
+def test_drain_skips_rows_already_sent_on_sheet(monkeypatch, tmp_path):
+    """แถวที่ถูกส่งไปแล้วหลัง scan (ชีตเป็น Done) ต้องไม่ถูกส่งซ้ำจากข้อมูลใน outbox"""
+    queue = outbox.Outbox(str(tmp_path / "outbox.sqlite3"))
+    monkeypatch.setattr(outbox, "_outbox", queue)
+    monkeypatch.setattr(outbox, "get_sheet_headers", lambda **kwargs: HEADERS)
+
+    def sheet_rows(row_nums, **kwargs):
+        rows = due_rows(row_nums)
+        rows[0][1][5] = "Done"
+        return rows
+
+    monkeypatch.setattr(outbox, "get_sheet_rows", sheet_rows)
+    queue.enqueue(TARGET.spreadsheet_id, TARGET.sheet_name, due_rows(range(2, 5)))
+    sent_rows = offline_pipeline(monkeypatch, allowed_checks=1000)
+
+    outbox.drain_outbox(TARGET, Logger(), workers=1, batch_size=10)
+
+    assert sorted(sent_rows) == ["1000-003", "1000-004"]
+    assert queue.counts(TARGET.spreadsheet_id, TARGET.sheet_name).get('pending', 0) == 0
+    queue.close()
+
+def test_shard_reports_rows_after_filter_deadline(monkeypatch):
+    """shard ที่หยุดระหว่าง filter ต้องคืนแถวที่ยังไม่ได้ทำเป็น failed_rows และ resume_row"""
+    shard_rows = list(range(2, 12))
+    monkeypatch.setattr(sharding, "get_sheet_headers", lambda **kwargs: HEADERS)
+    monkeypatch.setattr(sharding, "get_sheet_rows", lambda row_nums, **kwargs: due_rows(row_nums))
+    sent_rows = offline_pipeline(monkeypatch, allowed_checks=0)
+    shard = {'index': 0, 'count': 1, 'target': TARGET.to_dict(), 'rows': shard_rows}
+
+    result = sharding.run_shard(shard, Logger())
+
+    assert result['success']
+    assert sent_rows == []
+    assert result['failed_rows'] == shard_rows
+    assert result['resume_row'] == 2
+
+def test_sabai_retry_stops_at_deadline(monkeypatch):
+    """timeout ของคำขอต้องไม่เกินเวลาที่เหลือ และไม่รอ Retry-After ที่เกินเส้นตาย"""
+    import notification
+
+    class Response:
+        status_code = 503
+        headers = {'Retry-After': '5'}
+
+    class Session:
+        def __init__(self):
+            self.timeouts = []
+
+        def post(self, url, json=None, headers=None, timeout=None):
+            self.timeouts.append(timeout)
+            return Response()
+
+    session = Session()
+    soon = deadline.Deadline()
+    monkeypatch.setattr(soon, "remaining", lambda: 2.0)
+    monkeypatch.setattr(deadline, "_deadline", soon)
+    monkeypatch.setattr(notification, "get_session", lambda name: session)
+    monkeypatch.setattr(notification, "response_size", lambda response: 0)
+
+    response = notification.post_with_retry({})
+
+    assert response.status_code == 503
+    assert len(session.timeouts) == 1
+    assert max(session.timeouts[0]) <= 2.0
+
+def test_shard_stops_within_coordinator_budget(monkeypatch):
+    """worker ต้องหยุดรับแถวใหม่ตามเวลาที่ coordinator เหลือ (time_budget_seconds) ไม่ใช่เวลาของตัวเอง"""
+    shard_rows = list(range(2, 7))
+    monkeypatch.setattr(sharding, "get_sheet_headers", lambda **kwargs: HEADERS)
+    monkeypatch.setattr(sharding, "get_sheet_rows", lambda row_nums, **kwargs: due_rows(row_nums))
+    sent_rows = offline_pipeline(monkeypatch, allowed_checks=1000)
+    monkeypatch.setattr(deadline, "_deadline", deadline.Deadline())
+    shard = {
+        'index': 0, 'count': 1, 'target': TARGET.to_dict(), 'rows': shard_rows,
+        'time_budget_seconds': sharding.DEADLINE_SAFETY_MARGIN_SECONDS - 1
+    }
+
+    result = sharding.run_shard(shard, Logger())
+
+    assert sent_rows == []
+    assert result['failed_rows'] == shard_rows
+    assert result['resume_row'] == 2
+
+def test_lambda_worker_invoke_does_not_retry(monkeypatch):
+    """invoke Lambda worker ต้องไม่ลองใหม่เอง และ read timeout ต้องไม่เกินเวลาที่ coordinator เหลือมากนัก"""
+    import io
+    import json
+    import boto3
+
+    clients = []
+
+    class Client:
+        def invoke(self, **kwargs):
+            return {'Payload': io.BytesIO(json.dumps({'body': json.dumps({'success': True})}).encode())}
+
+    def client(name, config=None):
+        clients.append(config)
+        return Client()
+
+    monkeypatch.setattr(boto3, "client", client)
+    shard = {'index': 0, 'count': 1, 'target': TARGET.to_dict(), 'rows': [2], 'time_budget_seconds': 120}
+
+    assert sharding._invoke_lambda_worker(shard) == {'success': True}
+    assert clients[0].retries == {'max_attempts': 0}
+    assert clients[0].read_timeout == 130
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# test_pipeline.py
+# ทดสอบ run_pipeline: การ drain งานจนหมด, backpressure ของ queue และการจัดการ error ของแต่ละ stage
+
+import threading
+import time
+import pytest
+from pipeline import run_pipeline
+
+def test_pipeline_drains_every_item():
+    """ทุกงานต้องผ่าน send และ write stage ครบก่อน run_pipeline return และ worker ต้องจบทั้งหมด"""
+    results = []
+
+    run_pipeline(
+        range(100), lambda item: item * 2, lambda item, result, error: results.append((item, result, error)),
+        concurrency=4, queue_size=3
+    )
+
+    assert sorted(results) == [(item, item * 2, None) for item in range(100)]
+    assert not [thread for thread in threading.enumerate() if thread.name.startswith("pipeline-")]
+
+def test_filter_stage_is_held_back_by_full_queues():
+    """เมื่อ send stage ค้าง filter stage ต้องอ่าน source ล่วงหน้าได้ไม่เกินขนาด queue"""
+    produced = []
+    release = threading.Event()
+
+    def source():
+        for item in range(50):
+            produced.append(item)
+            yield item
+
+    def send(item):
+        release.wait(timeout=10)
+        return item
+
+    runner = threading.Thread(
+        target=run_pipeline, args=(source(), send, lambda item, result, error: None),
+        kwargs={'concurrency': 1, 'queue_size': 2}, daemon=True
+    )
+    runner.start()
+    time.sleep(0.2)
+
+    # 1 งานที่ worker ถืออยู่ + 2 งานใน send queue + 1 งานที่ filter รอ put
+    assert len(produced) <= 4
+    release.set()
+    runner.join(timeout=10)
+    assert not runner.is_alive()
+    assert len(produced) == 50
+
+def test_send_errors_are_passed_to_write_stage():
+    """error ใน send_fn ไม่หยุด pipeline แต่ส่งต่อให้ handle_result ของงานนั้น"""
+    outcomes = {}
+
+    def send(item):
+        if item % 3 == 0:
+            raise ValueError(f"fail {item}")
+        return item
+
+    def handle(item, result, error):
+        outcomes[item] = str(error) if error else result
+
+    run_pipeline(range(10), send, handle, concurrency=2, queue_size=2)
+
+    assert outcomes == {item: f"fail {item}" if item % 3 == 0 else item for item in range(10)}
+
+def test_write_and_filter_errors_raise_after_drain():
+    """error ใน write stage หรือ filter stage ถูก raise หลังจาก pipeline drain เสร็จ ไม่ทิ้งงานที่ส่งไปแล้ว"""
+    handled = []
+
+    def handle(item, result, error):
+        handled.append(item)
+        if item == 5:
+            raise RuntimeError("write failed")
+
+    with pytest.raises(RuntimeError, match="write failed"):
+        run_pipeline(range(20), lambda item: item, handle, concurrency=3, queue_size=2)
+    assert sorted(handled) == list(range(20))
+
+    def broken_source():
+        yield 1
+        yield 2
+        raise KeyError("source failed")
+
+    sent = []
+    with pytest.raises(KeyError):
+        run_pipeline(broken_source(), sent.append, lambda item, result, error: None, concurrency=2, queue_size=2)
+    assert sorted(sent) == [1, 2]
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+# test_priority.py
+# ทดสอบการจัดลำดับการส่งตามอายุคำขอ (prioritize) แบบเรียงภายใน window
+
+from datetime import datetime
+from config import IS_GEN_PAYMENT_LINK, PAYMENT_LINK, IS_SEND_NOTI, TIMESTAMP
+from logger import Logger
+from priority import prioritize
+from row_schema import RowView, compile_schema
+
+SCHEMA = compile_schema([TIMESTAMP, IS_GEN_PAYMENT_LINK, PAYMENT_LINK, IS_SEND_NOTI])
+NOW = datetime(2025, 1, 2, 12, 0, 0)
+
+def test_prioritize_sorts_within_windows_without_draining_source():
+    """เรียงเก่าสุดก่อนภายในแต่ละ window และอ่านแถวล่วงหน้าไม่เกิน window_size"""
+    ages = {2: 1, 3: 20, 4: 8, 5: 30, 6: 1}
+    read_rows = []
+
+    def source():
+        for row_num, hours in ages.items():
+            read_rows.append(row_num)
+            submitted_at = datetime.fromtimestamp(NOW.timestamp() - hours * 3600)
+            yield RowView(row_num, [submitted_at.strftime("%Y-%m-%d %H:%M:%S"), "Done", "https://pay", ""])
+
+    ordered = prioritize(source(), SCHEMA, Logger(), NOW, tiers=[12, 6, 2], window_size=3)
+
+    first = next(ordered)
+    assert first.row_num == 3
+    assert read_rows == [2, 3, 4]
+    assert [first.row_num] + [row.row_num for row in ordered] == [3, 4, 2, 5, 6]
@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+# test_profiler.py
+# ทดสอบโหมด profile=cpu กับ pipeline ที่ทำงานหลาย thread
+
+import threading
+from pipeline import run_pipeline
+from profiler import InvocationProfiler
+
+def test_cpu_profile_covers_pipeline_threads():
+    """pipeline ต้องทำงานจบภายใต้ profiler และผลต้องมี frame ของ filter / send stage"""
+    results = []
+    profiler = InvocationProfiler("cpu", top_n=200)
+
+    def run():
+        profiler.start()
+        try:
+            run_pipeline(
+                range(200), lambda item: item * 2, lambda item, result, error: results.append(result),
+                concurrency=2, queue_size=5, on_idle=lambda: None, idle_seconds=0.05
+            )
+        finally:
+            profiler.stop()
+
+    runner = threading.Thread(target=run, daemon=True)
+    runner.start()
+    runner.join(timeout=20)
+
+    assert not runner.is_alive(), "run_pipeline ค้างภายใต้ profiler"
+    assert sorted(results) == [item * 2 for item in range(200)]
+    functions = [row['function'] for row in profiler.report()['top']]
+    assert any('filter_stage' in function for function in functions)
+    assert any('send_stage' in function for function in functions)
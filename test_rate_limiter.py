@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# test_rate_limiter.py
+# ทดสอบ TokenBucket: burst, อัตราการเติม token และการใช้ร่วมกันหลาย thread
+
+import threading
+import time
+import rate_limiter
+from rate_limiter import TokenBucket
+
+class FakeClock:
+    """เวลาจำลอง: sleep เลื่อนเวลาไปข้างหน้าทันที"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+def test_burst_then_paced_at_rate(monkeypatch):
+    """ใช้ token ได้ทันทีเท่ากับ burst หลังจากนั้นต้องรอตามอัตราการเติม"""
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(rate_limiter.time, "sleep", clock.sleep)
+    bucket = TokenBucket(rate=2, burst=3)
+
+    acquired_at = []
+    for _ in range(7):
+        bucket.acquire()
+        acquired_at.append(clock.now)
+
+    assert acquired_at[:3] == [0.0, 0.0, 0.0]
+    assert acquired_at[3:] == [0.5, 1.0, 1.5, 2.0]
+
+def test_idle_time_refills_up_to_capacity(monkeypatch):
+    """token ที่สะสมระหว่างว่างต้องไม่เกิน burst"""
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(rate_limiter.time, "sleep", clock.sleep)
+    bucket = TokenBucket(rate=1, burst=2)
+    bucket.acquire()
+    bucket.acquire()
+
+    clock.now += 60
+    for _ in range(3):
+        bucket.acquire()
+
+    assert clock.sleeps == [1.0]
+
+def test_unlimited_rate_never_waits(monkeypatch):
+    """rate <= 0 คือไม่จำกัดอัตรา"""
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter.time, "sleep", clock.sleep)
+    bucket = TokenBucket(rate=0)
+
+    for _ in range(100):
+        bucket.acquire()
+
+    assert clock.sleeps == []
+
+def test_shared_bucket_limits_all_threads_together():
+    """หลาย thread ที่ใช้ bucket เดียวกันต้องถูกจำกัดอัตรารวม ไม่ใช่อัตราต่อ thread"""
+    bucket = TokenBucket(rate=50, burst=2)
+    started_at = time.monotonic()
+
+    threads = [threading.Thread(target=lambda: [bucket.acquire() for _ in range(3)]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+
+    # 12 token: 2 จาก burst และอีก 10 ที่ต้องรอเติมทีละ 0.02 วินาที
+    assert time.monotonic() - started_at >= 10 / 50 * 0.9
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# test_resilience.py
+# ทดสอบนโยบายลองใหม่ของการส่ง SABAI API และ circuit breaker โดยจำลอง response ไม่ต้องต่อเครือข่าย
+
+import deadline
+import notification
+import resilience
+from resilience import CircuitBreaker
+
+class Response:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.headers = {}
+
+class Session:
+    """คืน status ตามลำดับใน statuses และนับจำนวนคำขอที่ส่ง"""
+
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+        self.posts = 0
+
+    def post(self, url, json=None, headers=None, timeout=None):
+        self.posts += 1
+        return Response(self.statuses.pop(0))
+
+def offline_sabai(monkeypatch, statuses):
+    session = Session(statuses)
+    monkeypatch.setattr(deadline, "_deadline", deadline.Deadline())
+    monkeypatch.setattr(notification, "get_session", lambda name: session)
+    monkeypatch.setattr(notification, "response_size", lambda response: 0)
+    monkeypatch.setattr(notification.time, "sleep", lambda seconds: None)
+    return session
+
+def test_sabai_does_not_retry_after_possible_send(monkeypatch):
+    """500/504 อาจเกิดหลัง SABAI ส่งโนติฯ ไปแล้ว จึงต้องไม่ยิงซ้ำ"""
+    for status in (500, 504):
+        session = offline_sabai(monkeypatch, [status, 200])
+
+        assert notification.post_with_retry({}).status_code == status
+        assert session.posts == 1
+
+def test_sabai_retries_when_request_was_not_processed(monkeypatch):
+    """429/502/503 ยืนยันได้ว่ายังไม่ได้ประมวลผล จึงลองใหม่จนสำเร็จ"""
+    session = offline_sabai(monkeypatch, [429, 502, 200])
+    monkeypatch.setattr(notification, "SABAI_MAX_ATTEMPTS", 3)
+
+    assert notification.post_with_retry({}).status_code == 200
+    assert session.posts == 3
+
+def fake_clock(monkeypatch, start=100.0):
+    now = [start]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: now[0])
+    return now
+
+def test_breaker_opens_after_consecutive_failures(monkeypatch):
+    """ล้มเหลวติดกันครบ threshold จึงเปิด และความสำเร็จระหว่างทางรีเซ็ตตัวนับ"""
+    fake_clock(monkeypatch)
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == 'closed' and breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert not breaker.allow()
+
+def test_breaker_half_open_allows_one_trial(monkeypatch):
+    """หลังครบ reset_timeout ยอมให้ส่งทดลองได้ทีละคำขอ ผลของคำขอนั้นตัดสินว่าปิดหรือเปิดต่อ"""
+    now = fake_clock(monkeypatch)
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+
+    now[0] += 29
+    assert not breaker.allow()
+    now[0] += 1
+    assert breaker.allow()
+    assert breaker.state == 'half_open'
+    assert not breaker.allow()
+
+    # คำขอทดลองล้มเหลว: เปิดใหม่และเริ่มนับ reset_timeout ใหม่
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    now[0] += 29
+    assert not breaker.allow()
+    now[0] += 1
+    assert breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == 'closed'
+    assert breaker.allow() and breaker.allow()
+
+def test_send_notification_skips_request_while_breaker_open(monkeypatch):
+    """เมื่อ breaker เปิด send_notification ต้องไม่ยิง SABAI และคืน circuit_open"""
+    session = offline_sabai(monkeypatch, [])
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    breaker.record_failure()
+    monkeypatch.setattr(notification, "sabai_breaker", breaker)
+
+    result = notification.send_notification(["1000-001", "0800000000", "", "Done", "https://pay/1", ""], {
+        'land_no': 0, 'phone': 1, 'email': 2, 'is_gen_payment_link': 3, 'payment_link': 4, 'is_send_noti': 5
+    })
+
+    assert result['success'] is False
+    assert result['circuit_open'] is True
+    assert session.posts == 0
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# test_sheet_writer.py
+# ทดสอบ SheetBatchWriter: การลองใหม่เมื่อ batchUpdate ล้มเหลวชั่วคราว และการเขียนทีละ range เมื่อบาง range มีปัญหา
+# จำลอง Sheets API ไม่ต้องต่อเครือข่าย
+
+import httplib2
+from googleapiclient.errors import HttpError
+import deadline
+import sheets_service
+from sheets_service import SheetBatchWriter
+
+def http_error(status):
+    return HttpError(httplib2.Response({'status': status}), b'{}')
+
+class FakeValues:
+    """
+    values() ของ Sheets API: batchUpdate ล้มเหลวด้วย status ใน batch_errors ตามลำดับ (None = สำเร็จ)
+    และ update ทีละ range ล้มเหลวเฉพาะ range ใน bad_ranges
+    """
+
+    def __init__(self, batch_errors, bad_ranges=()):
+        self.batch_errors = list(batch_errors)
+        self.bad_ranges = set(bad_ranges)
+        self.batch_calls = 0
+        self.single_ranges = []
+
+    def batchUpdate(self, spreadsheetId=None, body=None):
+        def execute():
+            self.batch_calls += 1
+            status = self.batch_errors.pop(0) if self.batch_errors else None
+            if status is not None:
+                raise http_error(status)
+            return {'responses': [{'updatedRange': entry['range']} for entry in body['data']]}
+        return execute
+
+    def update(self, spreadsheetId=None, range=None, valueInputOption=None, body=None):
+        def execute():
+            self.single_ranges.append(range)
+            if range in self.bad_ranges:
+                raise http_error(400)
+            return {'updatedRange': range}
+        return execute
+
+class FakeService:
+    def __init__(self, values):
+        self._values = values
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self._values
+
+def offline_writer(monkeypatch, values):
+    monkeypatch.setattr(deadline, "_deadline", deadline.Deadline())
+    monkeypatch.setattr(sheets_service, "get_sheet_service", lambda: FakeService(values))
+    monkeypatch.setattr(sheets_service, "_execute", lambda request, stage, body=None: request())
+    monkeypatch.setattr(sheets_service.time, "sleep", lambda seconds: None)
+    writer = SheetBatchWriter(max_rows=10, spreadsheet_id="test-spreadsheet", sheet_name="Sheet1")
+    for row_num in (2, 3, 4):
+        writer.add(row_num, {5: "Done"})
+    return writer
+
+def outcomes(results):
+    return {result['row']: result['success'] for result in results}
+
+def test_invalid_range_falls_back_to_single_writes(monkeypatch):
+    """batchUpdate ล้มเหลวด้วย error ที่ไม่ใช่ชั่วคราว ต้องเขียนทีละ range และแยกเฉพาะแถวที่มีปัญหา"""
+    values = FakeValues([400], bad_ranges={"Sheet1!F3"})
+    writer = offline_writer(monkeypatch, values)
+
+    results = writer.flush()
+
+    assert outcomes(results) == {2: True, 3: False, 4: True}
+    assert values.batch_calls == 1
+    assert values.single_ranges == ["Sheet1!F2", "Sheet1!F3", "Sheet1!F4"]
+    assert len(writer) == 0
+
+def test_throttled_batch_is_retried_as_a_whole(monkeypatch):
+    """429/5xx ลองทั้งก้อนใหม่ ไม่เขียนทีละ range"""
+    values = FakeValues([429, 503])
+    writer = offline_writer(monkeypatch, values)
+
+    results = writer.flush()
+
+    assert outcomes(results) == {2: True, 3: True, 4: True}
+    assert values.batch_calls == 3
+    assert values.single_ranges == []
+
+def test_persistent_throttling_fails_rows_without_single_writes(monkeypatch):
+    """ยังได้ 429 จนครบจำนวนครั้ง ทุกแถวล้มเหลว และไม่ใช้ quota เพิ่มด้วยการเขียนทีละ range"""
+    monkeypatch.setattr(sheets_service, "SHEET_WRITE_MAX_ATTEMPTS", 3)
+    values = FakeValues([429] * 10)
+    writer = offline_writer(monkeypatch, values)
+
+    results = writer.flush()
+
+    assert outcomes(results) == {2: False, 3: False, 4: False}
+    assert values.batch_calls == 3
+    assert values.single_ranges == []
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# test_sheets_paging.py
+# ทดสอบการอ่านชีตทีละหน้า (iter_sheet_rows) และ projected read โดยจำลองผลของ Sheets API ไม่ต้องต่อเครือข่าย
+
+import sheets_service
+
+def fake_sheet(monkeypatch, rows, row_count):
+    """
+    จำลองชีตที่มีข้อมูล rows (เริ่มที่แถว 2) และ grid ขนาด row_count แถว
+    หน้าที่อ่านจะถูกตัดแถวว่างท้ายช่วงออกเหมือน Sheets API
+
+    Returns:
+        list: ช่วงแถว (start, end) ที่ถูกอ่าน
+    """
+    reads = []
+
+    def get_page(start_row, end_row, last_column, spreadsheet_id, sheet_name):
+        reads.append((start_row, end_row))
+        page = [rows[row_num - 2] if row_num - 2 < len(rows) else [] for row_num in range(start_row, end_row + 1)]
+        while page and not page[-1]:
+            page.pop()
+        return page
+
+    monkeypatch.setattr(sheets_service, "_get_page", get_page)
+    monkeypatch.setattr(sheets_service, "get_sheet_row_count", lambda spreadsheet_id, sheet_name: row_count)
+    return reads
+
+def test_blank_row_at_page_boundary(monkeypatch):
+    """แถวว่างท้ายหน้า (แถว 6 เมื่อ page_size=5) ต้องไม่ทำให้หยุดอ่านแถว 7-11"""
+    rows = [[f"unit-{row_num}"] for row_num in range(2, 12)]
+    rows[6 - 2] = []
+    reads = fake_sheet(monkeypatch, rows, row_count=11)
+
+    for prefetch in (False, True):
+        reads.clear()
+        result = list(sheets_service.iter_sheet_rows(["Land No."], page_size=5, prefetch=prefetch))
+        read_rows = [row_num for row_num, row in result if row]
+        assert read_rows == [2, 3, 4, 5, 7, 8, 9, 10, 11]
+        assert sorted(reads) == [(2, 6), (7, 11)]
+
+def test_blank_page_inside_data(monkeypatch):
+    """ทั้งหน้าว่างคั่นกลางข้อมูลก็ยังอ่านต่อจนถึงแถวสุดท้ายของ grid"""
+    rows = [["a"], [], [], [], [], [], ["b"]]
+    fake_sheet(monkeypatch, rows, row_count=20)
+
+    result = list(sheets_service.iter_sheet_rows(["Land No."], page_size=3, prefetch=False))
+
+    assert [row_num for row_num, row in result if row] == [2, 8]
+
+def test_start_row_after_last_row(monkeypatch):
+    """start_row ที่เกินขนาด grid ไม่ต้องอ่านอะไร"""
+    reads = fake_sheet(monkeypatch, [["a"]], row_count=5)
+
+    assert list(sheets_service.iter_sheet_rows(["Land No."], start_row=6, page_size=3)) == []
+    assert reads == []
+
+def test_projected_due_rows_follow_column_schema(monkeypatch):
+    """projected read ต้องใช้เงื่อนไขและ mapping คอลัมน์เดียวกับ ColumnSchema (เช่น Target.columns)"""
+    columns = {'payment_link': "ลิงก์", 'is_gen_payment_link': "สร้างลิงก์", 'is_send_noti': "ส่งแล้ว"}
+    headers = ["ส่งแล้ว", "ลิงก์", "สร้างลิงก์"]
+    status = {
+        "ส่งแล้ว": ["", "Done", "", ""],
+        "ลิงก์": ["https://pay/2", "https://pay/3", "http://pay/4", "https://pay/5"],
+        "สร้างลิงก์": ["Done", "Done", "Done", ""],
+    }
+
+    def batch_get(ranges, major_dimension="ROWS", spreadsheet_id=None):
+        # ranges[0] คือแถวหัวข้อ ที่เหลือเป็นคอลัมน์สถานะแบบ "Sheet!B2:B"
+        letters = [sheets_service.column_letter(index) for index in range(len(headers))]
+        value_ranges = [{'values': [[header] for header in headers]}]
+        for a1 in ranges[1:]:
+            header = headers[letters.index(a1.split(":")[-1])]
+            value_ranges.append({'values': [status[header]]})
+        return value_ranges
+
+    monkeypatch.setattr(sheets_service, "get_sheet_headers", lambda **kwargs: headers)
+    monkeypatch.setattr(sheets_service, "_batch_get", batch_get)
+    monkeypatch.setattr(sheets_service, "get_sheet_rows", lambda row_nums, **kwargs: [(row_num, []) for row_num in row_nums])
+
+    _, rows, scan_hint = sheets_service.get_projected_sheet_data(columns=columns)
+
+    assert [row_num for row_num, _ in rows] == [2]
+    assert scan_hint == {'first_unfinished_row': 4, 'last_row': 5}